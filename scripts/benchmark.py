@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# Benchmark building chats end to end, over synthetic chats written as real
+# `message_N.json` folders (indented, newest message first, with non-ASCII
+# text mojibake-encoded as in Facebook's exports).
+#
+# For each chat size, the chat is generated, then measured in fresh processes
+# so that each phase's peak RSS is its own:
+#   - load: constructing a ChatFolderFeed and iterating its message json;
+#   - load_lazy: the same with a lazy ChatFolderFeed;
+#   - load_streaming: the same with a streaming ChatFileFeed per file;
+#   - build: constructing a ChatFolderFeed and calling demuxfb.build_chat;
+#   - build_lazy: the same with a lazy ChatFolderFeed;
+#   - iter: consuming demuxfb.iter_messages over a lazy ChatFolderFeed.
+# Results are printed and written as json, and can be compared against an
+# earlier run's to spot regressions in speed or memory, or changes in how
+# messages are classified.
+#
+# Run from the repository root, e.g.
+#   python scripts/benchmark.py --sizes 1000 100000 --output bench.json
+#   python scripts/benchmark.py --mix text=50,non_ascii=30,long=20
+#   python scripts/benchmark.py --compare bench.json
+#
+# Peak RSS is read with the `resource` module, so only Unix is supported.
+
+import argparse
+import collections
+import itertools
+import json
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+
+
+# Relative weights of the kinds of events a chat is made of. Calls and plans
+# are events of several messages (start, joins or responses, end).
+_default_mix = {'text': 70, 'long': 3, 'non_ascii': 10, 'media': 8,
+                'reaction': 4, 'call': 1, 'poll': 1, 'plan': 1,
+                'nickname': 1, 'settings': 1}
+
+_owner = 'Daniel Smith'
+_participants = [_owner, 'Henry Jones', 'Wendy Brown', 'Zoë Ångström',
+                 'Łukasz Wiśniewski']
+_words = ('hello there what time is the thing tonight I think we should go '
+          'maybe later okay sure sounds good see you soon lol no way').split()
+_non_ascii_texts = ['Café à côté? ça marche 👍', 'Дякую, до зустрічі!',
+                    'Schöne Grüße aus Köln ❤', '今晚见 😀', 'Χαίρετε φίλοι',
+                    'ok 😂😂😂']
+_emojis = ['❤', '😆', '😮', '😢', '👍']
+
+_messages_per_file = 10000
+_ms_per_message = 37000
+
+_load_phases = ['load', 'load_lazy', 'load_streaming']
+_build_phases = ['build', 'build_lazy', 'iter']
+_lazy_phases = {'load_lazy', 'build_lazy', 'iter'}
+
+
+class _ChatGenerator:
+    """Generate the message json of a chat, oldest message first."""
+
+    def __init__(self, mix, seed):
+        self._random = random.Random(seed)
+        self._kinds = list(mix)
+        self._weights = [mix[kind] for kind in self._kinds]
+        self._timestamp = 1500000000000
+
+    def _message(self, sender, content=None, **fields):
+        self._timestamp += self._random.randint(1, 2 * _ms_per_message)
+        message_json = {'sender_name': sender,
+                        'timestamp_ms': self._timestamp}
+        if content is not None:
+            message_json['content'] = content
+        message_json.update(fields)
+        message_json.setdefault('type', 'Generic')
+        return message_json
+
+    def _sender(self):
+        return self._random.choice(_participants)
+
+    def _sentence(self, word_count):
+        return ' '.join(self._random.choice(_words)
+                        for _ in range(word_count)).capitalize()
+
+    def _event(self, kind):
+        sender = self._sender()
+        other = self._random.choice([participant
+                                     for participant in _participants
+                                     if participant != sender])
+        # System messages name their actors by first name.
+        actor = sender.split()[0]
+        other_actor = other.split()[0]
+        if kind == 'text':
+            return [self._message(sender, self._sentence(
+                self._random.randint(1, 12)))]
+        if kind == 'long':
+            return [self._message(sender, '\n'.join(
+                self._sentence(self._random.randint(20, 60)) + '.'
+                for _ in range(self._random.randint(2, 8))))]
+        if kind == 'non_ascii':
+            return [self._message(sender,
+                                  self._random.choice(_non_ascii_texts))]
+        if kind == 'media':
+            n = self._timestamp
+            return [self._message(sender, photos=[
+                {'uri': 'messages/photos/{}_{}.jpg'.format(n, i),
+                 'creation_timestamp': n // 1000}
+                for i in range(self._random.randint(1, 3))])]
+        if kind == 'reaction':
+            return [self._message(sender, self._sentence(3), reactions=[
+                {'reaction': self._random.choice(_emojis), 'actor': other}])]
+        if kind == 'call':
+            return [self._message(sender, actor + ' started a call.',
+                                  type='Call', call_duration=0),
+                    self._message(other, other_actor + ' joined the call.',
+                                  type='Call', call_duration=0),
+                    self._message(sender, 'The call ended.', type='Call',
+                                  call_duration=self._random.randint(1, 9999))]
+        if kind == 'poll':
+            poll = self._sentence(2) + '?'
+            return [self._message(sender, actor + ' created a poll: ' + poll),
+                    self._message(other, other_actor + ' voted for "Here" in'
+                                  ' the poll: ' + poll)]
+        if kind == 'plan':
+            return [self._message(sender, actor + ' started a plan.',
+                                  type='Plan'),
+                    self._message(sender, actor + ' named the plan Dinner.',
+                                  type='Plan'),
+                    self._message(other, other_actor + ' responded ',
+                                  type='Plan'),
+                    self._message(sender, actor + ' deleted the plan Dinner'
+                                  ' for Fri, Aug 30 at 7 PM.', type='Plan')]
+        if kind == 'nickname':
+            return [self._message(sender, actor + ' set the nickname for '
+                                  + other + ' to ' + self._sentence(1) + '.')]
+        if kind == 'settings':
+            return [self._message(sender, actor + ' named the group '
+                                  + self._sentence(2) + '.')]
+        raise ValueError('Unknown kind of event: ' + kind)
+
+    def messages(self, count):
+        generated = 0
+        while generated < count:
+            kind = self._random.choices(self._kinds, self._weights)[0]
+            for message_json in self._event(kind)[:count - generated]:
+                generated += 1
+                yield message_json
+
+
+def _dump_mojibake(document):
+    """
+    Serialize json as Facebook does: with each UTF-8 byte of non-ASCII text
+    escaped as if it were a Latin-1 character.
+    """
+    text = json.dumps(document, ensure_ascii=False, indent=2)
+    mojibake = text.encode('utf-8').decode('latin1')
+    return re.sub('[\x80-\xff]', lambda match: '\\u{:04x}'.format(
+        ord(match.group())), mojibake)
+
+
+def generate_chat(folder, count, mix, seed=0):
+    """
+    Write a synthetic chat of `count` messages to `folder` as `message_N.json`
+    files, and return the number of bytes written.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    messages = _ChatGenerator(mix, seed).messages(count)
+    file_count = max(1, -(-count // _messages_per_file))
+    size = 0
+    # message_1.json holds the newest messages, and each file lists its
+    # messages newest first. Files are written oldest first, straight from the
+    # generator, so that only one is held in memory at a time.
+    for part in range(file_count):
+        chunk = list(itertools.islice(messages, _messages_per_file))
+        chunk.reverse()
+        document = {
+            'participants': [{'name': name} for name in _participants],
+            'messages': chunk,
+            'title': 'Benchmark',
+            'is_still_participant': True,
+            'thread_type': 'RegularGroup',
+            'thread_path': 'inbox/benchmark_abc123'}
+        file = folder / 'message_{}.json'.format(file_count - part)
+        file.write_text(_dump_mojibake(document), encoding='ascii')
+        size += file.stat().st_size
+    return size
+
+
+def _peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere.
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+def _streaming_message_jsons(folder):
+    """Iterate a chat folder's message json through streaming file feeds."""
+    # Oldest file (the highest numbered) first, as ChatFolderFeed reads them.
+    files = sorted(folder.glob('message_*.json'),
+                   key=lambda file: int(file.stem[len('message_'):]),
+                   reverse=True)
+    return itertools.chain.from_iterable(
+        demuxfb.ChatFileFeed(file, streaming=True).message_json_iter()
+        for file in files)
+
+
+def _measure(phase, folder):
+    """Measure one phase over a chat folder, in this process."""
+    start_time = time.perf_counter()
+    if phase == 'load_streaming':
+        feed = None
+    else:
+        feed = demuxfb.ChatFolderFeed(folder, lazy=phase in _lazy_phases)
+    feed_seconds = time.perf_counter() - start_time
+    result = {'feed_seconds': feed_seconds}
+
+    if phase in _load_phases:
+        start_time = time.perf_counter()
+        message_jsons = (_streaming_message_jsons(folder) if feed is None
+                         else feed.message_json_iter())
+        count = sum(1 for _ in message_jsons)
+        result['load_seconds'] = (feed_seconds + time.perf_counter()
+                                  - start_time)
+        result['messages'] = count
+    else:
+        start_time = time.perf_counter()
+        if phase == 'iter':
+            message_types = collections.Counter(
+                type(message).__name__
+                for message in demuxfb.iter_messages(feed, _owner))
+        else:
+            chat = demuxfb.build_chat(feed, _owner, progress_reporter=None)
+            message_types = collections.Counter(
+                type(message).__name__ for message in chat.messages)
+        result['build_seconds'] = time.perf_counter() - start_time
+        result['total_seconds'] = feed_seconds + result['build_seconds']
+        result['messages'] = sum(message_types.values())
+        result['message_types'] = dict(message_types)
+    result['peak_rss_mib'] = _peak_rss_mib()
+    return result
+
+
+def _measure_in_subprocess(phase, folder):
+    output = subprocess.run(
+        [sys.executable, __file__, '--measure', phase, str(folder)],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output)
+
+
+def _benchmark(folder, count, mix, repeat):
+    file_bytes = generate_chat(folder, count, mix)
+    phases = {}
+    for phase in _load_phases + _build_phases:
+        seconds_key = 'load_seconds' if phase in _load_phases \
+            else 'total_seconds'
+        phases[phase] = min((_measure_in_subprocess(phase, folder)
+                             for _ in range(repeat)),
+                            key=lambda result: result[seconds_key])
+    load = phases['load']
+    build = phases['build']
+    return {
+        'messages': count,
+        'files': len(list(folder.iterdir())),
+        'file_bytes': file_bytes,
+        'load_seconds': load['load_seconds'],
+        'load_peak_rss_mib': load['peak_rss_mib'],
+        'build_seconds': build['build_seconds'],
+        'total_seconds': build['total_seconds'],
+        'build_peak_rss_mib': build['peak_rss_mib'],
+        'us_per_message': build['total_seconds'] / count * 1e6,
+        'message_types': build['message_types'],
+        'phases': {
+            phase: {'seconds': result.get('load_seconds',
+                                          result.get('total_seconds')),
+                    'peak_rss_mib': result['peak_rss_mib'],
+                    'message_types': result.get('message_types')}
+            for phase, result in phases.items()}}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], check=True, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_mix(text):
+    mix = dict.fromkeys(_default_mix, 0)
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in mix:
+            raise argparse.ArgumentTypeError(
+                'unknown kind of event {!r}; expected one of {}'.format(
+                    kind, ', '.join(mix)))
+        mix[kind] = float(weight)
+    return mix
+
+
+def _print_result(result, baseline=None):
+    line = ('{messages:>9} messages  load {load_seconds:8.3f}s  '
+            'build {total_seconds:8.3f}s  {us_per_message:7.2f}us/message  '
+            'peak RSS {build_peak_rss_mib:7.1f}MiB').format(**result)
+    if baseline is not None:
+        line += '  ({:+.1%} us/message, {:+.1%} RSS)'.format(
+            result['us_per_message'] / baseline['us_per_message'] - 1,
+            result['build_peak_rss_mib'] / baseline['build_peak_rss_mib'] - 1)
+    print(line)
+    phases = result['phases']
+    print('  ' + '  '.join(
+        '{} {:.3f}s {:.1f}MiB'.format(phase, phases[phase]['seconds'],
+                                      phases[phase]['peak_rss_mib'])
+        for phase in _load_phases[1:] + _build_phases[1:]))
+    for phase in _build_phases[1:]:
+        if phases[phase]['message_types'] != result['message_types']:
+            print('  warning: messages were classified differently by '
+                  + phase)
+    if baseline is not None and \
+            result['message_types'] != baseline['message_types']:
+        print('  warning: messages were classified differently')
+    unrecognized = result['message_types'].get('UnrecognizedMessage')
+    if unrecognized:
+        print('  warning: {} messages were unrecognized'.format(unrecognized))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark demuxfb.build_chat over synthetic chats.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='numbers of messages of the chats to benchmark '
+                             '(default: 1000 10000 100000)')
+    parser.add_argument('--mix', type=_parse_mix, default=_default_mix,
+                        help='relative weights of kinds of events, as in '
+                             "'text=90,media=10' (default: {})".format(
+                                 ','.join('{}={}'.format(kind, weight)
+                                          for kind, weight
+                                          in _default_mix.items())))
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='times to measure each chat, keeping the '
+                             'fastest (default: 1)')
+    parser.add_argument('--output', type=Path,
+                        help='file to write the results to as json')
+    parser.add_argument('--compare', type=Path,
+                        help='results of an earlier run to compare against')
+    parser.add_argument('--data-dir', type=Path,
+                        help='folder to generate chats in and keep them '
+                             '(default: a temporary folder)')
+    parser.add_argument('--measure', nargs=2, metavar=('PHASE', 'FOLDER'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        phase, folder = args.measure
+        print(json.dumps(_measure(phase, Path(folder))))
+        return
+
+    baselines = {}
+    if args.compare is not None:
+        baseline_json = json.loads(args.compare.read_text())
+        baselines = {result['messages']: result
+                     for result in baseline_json['results']}
+
+    data_dir = args.data_dir or Path(tempfile.mkdtemp(prefix='demuxfb_'))
+    results = []
+    try:
+        for count in args.sizes:
+            folder = data_dir / 'chat_{}'.format(count)
+            if folder.exists():
+                shutil.rmtree(str(folder))
+            result = _benchmark(folder, count, args.mix, args.repeat)
+            _print_result(result, baselines.get(count))
+            results.append(result)
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(str(data_dir))
+
+    if args.output is not None:
+        args.output.write_text(json.dumps({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mix': args.mix,
+            'results': results}, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# Measure the memory a built Chat takes per message, over a synthetic chat of
+# mostly text messages, some with reactions or photos. The source JSON is
+# allocated before measurement starts, so only the objects demuxfb builds are
+# counted.
+#
+# Run from the repository root: `python scripts/benchmark_memory.py [COUNT]`.
+
+import sys
+import tracemalloc
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+
+
+class _ListChatFeed(demuxfb.ChatFeed):
+    def __init__(self, message_jsons):
+        self._message_jsons = message_jsons
+
+    def message_json_iter(self):
+        return iter(self._message_jsons)
+
+
+def _make_message_jsons(count):
+    senders = ['Daniel', 'Henry', 'Wendy']
+    message_jsons = []
+    for i in range(count):
+        message_json = {'sender_name': senders[i % len(senders)],
+                        'timestamp_ms': 1566296940000 + i * 1000,
+                        'content': str(i) + ': Hello',
+                        'type': 'Generic'}
+        if i % 10 == 0:
+            message_json['reactions'] = [{'reaction': '❤',
+                                          'actor': senders[(i + 1) % 3]}]
+        if i % 50 == 0:
+            message_json['photos'] = [{'uri': 'photos/' + str(i) + '.png',
+                                       'creation_timestamp': i}]
+        message_jsons.append(message_json)
+    return message_jsons
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    feed = _ListChatFeed(_make_message_jsons(count))
+
+    tracemalloc.start()
+    chat = demuxfb.build_chat(feed, 'Daniel', progress_reporter=None)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('messages:', len(chat.messages))
+    print('bytes per message:', round(size / len(chat.messages), 1))
+
+
+if __name__ == '__main__':
+    main()
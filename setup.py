@@ -26,4 +26,5 @@ setuptools.setup(
     ],
     keywords='facebook messages data',
     python_requires='>=3.8',
+    extras_require={'columns': ['numpy'], 'export': ['pyarrow']},
 )
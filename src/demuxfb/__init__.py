@@ -20,6 +20,16 @@ Functions
 ---------
 `build_chat`
     Builds a `Chat` from a Facebook archive -- performs the package's task.
+`iter_messages`
+    Builds a chat's messages one by one, without collecting them into a `Chat`.
+`find_chat_folders`
+    Finds the folders of all chats in an unzipped Facebook archive.
+`build_chats`
+    Builds the `Chat`s of many chat folders at once, in a pool of processes.
+`build_columns`
+    Builds a columnar, NumPy-backed view of a `Chat`'s messages.
+`export_parquet`, `export_arrow`
+    Write a `Chat`'s messages to a Parquet or Arrow file, one row per message.
 
 Modules
 -------
@@ -44,10 +54,18 @@ simple usage of the resultant `Chat` object.
     ...            if isinstance(message, demuxfb.message.TextMessage)]))
 
 """
-from ._chat import Chat, build_chat
-from ._chat_feed import InvalidChatFeedException, ChatFeed, ChatFileFeed, ChatFolderFeed
+from ._archive import find_chat_folders, build_chats
+from ._cache import ChatCache
+from ._chat import Chat, build_chat, iter_messages
+from ._columns import ChatColumns, build_columns
+from ._database import ChatDatabase
+from ._export import export_parquet, export_arrow
+from ._chat_feed import (InvalidChatFeedException, ChatFeed, ChatFileFeed,
+                         ChatFolderFeed, ChatZipFeed)
 from ._participant import Participant
-from ._progress_reporter import ProgressReporter, IntervalProgressReporter
+from ._profile import RuleProfile, RuleStats, SequenceStats
+from ._progress_reporter import (ProgressReporter, IntervalProgressReporter,
+                                 ThroughputProgressReporter)
 from ._reaction import Reaction
 
 __all__ = [n for n in globals() if n[0] != '_']
@@ -0,0 +1,115 @@
+"""
+Module for logic about building every chat of a whole 'Download Your
+Information' archive at once.
+"""
+
+__all__ = ['find_chat_folders', 'build_chats']
+
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import re
+
+from ._chat import Chat, build_chat
+from ._chat_feed import ChatFolderFeed
+
+
+def find_chat_folders(archive_folder: Path,
+                      categories: Sequence[str] = ('inbox', 'archived_threads')
+                      ) -> List[Path]:
+    """
+    Find the folders of all chats in an unzipped Facebook archive.
+
+    Parameters
+    ----------
+    archive_folder : pathlib.Path
+        Path to the root folder of the unzipped archive, as exported by the
+        'Download Your Information' Facebook feature. The archive's `messages/`
+        folder must be either directly in this folder, or in one of its
+        subfolders (as in newer archive layouts).
+    categories : Sequence[str], defaults to ('inbox', 'archived_threads')
+        Names of the subfolders of `messages/` to find chats in. Facebook also
+        exports, for example, 'filtered_threads' and 'message_requests'.
+
+    Returns
+    -------
+    List[pathlib.Path]
+        Paths to each chat folder found, suitable for `demuxfb.ChatFolderFeed`,
+        sorted by path.
+    """
+    messages_folders = [archive_folder / 'messages',
+                        *archive_folder.glob('*/messages')]
+
+    chat_folders = []
+    for messages_folder in messages_folders:
+        for category in categories:
+            category_folder = messages_folder / category
+            if not category_folder.is_dir():
+                continue
+            for folder in category_folder.iterdir():
+                if folder.is_dir() and any(
+                        re.match(r'message_(\d+)\.json$', file.name)
+                        for file in folder.iterdir()):
+                    chat_folders.append(folder)
+
+    return sorted(chat_folders)
+
+
+def _chat_folder_size(folder: Path) -> int:
+    return sum(file.stat().st_size for file in folder.glob('message_*.json'))
+
+
+def _build_folder_chat(folder: Path, owner_name: str) -> Chat:
+    return build_chat(ChatFolderFeed(folder, lazy=True), owner_name)
+
+
+def build_chats(chat_folders: Iterable[Path], owner_name: str,
+                processes: Optional[int] = None) -> Iterator[Tuple[Path, Chat]]:
+    """
+    Build a detailed chat object from each of many chat folders, in a pool of
+    worker processes.
+
+    Parameters
+    ----------
+    chat_folders : Iterable[pathlib.Path]
+        Paths to the chat folders to build, as for `demuxfb.ChatFolderFeed`.
+        Typically these are found with `demuxfb.find_chat_folders`.
+    owner_name : str
+        The Facebook account name of the person who downloaded the Facebook
+        archive, as for `demuxfb.build_chat`.
+    processes : int or None, defaults to None
+        Number of worker processes to build the chats with, or None for the
+        number of CPUs. If 1, the chats are built one by one in the calling
+        process instead. As with any use of `multiprocessing`, scripts doing
+        this on platforms that spawn processes (such as Windows) must be
+        guarded by `if __name__ == '__main__':`.
+
+    Returns
+    -------
+    Iterator[Tuple[pathlib.Path, demuxfb.Chat]]
+        An iterator over pairs of each chat folder and its built chat, in the
+        order the chats finish being built. The largest chats are started
+        first, so that a large chat is not left building alone at the end.
+
+    Raises
+    ------
+    InvalidChatFeedException
+        From the iterator, if a chat folder cannot be read.
+    """
+    chat_folders = sorted(chat_folders, key=_chat_folder_size, reverse=True)
+
+    if processes == 1:
+        for folder in chat_folders:
+            yield folder, _build_folder_chat(folder, owner_name)
+        return
+
+    with ProcessPoolExecutor(processes) as executor:
+        folders_by_future = {
+            executor.submit(_build_folder_chat, folder, owner_name): folder
+            for folder in chat_folders}
+        try:
+            for future in as_completed(folders_by_future):
+                yield folders_by_future[future], future.result()
+        finally:
+            for future in folders_by_future:
+                future.cancel()
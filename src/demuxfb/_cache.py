@@ -0,0 +1,182 @@
+"""Module for logic about caching built chats on disk between runs."""
+
+__all__ = ['ChatCache']
+
+from typing import Any, Optional
+from pathlib import Path
+import hashlib
+import io
+import os
+import pickle
+import zlib
+
+from ._chat import Chat, build_chat
+from ._chat_feed import ChatFeed
+from ._progress_reporter import ProgressReporter
+
+
+# Bump this if the format of cache files changes in a way that the sources
+# hashed in `_rules_fingerprint` do not capture.
+_cache_format_version = 1
+
+_rules_fingerprint_value: Optional[str] = None
+
+
+def _rules_fingerprint() -> str:
+    """
+    Fingerprint the source of every module of the package, as besides the
+    rules themselves, the feeds (which repair and order the json) and the
+    classes of the built objects all determine the outcome of building a chat.
+    """
+    global _rules_fingerprint_value
+    if _rules_fingerprint_value is None:
+        fingerprint = hashlib.blake2b(digest_size=20)
+        package_folder = Path(__file__).parent
+        for module in sorted(package_folder.glob('*.py')):
+            fingerprint.update(module.name.encode() + b'\0')
+            fingerprint.update(module.read_bytes())
+        _rules_fingerprint_value = fingerprint.hexdigest()
+    return _rules_fingerprint_value
+
+
+class _FeedPickler(pickle.Pickler):
+    """
+    Pickler that stores references to a chat's feed (held by messages built
+    with `message_json='reference'`) as a placeholder instead of the feed.
+    """
+    def __init__(self, file: io.BytesIO, feed: ChatFeed) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._feed = feed
+
+    def persistent_id(self, obj: Any) -> Optional[str]:
+        return 'feed' if obj is self._feed else None
+
+
+class _FeedUnpickler(pickle.Unpickler):
+    """Unpickler that points the placeholders of `_FeedPickler` to a feed."""
+    def __init__(self, file: io.BytesIO, feed: ChatFeed) -> None:
+        super().__init__(file)
+        self._feed = feed
+
+    def persistent_load(self, pid: Any) -> ChatFeed:
+        if pid != 'feed':
+            raise pickle.UnpicklingError('Unknown persistent id ' + repr(pid))
+        return self._feed
+
+
+class ChatCache:
+    """
+    A folder of built `Chat`s, keyed by the contents of the feeds they were
+    built from, so that unchanged chats need not be rebuilt on later runs.
+
+    Entries are invalidated automatically when the feed's source files change
+    (see `demuxfb.ChatFeed.source_fingerprint`), or when the rules of chat
+    construction change (between package versions, or through modification of
+    the source).
+
+    Warning: entries are stored with `pickle`, so only use a cache folder that
+    no one untrusted can write to.
+    """
+    _folder: Path
+    _compression_level: int
+
+    def __init__(self, folder: Path, compression_level: int = 1) -> None:
+        """
+        Create cache.
+
+        Parameters
+        ----------
+        folder : pathlib.Path
+            Folder to store the cache's entries in. It is created if it does
+            not exist.
+        compression_level : int, defaults to 1
+            zlib compression level (0-9) to store entries with.
+        """
+        self._folder = folder
+        self._compression_level = compression_level
+
+    def _entry_path(self, feed: ChatFeed, owner_name: str, message_json: str
+                    ) -> Optional[Path]:
+        feed_fingerprint = feed.source_fingerprint()
+        if feed_fingerprint is None:
+            return None
+
+        key = hashlib.blake2b(digest_size=20)
+        for part in [str(_cache_format_version), _rules_fingerprint(),
+                     feed_fingerprint, owner_name, message_json]:
+            key.update(part.encode() + b'\0')
+        return self._folder / (key.hexdigest() + '.chat')
+
+    @staticmethod
+    def _load_entry(entry_path: Path, feed: ChatFeed) -> Optional[Chat]:
+        try:
+            entry = entry_path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            return _FeedUnpickler(io.BytesIO(zlib.decompress(entry)),
+                                  feed).load()
+        except Exception:  # pylint: disable=broad-except
+            # A corrupt or outdated entry is simply rebuilt.
+            return None
+
+    def build_chat(self, feed: ChatFeed, owner_name: str,
+                   progress_reporter: Optional[ProgressReporter] = None,
+                   resume_from: Optional[Chat] = None,
+                   message_json: str = 'keep',
+                   profile: bool = False) -> Chat:
+        """
+        Load a chat from the cache if an entry for it is present, or otherwise
+        build it as with `demuxfb.build_chat` and store it in the cache.
+
+        Parameters are as for `demuxfb.build_chat`. For lazy feeds (such as
+        `demuxfb.ChatFolderFeed` with `lazy=True`), a cache hit skips reading
+        the feed's json altogether.
+
+        A chat built with `resume_from` shares its participants (and its
+        earlier messages) with `resume_from`, which a chat loaded from the cache
+        cannot, so when `resume_from` is given the cache is not consulted: the
+        chat is always built, and then stored for later calls without it.
+        Entries are kept separately for each `message_json` policy; with
+        'reference', messages loaded from the cache load their json from
+        `feed`. With `profile=True`, the chat is always built (so that there is
+        something to profile), and neither loaded from nor stored in the cache.
+
+        Returns
+        -------
+        demuxfb.Chat
+            A detailed object representing the chat read from the specified
+            feed.
+        """
+        entry_path = None if profile else self._entry_path(
+            feed, owner_name, message_json)
+        if entry_path is None:
+            return build_chat(feed, owner_name, progress_reporter, resume_from,
+                              message_json, profile)
+
+        if resume_from is None:
+            chat = self._load_entry(entry_path, feed)
+            if chat is not None:
+                return chat
+
+        chat = build_chat(feed, owner_name, progress_reporter, resume_from,
+                          message_json)
+
+        # Write to a temporary file first so that other processes never see a
+        # partially written entry.
+        self._folder.mkdir(parents=True, exist_ok=True)
+        temporary_path = entry_path.with_name('{}.{}.tmp'.format(
+            entry_path.name, os.getpid()))
+        pickled = io.BytesIO()
+        _FeedPickler(pickled, feed).dump(chat)
+        temporary_path.write_bytes(zlib.compress(pickled.getvalue(),
+                                                 self._compression_level))
+        os.replace(temporary_path, entry_path)
+
+        return chat
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        if self._folder.is_dir():
+            for entry_path in self._folder.glob('*.chat'):
+                entry_path.unlink()
@@ -1,20 +1,86 @@
 """Contains the top-level logic of Chat construction."""
 
-__all__ = ['Chat', 'build_chat']
+__all__ = ['Chat', 'build_chat', 'iter_messages']
 
-from typing import List, Set, Dict, Optional, Sequence, Type
-from inspect import currentframe
+from typing import (List, Set, Dict, Optional, Sequence, Type, Iterator,
+                    Union, Tuple, Hashable, Callable, overload)
+import array
+import bisect
+import copy
+import itertools
+import time
 
 
-from .message import Message
+from .message import Message, _MessageJsonReference
 from ._participant import Participant, _ParticipantManager
+from ._profile import RuleProfile
 from ._progress_reporter import ProgressReporter
 from ._chat_feed import ChatFeed
-from ._tokens import _TokenMatcher, _Token, _Captures
+from ._tokens import (_TokenMatcher, _Token, _Captures, _TokenSequence,
+                      _TokenSequenceGroup)
 from ._rules import _Ruleset, _all_rules
 from ._reaction import Reaction
 
 
+# Values of the `message_json` parameter of `build_chat`.
+_message_json_policies = ('keep', 'drop', 'reference')
+
+
+class _MessageView(Sequence[Message]):
+    """
+    A read-only sequence of some of a chat's messages, given by their
+    positions in `Chat.messages`, that does not copy them.
+    """
+    __slots__ = ('_messages', '_positions', '_start', '_stop')
+    _messages: List[Message]
+    _positions: Sequence[int]
+    _start: int
+    _stop: int
+
+    def __init__(self, messages: List[Message], positions: Sequence[int],
+                 start: int = 0, stop: Optional[int] = None) -> None:
+        self._messages = messages
+        self._positions = positions
+        self._start = start
+        self._stop = len(positions) if stop is None else stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    @overload
+    def __getitem__(self, index: int) -> Message:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> '_MessageView':
+        ...
+
+    def __getitem__(self, index: Union[int, slice]
+                    ) -> Union[Message, '_MessageView']:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return _MessageView(self._messages, [
+                    self._positions[self._start + i]
+                    for i in range(start, stop, step)])
+            return _MessageView(self._messages, self._positions,
+                                self._start + start,
+                                self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('message view index out of range')
+        return self._messages[self._positions[self._start + index]]
+
+    def __iter__(self) -> Iterator[Message]:
+        messages = self._messages
+        for i in range(self._start, self._stop):
+            yield messages[self._positions[i]]
+
+    def __repr__(self) -> str:
+        return '<messages view of length {}>'.format(len(self))
+
+
 class Chat:
     """
     A detailed object representing a Facebook conversation.
@@ -23,21 +89,40 @@ class Chat:
     ----------
     messages: List[demuxfb.message.Message]
         Messages in the conversation, ordered by the time they were sent
-        (earliest first).
+        (earliest first). Once `get_messages` has been called, this should not
+        be modified.
     participants: Set[demuxfb.Participant]
         Participants in the conversation.
+    rule_profile: demuxfb.RuleProfile or None
+        Statistics of the rules that classified the messages, if the chat was
+        built with `profile=True`.
     """
     messages: List[Message]
     participants: Set[Participant]
+    rule_profile: Optional[RuleProfile]
     _participant_dict: Dict[str, Participant]
     _unknown_participant: Optional[Participant]
+    _checkpoint: '_Checkpoint'
+    # Indexes for `get_messages`, built on first use: timestamps of all
+    # messages (and whether they are in order), and the positions of the
+    # messages of each type and sender.
+    _timestamp_index: Optional['array.array[int]']
+    _timestamps_sorted: bool
+    _type_index: Optional[Dict[Type[Message], 'array.array[int]']]
+    _sender_index: Optional[Dict[Participant, 'array.array[int]']]
+    _subtype_positions: Dict[Type[Message], Sequence[int]]
 
     def __init__(self) -> None:
         """
         This method should not be called publicly. Use `demxufb.build_chat`
         instead to create `Chat`s.
         """
-        pass
+        self.rule_profile = None
+        self._timestamp_index = None
+        self._timestamps_sorted = True
+        self._type_index = None
+        self._sender_index = None
+        self._subtype_positions = {}
 
     def _load_participants(self, participant_manager: _ParticipantManager
                            ) -> None:
@@ -104,6 +189,136 @@ class Chat:
         """
         return self._unknown_participant
 
+    def get_messages(self, message_type: Optional[Type[Message]] = None,
+                     sender: Optional[Participant] = None,
+                     start: Optional[int] = None,
+                     end: Optional[int] = None) -> Sequence[Message]:
+        """
+        Get the messages in the conversation that satisfy all of the given
+        conditions.
+
+        The indexes this uses are built the first time it is called, after
+        which queries take time in proportion to the number of messages of the
+        given type or sender in the time range, not to the size of the chat.
+        The result is a view of the indexes, without copying, except when both
+        `message_type` and `sender` are given: the positions of the messages
+        of the rarer of the two in the time range are then filtered by the
+        other into a new list.
+
+        Time ranges are found by bisecting the messages' timestamps, as
+        `messages` is in chronological order for chats built from Facebook
+        exports. Should the timestamps be out of order (as `messages` may be
+        after being modified), the indexes record this and time ranges are
+        instead checked message by message.
+
+        Parameters
+        ----------
+        message_type: Type[demuxfb.message.Message], optional
+            The type the messages must be instances of.
+        sender: demuxfb.Participant, optional
+            The participant who must have sent the messages.
+        start: int, optional
+            The timestamp (ms since the epoch) the messages must be sent at or
+            after.
+        end: int, optional
+            The timestamp (ms since the epoch) the messages must be sent before.
+
+        Returns
+        -------
+        Sequence[demuxfb.message.Message]
+            A read-only view of the messages, ordered as in `messages`.
+        """
+        if self._timestamp_index is None:
+            self._build_indexes()
+
+        first = 0
+        last = len(self.messages)
+        # Checks of whether a given message satisfies the conditions that
+        # cannot be answered from an index.
+        checks: List[Callable[[Message], bool]] = []
+        if start is None and end is None:
+            pass
+        elif self._timestamps_sorted:
+            if start is not None:
+                first = bisect.bisect_left(self._timestamp_index, start)
+            if end is not None:
+                last = bisect.bisect_left(self._timestamp_index, end)
+            if first >= last:
+                return _MessageView(self.messages, ())
+        else:
+            checks.append(lambda message: (
+                (start is None or message.timestamp >= start)
+                and (end is None or message.timestamp < end)))
+
+        # Each condition has the sorted positions of the messages satisfying
+        # it, and a check of whether a given message does.
+        conditions: List[Tuple[Sequence[int], Callable[[Message], bool]]] = []
+        if message_type is not None:
+            conditions.append((self._get_subtype_positions(message_type),
+                               lambda message: isinstance(message,
+                                                          message_type)))
+        if sender is not None:
+            conditions.append((self._sender_index.get(sender, ()),
+                               lambda message: message.sender is sender))
+        if not conditions:
+            positions: Sequence[int] = range(first, last)
+            lower, upper = 0, last - first
+        else:
+            # Scan the fewest positions in the time range that satisfy one
+            # condition, checking the other (if any) message by message.
+            bounded = [(positions, bisect.bisect_left(positions, first),
+                        bisect.bisect_left(positions, last))
+                       for positions, _ in conditions]
+            i = min(range(len(bounded)),
+                    key=lambda i: bounded[i][2] - bounded[i][1])
+            positions, lower, upper = bounded[i]
+            checks.extend(check for j, (_, check) in enumerate(conditions)
+                          if j != i)
+        if not checks:
+            return _MessageView(self.messages, positions, lower, upper)
+
+        return _MessageView(self.messages, [
+            positions[j] for j in range(lower, upper)
+            if all(check(self.messages[positions[j]]) for check in checks)])
+
+    def _build_indexes(self) -> None:
+        self._timestamp_index = array.array('q')
+        self._timestamps_sorted = True
+        self._type_index = {}
+        self._sender_index = {}
+        self._subtype_positions = {}
+        previous_timestamp = None
+        for position, message in enumerate(self.messages):
+            if previous_timestamp is not None and \
+                    message.timestamp < previous_timestamp:
+                self._timestamps_sorted = False
+            previous_timestamp = message.timestamp
+            self._timestamp_index.append(message.timestamp)
+            self._type_index.setdefault(
+                type(message), array.array('q')).append(position)
+            self._sender_index.setdefault(
+                message.sender, array.array('q')).append(position)
+
+    def _get_subtype_positions(self, message_type: Type[Message]
+                               ) -> Sequence[int]:
+        """
+        Get the sorted positions of the messages that are instances of
+        `message_type`.
+        """
+        positions = self._subtype_positions.get(message_type)
+        if positions is None:
+            position_arrays = [
+                type_positions for other_type, type_positions
+                in self._type_index.items()
+                if issubclass(other_type, message_type)]
+            if len(position_arrays) == 1:
+                positions = position_arrays[0]
+            else:
+                positions = array.array('q', sorted(
+                    itertools.chain.from_iterable(position_arrays)))
+            self._subtype_positions[message_type] = positions
+        return positions
+
 
 class _State:
     """
@@ -114,6 +329,44 @@ class _State:
     plan_is_active = False
 
 
+class _Checkpoint:
+    """
+    The state of a `_ChatFactory` once it has built a chat, from which it can
+    resume building from a newer feed of the same chat.
+    """
+    owner_name: str
+    state: _State
+    participant_manager: _ParticipantManager
+    # Timestamp of the last message built, and how many messages were built
+    # with that timestamp, so that messages sharing it in a newer feed can be
+    # told apart.
+    last_timestamp: Optional[int]
+    last_timestamp_count: int
+
+    def __init__(self, owner_name: str, state: _State,
+                 participant_manager: _ParticipantManager,
+                 last_timestamp: Optional[int], last_timestamp_count: int
+                 ) -> None:
+        self.owner_name = owner_name
+        self.state = state
+        self.participant_manager = participant_manager
+        self.last_timestamp = last_timestamp
+        self.last_timestamp_count = last_timestamp_count
+
+
+def _copy_participant_manager(participant_manager: _ParticipantManager
+                              ) -> _ParticipantManager:
+    """
+    Copy a participant manager, such that requests made of the copy do not
+    affect the original. `Participant` objects themselves are shared, so that
+    they stay equivalent across both.
+    """
+    # pylint: disable=protected-access
+    manager_copy = copy.copy(participant_manager)
+    manager_copy._participants = dict(participant_manager._participants)
+    return manager_copy
+
+
 class _ChatFactory:
     """
     Manages state throughout the creation of messages, and orchestrates the
@@ -128,12 +381,73 @@ class _ChatFactory:
     token_matcher: _TokenMatcher
     state: _State
 
-    def __init__(self, feed: ChatFeed, owner_name: str) -> None:
+    def __init__(self, feed: ChatFeed, owner_name: str,
+                 resume_from: Optional[Chat] = None,
+                 message_json: str = 'keep', profile: bool = False) -> None:
+        # _ChatFactory needs friendly access to Chat.
+        # pylint: disable=protected-access
+
+        if message_json not in _message_json_policies:
+            raise ValueError('Unknown message_json policy: ' + message_json)
+
         self._feed = feed
-        self.ruleset = _Ruleset(_all_rules)
-        self.participant_manager = _ParticipantManager(owner_name)
+        self._owner_name = owner_name
+        self._message_json_policy = message_json
+        self._message_json_reference = None
+        self.rule_profile = RuleProfile(_all_rules) if profile else None
+        self.ruleset = _Ruleset(_all_rules, self.rule_profile)
+        if profile:
+            self.match = self._profiled_match  # type: ignore
         self.token_matcher = _TokenMatcher()
-        self.state = _State()
+        self._sequence_group = _TokenSequenceGroup(())
+        self._group_match = None
+
+        if resume_from is None:
+            self._previous_messages = []
+            self.participant_manager = _ParticipantManager(owner_name)
+            self.state = _State()
+            self._last_timestamp = None
+            self._last_timestamp_count = 0
+            return
+
+        checkpoint = resume_from._checkpoint
+        if checkpoint.owner_name != owner_name:
+            raise ValueError('Cannot resume building a chat owned by '
+                             + checkpoint.owner_name + ' as ' + owner_name)
+
+        # Copy, so that resuming leaves `resume_from` able to be resumed from
+        # again.
+        self._previous_messages = resume_from.messages
+        self.participant_manager = _copy_participant_manager(
+            checkpoint.participant_manager)
+        self.state = copy.copy(checkpoint.state)
+        self._last_timestamp = checkpoint.last_timestamp
+        self._last_timestamp_count = checkpoint.last_timestamp_count
+
+    def _new_message_json_iter(self) -> Iterator[Tuple[dict, Hashable]]:
+        """
+        Iterate through the feed's json messages that come after those the
+        factory has resumed from (all of them, if it has not resumed), paired
+        with their references if the policy is to keep those (else `None`).
+        """
+        if self._message_json_policy == 'reference':
+            message_json_iter = iter(self._feed.message_json_reference_iter())
+        else:
+            message_json_iter = ((message_json, None) for message_json
+                                 in self._feed.message_json_iter())
+        if self._last_timestamp is None:
+            return message_json_iter
+
+        skip_count = self._last_timestamp_count
+        for message_json, reference in message_json_iter:
+            timestamp = message_json['timestamp_ms']
+            if timestamp > self._last_timestamp or (
+                    timestamp == self._last_timestamp and skip_count == 0):
+                return itertools.chain([(message_json, reference)],
+                                       message_json_iter)
+            if timestamp == self._last_timestamp:
+                skip_count -= 1
+        return iter([])
 
     # This function takes on what would otherwise be the role of a proper
     # Message.__init__ implementation. It is placed here rather than there so
@@ -151,14 +465,23 @@ class _ChatFactory:
         message.content = self.message_json.get('content')
         message.sender = self.participant_manager.request_participant(
             self.message_json['sender_name'])
-        message.message_json = self.message_json
-        message.reactions = []
-
+        if self._message_json_policy == 'keep':
+            message.message_json = self.message_json
+        elif self._message_json_policy == 'reference':
+            message.message_json = _MessageJsonReference(
+                self._feed, self._message_json_reference)
+        else:
+            message.message_json = None
+
+        # Most messages have no reactions; they all share the empty tuple.
+        reactions = []
         for reaction_json in self.message_json.get('reactions') or []:
-            reaction_sender = reaction_json['actor']
+            reaction_sender = self.participant_manager.request_participant(
+                reaction_json['actor'])
             reaction_emoji = reaction_json['reaction']
-            reaction = Reaction(reaction_sender, reaction_emoji)
-            message.reactions.append(reaction)
+            reaction = Reaction(reaction_emoji, reaction_sender)
+            reactions.append(reaction)
+        message.reactions = tuple(reactions)
 
         return message
 
@@ -169,30 +492,92 @@ class _ChatFactory:
         """
         return self.message_json['type'] == message_type
 
-    def match(self, against: Sequence[_Token]) -> bool:
+    def enter_rule(self, sequence_group: _TokenSequenceGroup) -> None:
+        """
+        Declare that a rule matching against (some of) the sequences in
+        `sequence_group` is about to be applied to the current `message_json`
+        member.
+        """
+        self._sequence_group = sequence_group
+        self._group_match = None
+
+    def match(self, against: Union[_TokenSequence, Sequence[_Token]]) -> bool:
         """
         Return true if the current `message_json` member's content matches the
         provided sequence of tokens. In addition, if the match is successful,
         the `captures` instance member is set to represent the captures from the
         match.
 
-        Note
-        ----
-        This method MUST NOT have calls with two semantically distinct values of
-        `against` made at the same line number. That is, globally to this
-        _ChatFactory instance, the line number of calls to this method must
-        uniquely identify `against`, regardless of source file.
+        If `against` belongs to the sequence group of the current rule (see
+        `_ChatFactory.enter_rule`), the whole group is matched in one go on the
+        first call, and the outcome reused for the rule's subsequent calls.
+        Sequences not given as a precompiled `_TokenSequence` are compiled on
+        every call.
         """
-        caller_line_num = currentframe().f_back.f_lineno
+        if not isinstance(against, _TokenSequence):
+            against = _TokenSequence(against)
+
+        position = self._sequence_group.positions.get(against)
+        if position is not None:
+            if self._group_match is None:
+                self._group_match = self.token_matcher.match_any(
+                    self._sequence_group, self.message_json['content'])
+            match_index, captures = self._group_match
+
+            # Sequences after the first to match are undecided by the group
+            # match.
+            if position < match_index:
+                return False
+            if position == match_index:
+                self.captures = captures
+                return True
+
         captures = self.token_matcher.match(against,
-                                            self.message_json['content'],
-                                            cache_id=caller_line_num)
+                                            self.message_json['content'])
         if captures is None:
             return False
 
         self.captures = captures
         return True
 
+    def _profiled_match(self, against: Union[_TokenSequence, Sequence[_Token]]
+                        ) -> bool:
+        # pylint: disable=protected-access
+        start_time = time.perf_counter()
+        is_match = _ChatFactory.match(self, against)
+        self.rule_profile._record_sequence(
+            against if isinstance(against, _TokenSequence) else None,
+            is_match, time.perf_counter() - start_time)
+        return is_match
+
+    def build_messages(self) -> Iterator[Message]:
+        """
+        Build the messages of the feed (after those the factory has resumed
+        from) one by one, oldest first.
+        """
+        for message_json, reference in self._new_message_json_iter():
+            self.message_json = message_json
+            self._message_json_reference = reference
+            message = self.ruleset.apply(self)
+
+            if message.timestamp == self._last_timestamp:
+                self._last_timestamp_count += 1
+            else:
+                self._last_timestamp = message.timestamp
+                self._last_timestamp_count = 1
+
+            yield message
+
+    def reported_messages(self, progress_reporter: Optional[ProgressReporter]
+                          ) -> Iterator[Message]:
+        """
+        Build the messages as `build_messages` does, reporting on them to
+        `progress_reporter`.
+        """
+        return _reported_messages(self.build_messages(), self._feed,
+                                  len(self._previous_messages),
+                                  progress_reporter)
+
     def build(self, progress_reporter: Optional[ProgressReporter]) -> Chat:
         """
         Create the `Chat` object from the factory, logging progress to
@@ -201,25 +586,19 @@ class _ChatFactory:
         # _ChatFactory needs friendly access to Chat.
         # pylint: disable=protected-access
 
-        if progress_reporter is not None:
-            progress_reporter.start()
-
         chat = Chat()
-        chat.messages = []
+        chat.messages = list(self._previous_messages)
         chat.participants = set()
-
-        for message_json in self._feed.message_json_iter():
-            self.message_json = message_json
-            message = self.ruleset.apply(self)
-            chat.messages.append(message)
-
-            if progress_reporter is not None:
-                progress_reporter.finish_message(message)
-
+        chat.messages.extend(self.reported_messages(progress_reporter))
+
+        # Checkpoint before loading participants, which has side-effects on the
+        # participant manager.
+        chat._checkpoint = _Checkpoint(
+            self._owner_name, copy.copy(self.state),
+            _copy_participant_manager(self.participant_manager),
+            self._last_timestamp, self._last_timestamp_count)
         chat._load_participants(self.participant_manager)
-
-        if progress_reporter is not None:
-            progress_reporter.finish()
+        chat.rule_profile = self.rule_profile
 
         return chat
 
@@ -227,7 +606,10 @@ class _ChatFactory:
 def build_chat(
         feed: ChatFeed,
         owner_name: str,
-        progress_reporter: Optional[ProgressReporter] = None) -> Chat:
+        progress_reporter: Optional[ProgressReporter] = None,
+        resume_from: Optional[Chat] = None,
+        message_json: str = 'keep',
+        profile: bool = False) -> Chat:
     """
     Build a detailed chat object from an archive.
 
@@ -243,6 +625,34 @@ def build_chat(
     progress_reporter: demuxfb.ProgressReporter, optional
         Used to report progress in the process of building the chat. If
         unspecified, no reporting will take place.
+    resume_from: demuxfb.Chat, optional
+        A chat previously built from an older feed of the same chat (such as
+        one from an earlier Facebook archive). If specified, building resumes
+        from where it left off: the messages of `feed` up to the last message
+        of `resume_from` (by timestamp) are skipped without being classified,
+        and the rest are appended to a copy of its messages, with the same
+        state and participants as if the whole feed had been built. The
+        messages of `feed` are still all read. `resume_from` is not modified.
+    message_json: str, defaults to 'keep'
+        What each message keeps of the json it was built from, as its
+        `message_json` attribute. One of:
+        - 'keep': the json itself, which keeps all of the json alive for as long
+          as the chat.
+        - 'drop': nothing; `message_json` is None.
+        - 'reference': a compact reference into `feed` (for feeds of files,
+          the message's file and index there), from which `message_json` is
+          loaded again on each access. `feed` must still be able to read its
+          source then. This only saves memory with feeds that do not hold on
+          to their json themselves, such as `demuxfb.ChatFolderFeed` with
+          `lazy=True`, a streaming `demuxfb.ChatFileFeed` or a
+          `demuxfb.ChatZipFeed`; eager feeds keep all of the json alive
+          regardless, as 'keep' does. Feeds that do not override
+          `demuxfb.ChatFeed.load_message_json` reread themselves up to the
+          message on each access.
+    profile: bool, defaults to False
+        If true, the attempts, hits and time of each message-matching rule
+        (and of each token sequence it matches against) are recorded, at some
+        cost to speed, as the chat's `rule_profile`.
 
     Returns
     -------
@@ -254,8 +664,83 @@ def build_chat(
     NoMatchingRuleException
         When no enabled message-matching rule in the ruleset matches a json
         element of the feed.
+    ValueError
+        If `resume_from` was built with a different `owner_name`, or
+        `message_json` is not one of the above.
     """
-    chat_factory = _ChatFactory(feed, owner_name)
+    chat_factory = _ChatFactory(feed, owner_name, resume_from, message_json,
+                                profile)
     chat = chat_factory.build(progress_reporter)
 
     return chat
+
+
+def iter_messages(
+        feed: ChatFeed,
+        owner_name: str,
+        progress_reporter: Optional[ProgressReporter] = None,
+        resume_from: Optional[Chat] = None,
+        message_json: str = 'keep') -> Iterator[Message]:
+    """
+    Build the messages of a chat one by one, as `build_chat` would, yielding
+    each as soon as it is classified instead of collecting them into a `Chat`.
+
+    Nothing is retained of messages once they are yielded, so with a lazy or
+    streaming feed (such as `demuxfb.ChatFolderFeed` with `lazy=True`), a
+    chat of any size can be aggregated, filtered or written to a sink (such as
+    `demuxfb.ChatDatabase` or `demuxfb.export_parquet`) in constant memory.
+    Participants are resolved as they are first met: two messages with the
+    same sender have the same `sender` object. Rules cannot be profiled here,
+    as there is no chat to hold the profile: profile with `build_chat` or
+    `demuxfb.ChatDatabase.build_chat` instead.
+
+    Parameters
+    ----------
+    feed: demuxfb.ChatFeed
+        As for `build_chat`.
+    owner_name: str
+        As for `build_chat`.
+    progress_reporter: demuxfb.ProgressReporter, optional
+        As for `build_chat`. Its `finish` is called once the last message has
+        been yielded.
+    resume_from: demuxfb.Chat, optional
+        As for `build_chat`, except that only the messages that come after
+        those of `resume_from` are yielded.
+    message_json: str, defaults to 'keep'
+        As for `build_chat`.
+
+    Returns
+    -------
+    Iterator[demuxfb.message.Message]
+        The messages of the chat, in the order of `Chat.messages`.
+
+    Raises
+    ------
+    NoMatchingRuleException
+        As for `build_chat`, when the offending message is reached.
+    ValueError
+        As for `build_chat`, when the iterator is created.
+    """
+    chat_factory = _ChatFactory(feed, owner_name, resume_from, message_json)
+    return chat_factory.reported_messages(progress_reporter)
+
+
+def _reported_messages(messages: Iterator[Message], feed: ChatFeed,
+                       resumed_count: int,
+                       progress_reporter: Optional[ProgressReporter]
+                       ) -> Iterator[Message]:
+    """
+    Pass through messages built from `feed` after `resumed_count` messages
+    resumed from, reporting on them to `progress_reporter`.
+    """
+    if progress_reporter is None:
+        yield from messages
+        return
+
+    progress_reporter.set_feed(feed)
+    progress_reporter.set_resumed_count(resumed_count)
+    progress_reporter.start()
+    for message in messages:
+        progress_reporter.finish_message(message)
+        yield message
+    progress_reporter.finish()
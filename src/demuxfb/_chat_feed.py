@@ -3,29 +3,182 @@ Module for logic about interpreting chat archives on disk (and an interface for
 elsewhere) as json feeds.
 """
 
-from typing import Iterator, List, Callable
+from typing import (Iterator, List, Optional, TextIO, Deque, Dict, Tuple,
+                    Union, Sequence, Hashable, Callable)
 from abc import ABC, abstractmethod
-from pathlib import Path
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from pathlib import Path, PurePath, PurePosixPath
 import re
 
+import array
+import collections
+import contextlib
+import hashlib
+import io
 import json
 import itertools
+import marshal
+import os
+import zipfile
 
 
-# Apply some 'func' transformation to all string keys and values of a json
-# object.
-def _json_recursive_apply(o: object, func: Callable[[str], str]) -> object:
-    if isinstance(o, dict):
-        for key in o:
-            o[func(key)] = _json_recursive_apply(o[key], func)
-        return o
-    elif isinstance(o, list):
-        for i in range(len(o)):
-            o[i] = _json_recursive_apply(o[i], func)
-        return o
-    elif isinstance(o, str):
-        return func(o)
-    return o
+# The file's contents are encoded with one UTF-8 code point per byte (which is a
+# strange format), like:
+#   {"place": "Ch\u00c3\u00a2teau d\u00e2\u0080\u0099If"}.
+# Passing this through the json loader would yield a garbled value
+#   'ChÃ¢teau dâ\x80\x99If'.
+# But by replacing each '\u00XX' escape with the raw byte it names before the
+# json loader sees it, we recover
+#   b'{"place": "Ch\xc3\xa2teau d\xe2\x80\x99If"}',
+# which is a raw form conducive to correct multi-bytes-per-char decoding,
+# yielding
+#   {'place': 'Château d’If'}
+# in a single pass over the raw bytes, rather than a walk over every key and
+# string of the decoded json tree.
+#
+# Python's 'raw_unicode_escape' codec does exactly this replacement at C speed
+# (while respecting escaped backslashes, so that a literal '\\u00e2' in the
+# content is left alone), but it also replaces escapes of characters outside
+# 0x80-0xFF, such as '\u0022', which would break the json. Files containing any
+# such escape take a slower path that replaces escapes one by one.
+_non_mojibake_escape = re.compile(rb'\\u(?!00[89a-fA-F][0-9a-fA-F])')
+_mojibake_escape = re.compile(rb'\\\\|\\u00[89a-fA-F][0-9a-fA-F]')
+_mojibake_replacements = {b'\\\\': b'\\\\'}
+_mojibake_replacements.update(
+    ('\\u00{:02x}'.format(byte).encode(), bytes([byte]))
+    for byte in range(0x80, 0x100))
+
+
+def _repair_mojibake(raw: bytes) -> bytes:
+    if _non_mojibake_escape.search(raw) is None:
+        return raw.decode('raw_unicode_escape').encode('latin1')
+
+    return _mojibake_escape.sub(
+        lambda match: _mojibake_replacements[match.group().lower()], raw)
+
+
+# Number of bytes read from disk at a time by streaming feeds.
+_stream_chunk_size = 64 * 1024
+
+
+class _IncrementalJsonReader:
+    """
+    Decodes json values one at a time from a text stream, holding only a small
+    window of the stream in memory rather than the whole file.
+    """
+    _decoder = json.JSONDecoder()
+    _whitespace = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, text_io: TextIO) -> None:
+        self._text_io = text_io
+        self._buffer = ''
+        self._pos = 0
+        self._offset = 0
+        self._eof = False
+
+    def position(self) -> int:
+        """Return the position in the stream of the next character."""
+        return self._offset + self._pos
+
+    def _read_more(self) -> bool:
+        if self._eof:
+            return False
+
+        # Discard what has already been consumed, and read at least as much as
+        # is still buffered so that retrying a long truncated value stays
+        # linear overall.
+        self._buffer = self._buffer[self._pos:]
+        self._offset += self._pos
+        self._pos = 0
+        chunk = self._text_io.read(max(_stream_chunk_size, len(self._buffer)))
+        if chunk == '':
+            self._eof = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, or '' at the end."""
+        while True:
+            self._pos = self._whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        """Consume and return the next character, which must be in `chars`."""
+        char = self.peek()
+        if char == '' or char not in chars:
+            raise ValueError('Expected one of {!r} but found {!r}'.format(
+                chars, char))
+        self._pos += 1
+        return char
+
+    def decode(self) -> object:
+        """Consume and return the next complete json value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number may have been cut short by the end of the buffer
+                # (e.g. '1.' of '1.5'), so it is only trusted once it is
+                # followed by something that cannot continue it.
+                if self._eof or (end < len(self._buffer) and (
+                        isinstance(value, (str, dict, list))
+                        or self._buffer[end] not in '0123456789.eE+-')):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read_more()
+
+
+def _iter_json_array_spans(text_io: TextIO, key: str
+                           ) -> Iterator[Tuple[int, int]]:
+    """
+    Incrementally decode a stream holding a json object, yielding the start
+    and end positions in the stream of the items of its `key` member (which
+    must be an array) one at a time. The items and the rest of the object are
+    still validated, but are discarded once decoded.
+    """
+    reader = _IncrementalJsonReader(text_io)
+    found_key = False
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            name = reader.decode()
+            if not isinstance(name, str):
+                raise ValueError('Expected an object key but found '
+                                 + repr(name))
+            reader.expect(':')
+            if name == key:
+                found_key = True
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.expect(']')
+                else:
+                    while True:
+                        reader.peek()
+                        start = reader.position()
+                        reader.decode()
+                        yield start, reader.position()
+                        if reader.expect(',]') == ']':
+                            break
+            else:
+                reader.decode()
+            if reader.expect(',}') == '}':
+                break
+
+    if reader.peek() != '':
+        raise ValueError('Extra data after json object')
+    if not found_key:
+        raise KeyError(key)
 
 
 class ChatFeed(ABC):
@@ -37,6 +190,7 @@ class ChatFeed(ABC):
     --------
     demuxfb.ChatFileFeed
     demuxfb.ChatFolderFeed
+    demuxfb.ChatZipFeed
     """
 
     @abstractmethod
@@ -52,16 +206,227 @@ class ChatFeed(ABC):
         """
         raise NotImplementedError
 
+    def message_json_reference_iter(self) -> Iterator[Tuple[dict, Hashable]]:
+        """
+        Return an iterator through all of the json messages in the chat, oldest
+        first, each paired with a compact reference from which
+        `load_message_json` can load the message again later.
+
+        By default, a reference is the message's position in the feed, which
+        `load_message_json` finds by iterating through the feed again. Feeds of
+        files instead reference a message by its file and its index there.
+
+        Returns
+        -------
+        Iterator[Tuple[dict, Hashable]]
+            An iterator over the json messages in the chat and their
+            references, oldest first.
+        """
+        return ((message_json, i) for i, message_json
+                in enumerate(self.message_json_iter()))
+
+    def load_message_json(self, reference: Hashable) -> dict:
+        """
+        Load a json message again from the reference paired with it by
+        `message_json_reference_iter`.
+
+        By default, this iterates through the feed again up to the message, so
+        each call costs time proportional to the message's position (and
+        loading every message of a chat, time quadratic in its length). Feeds
+        that can load a message directly should override this along with
+        `message_json_reference_iter`.
+
+        Parameters
+        ----------
+        reference : Hashable
+            The message's reference.
+
+        Returns
+        -------
+        dict
+            The json message.
+        """
+        return next(itertools.islice(self.message_json_iter(), reference, None))
+
+    def source_fingerprint(self) -> Optional[str]:
+        """
+        Return a string identifying the current contents of the feed's source,
+        which changes whenever the messages the feed would yield change. Used by
+        `demuxfb.ChatCache` to tell when a chat must be rebuilt.
+
+        Returns
+        -------
+        str or None
+            The fingerprint, or None if the source cannot be fingerprinted (the
+            default), in which case chats are never cached.
+        """
+        return None
+
+    def message_count(self) -> Optional[int]:
+        """
+        Return the number of json messages in the chat, if it is known without
+        reading any more of the feed's source. Used by progress reporters.
+
+        Returns
+        -------
+        int or None
+            The number of messages, or None if it is not known (the default).
+        """
+        return None
+
+    def source_size(self) -> Optional[int]:
+        """
+        Return the size of the feed's source in bytes, if it is known. Used by
+        progress reporters.
+
+        Returns
+        -------
+        int or None
+            The size, or None if it is not known (the default).
+        """
+        return None
+
+    def bytes_read(self) -> Optional[int]:
+        """
+        Return how many bytes of the feed's source the current iteration
+        through its messages has read, if this is tracked. Feeds of files count
+        each file as read once the iteration reaches it. Used by progress
+        reporters.
+
+        Returns
+        -------
+        int or None
+            The number of bytes, or None if it is not tracked (the default).
+        """
+        return None
+
 
 class InvalidChatFeedException(Exception):
     """Error for when `ChatFeed` construction fails."""
     pass
 
 
+def _fingerprint_files(files: Sequence[Path]) -> str:
+    """Fingerprint the names, sizes, modification times and contents."""
+    fingerprint = hashlib.blake2b(digest_size=20)
+    for file in files:
+        stat = file.stat()
+        fingerprint.update('{}\0{}\0{}\0'.format(
+            file.name, stat.st_size, stat.st_mtime_ns).encode())
+        with file.open('rb') as file_io:
+            for chunk in iter(lambda: file_io.read(1 << 20), b''):
+                fingerprint.update(chunk)
+    return fingerprint.hexdigest()
+
+
+def _decode_message_window(file: Path, window: bytes) -> List[dict]:
+    """
+    Decode the consecutive message json items (and the commas between them)
+    held in `window`, read from `file`.
+    """
+    try:
+        return json.loads(_repair_mojibake(b'[' + window + b']'))
+    except Exception as e:
+        raise InvalidChatFeedException(
+            'Could not read json stream from file: ' + file.name) from e
+
+
+def _read_repaired_file(file: Path) -> bytes:
+    """Read a json file's bytes, with its mojibake repaired."""
+    try:
+        return _repair_mojibake(file.read_bytes())
+    except Exception as e:
+        raise InvalidChatFeedException(
+            'Could not read json stream from file: ' + file.name) from e
+
+
+def _decode_repaired_file(file: PurePath, repaired_bytes: bytes) -> dict:
+    """Decode the json of `_read_repaired_file(file)`."""
+    try:
+        return json.loads(repaired_bytes)
+    except Exception as e:
+        raise InvalidChatFeedException(
+            'Could not read json stream from file: ' + file.name) from e
+
+
+def _read_marshalled_file(file: Path) -> bytes:
+    """
+    Read, repair and decode a json file, for a worker process to send the json
+    back marshalled: `marshal.loads` rebuilds the json tree in about half the
+    time `json.loads` takes to decode it, and far faster than unpickling it.
+    """
+    return marshal.dumps(_decode_repaired_file(file, _read_repaired_file(file)))
+
+
+def _pop_message_jsons(message_jsons: List[dict]) -> Iterator[dict]:
+    """
+    Yield a Facebook json file's messages oldest (last) first, removing each
+    from the list as it goes so that it can be garbage collected once consumed.
+    """
+    while message_jsons:
+        yield message_jsons.pop()
+
+
+def _reference_parts(part_message_json_iters: Iterator[Iterator[dict]]
+                     ) -> Iterator[Tuple[dict, Tuple[int, int]]]:
+    """
+    Pair the messages of a feed's parts (files), oldest first, with references
+    of the form `(part, index)`, where `index` counts from the oldest message
+    of the part.
+    """
+    for part, message_json_iter in enumerate(part_message_json_iters):
+        for index, message_json in enumerate(message_json_iter):
+            yield message_json, (part, index)
+
+
+def _counted_parts(feed: Union['ChatFolderFeed', 'ChatZipFeed'],
+                   sizes: Iterator[int],
+                   part_message_json_iters: Iterator[Iterator[dict]]
+                   ) -> Iterator[Iterator[dict]]:
+    """
+    Pass through the iterators of a feed's parts (files), adding the size of
+    each part to the feed's `_bytes_read` once it has been read.
+    """
+    feed._bytes_read = 0
+    # Parts come first, so that their iterator is run to completion.
+    for message_json_iter, size in zip(part_message_json_iters, sizes):
+        feed._bytes_read += size
+        yield message_json_iter
+
+
+class _PartCache:
+    """Holds the messages of the part (file) most recently loaded by a feed."""
+
+    _part: Optional[int]
+    _message_jsons: Optional[List[dict]]
+
+    def __init__(self) -> None:
+        self._part = None
+        self._message_jsons = None
+
+    def load_message_json(self, part: int, index: int,
+                          load_part: Callable[[int], List[dict]]) -> dict:
+        """
+        Return the message at `index` (counting from the oldest) of the part
+        `part`, calling `load_part(part)` for the part's messages, newest
+        first, if they are not held already.
+        """
+        if self._part != part:
+            self._message_jsons = None
+            self._message_jsons = load_part(part)
+            self._part = part
+        return self._message_jsons[-1 - index]
+
+
 class ChatFileFeed(ChatFeed):
     """Adapter to extract a chat's json data from a single json file."""
 
-    def __init__(self, file: Path) -> None:
+    _file: Path
+    _streaming: bool
+    _part_cache: _PartCache
+    _bytes_read: int
+
+    def __init__(self, file: Path, streaming: bool = False) -> None:
         """
         Build feed from a json file.
 
@@ -71,40 +436,123 @@ class ChatFileFeed(ChatFeed):
             Path to a json file representing the chat, as exported by the
             'Download Your Information' Facebook feature. The file must be
             unzipped.
+        streaming : bool, defaults to False
+            If true, the file is not read during construction. It is instead
+            parsed incrementally each time `message_json_iter` is called,
+            without ever holding the whole file's text or json tree in memory,
+            and each message is released as soon as it has been yielded.
+            Facebook writes messages newest first, so each iteration makes two
+            passes over the file: the first finds where each message lies, and
+            the second decodes the messages oldest first, reading the file
+            backwards in windows of about 64 KiB. Only the positions of the
+            messages and one window are held in memory, rather than the
+            decoded messages of the whole file.
 
         Raises
         ------
         InvalidChatFeedException
             If the file cannot be opened for reading, or cannot be parsed as
-            json.
+            json. When `streaming`, parsing errors are instead raised from the
+            iterator returned by `message_json_iter`.
         """
+        self._file = file
+        self._streaming = streaming
+        self._part_cache = _PartCache()
+        self._bytes_read = 0
 
-        try:
-            with file.open('r') as file_io:
-                file_str = file_io.read()
-                self._json = json.loads(file_str)
-
-                # The file's contents are encoded with one UTF-8 code point per
-                # character (which is a strange format), like:
-                #   {"place": "Ch\u00c3\u00a2teau d\u00e2\u0080\u0099If"}.
-                # Passing this through the json loader yields a garbled value
-                #   'ChÃ¢teau dâ\x80\x99If'.
-                # But by encoding this in latin1 (1-byte per character), we can
-                # recover
-                #   b'Ch\xc3\xa2teau d\xe2\x80\x99If',
-                # which is a raw form conducive to correct multi-bytes-per-char
-                # decoding, yielding
-                #  'Château d’If'
-                _json_recursive_apply(self._json,
-                                      lambda s: s.encode('latin1').decode())
+        if streaming:
+            if not file.is_file():
+                raise InvalidChatFeedException(
+                    'Could not read json stream from file: ' + file.name)
+            return
 
-        except Exception as e:
-            raise InvalidChatFeedException(
-                'Could not read json stream from file: ' + file.name) from e
+        self._json = _decode_repaired_file(file, _read_repaired_file(file))
+
+    @classmethod
+    def _from_json(cls, file: Path, json_: dict) -> 'ChatFileFeed':
+        """Build a non-streaming feed from the decoded json of `file`."""
+        file_feed = cls.__new__(cls)
+        file_feed._file = file
+        file_feed._streaming = False
+        file_feed._part_cache = _PartCache()
+        file_feed._bytes_read = 0
+        file_feed._json = json_
+        return file_feed
 
     def message_json_iter(self) -> Iterator[dict]:
+        if self._streaming:
+            self._bytes_read = 0
+            return self._streamed_message_json_iter()
+        # The file was read whole on construction.
+        self._bytes_read = self._file.stat().st_size
         return reversed(self._json['messages'])
 
+    def _streamed_message_json_iter(self) -> Iterator[dict]:
+        starts = array.array('q')
+        ends = array.array('q')
+        try:
+            file_io = self._file.open('rb')
+        except Exception as e:
+            raise InvalidChatFeedException(
+                'Could not read json stream from file: ' + self._file.name
+            ) from e
+
+        with file_io:
+            # The mojibake repair only rewrites escapes inside strings, so the
+            # json's structure can be scanned in the raw bytes. Decoding them
+            # as Latin-1 keeps positions in the text equal to offsets in the
+            # file.
+            text_io = io.TextIOWrapper(file_io, encoding='latin1', newline='')
+            try:
+                for start, end in _iter_json_array_spans(text_io, 'messages'):
+                    starts.append(start)
+                    ends.append(end)
+            except Exception as e:
+                raise InvalidChatFeedException(
+                    'Could not read json stream from file: '
+                    + self._file.name) from e
+            text_io.detach()
+            self._bytes_read = file_io.tell()
+
+            # Read the messages back from the oldest (last), a window of
+            # consecutive messages at a time.
+            last = len(starts)
+            while last > 0:
+                end = ends[last - 1]
+                first = last - 1
+                while first > 0 and \
+                        end - starts[first - 1] <= _stream_chunk_size:
+                    first -= 1
+                file_io.seek(starts[first])
+                window = file_io.read(end - starts[first])
+                yield from _pop_message_jsons(
+                    _decode_message_window(self._file, window))
+                last = first
+
+    def message_count(self) -> Optional[int]:
+        if self._streaming:
+            return None
+        return len(self._json['messages'])
+
+    def source_size(self) -> Optional[int]:
+        return self._file.stat().st_size
+
+    def bytes_read(self) -> Optional[int]:
+        return self._bytes_read
+
+    def load_message_json(self, reference: int) -> dict:
+        # References are positions in the file's messages, oldest first.
+        if not self._streaming:
+            return self._json['messages'][-1 - reference]
+
+        def load_part(_: int) -> List[dict]:
+            return _decode_repaired_file(
+                self._file, _read_repaired_file(self._file))['messages']
+        return self._part_cache.load_message_json(0, reference, load_part)
+
+    def source_fingerprint(self) -> Optional[str]:
+        return _fingerprint_files([self._file])
+
 
 class ChatFolderFeed(ChatFeed):
     """
@@ -112,9 +560,15 @@ class ChatFolderFeed(ChatFeed):
     `message_2.json`, ... files.
     """
 
-    _file_feeds: List[ChatFileFeed]
+    _files: List[Path]
+    _file_feeds: Optional[List[ChatFileFeed]]
+    _processes: Optional[int]
+    _read_ahead: bool
+    _part_cache: _PartCache
+    _bytes_read: int
 
-    def __init__(self, folder: Path) -> None:
+    def __init__(self, folder: Path, processes: Optional[int] = 1,
+                 lazy: bool = False, read_ahead: bool = False) -> None:
         """
         Build feed from a folder of json files.
 
@@ -125,14 +579,42 @@ class ChatFolderFeed(ChatFeed):
             by the 'Download Your Information' Facebook feature. The folder must
             be unzipped, and contain some number of files exactly of the names
             `message_1.json`, `message_2.json`, ...
+        processes : int or None, defaults to 1
+            Number of processes to load the json files with. If greater than 1,
+            or None (meaning the number of CPUs), the files are read, repaired
+            and decoded concurrently in a pool of worker processes. The json
+            of each file is sent back to the calling process in marshalled
+            form, which it still has to rebuild into Python objects one file
+            at a time; as that takes about half as long as decoding the json,
+            loading is at most about 2-3 times as fast however many CPUs there
+            are. As with any use of `multiprocessing`, scripts doing this on
+            platforms that spawn processes (such as Windows) must be guarded by
+            `if __name__ == '__main__':`.
+        lazy : bool, defaults to False
+            If true, only the names of the json files are read during
+            construction. Each file is instead loaded when `message_json_iter`
+            reaches it, and released once its messages have been yielded, so
+            that at most one or two files are held in memory at a time. With
+            `processes`, the worker processes load that many of the following
+            files ahead of time.
+        read_ahead : bool, defaults to False
+            If true and `lazy`, the file following the one being yielded from is
+            loaded ahead of time on a background thread.
 
         Raises
         ------
         InvalidChatFeedException
             - If `folder` is not a directory, is empty, does not contain solely
             'message_<NUM>.json' files; or if any subfile cannot be opened for
-            reading or cannot be parsed as json.
+            reading or cannot be parsed as json. When `lazy`, errors in opening
+            or parsing subfiles are instead raised from the iterator returned by
+            `message_json_iter`.
+        ValueError
+            If `processes` is less than 1.
         """
+        if processes is not None and processes < 1:
+            raise ValueError('processes must be at least 1 (or None for the '
+                             'number of CPUs), not ' + str(processes))
         if not folder.is_dir():
             raise InvalidChatFeedException('Could not create folder feed; not'
                                            ' a folder: ' + str(folder.name))
@@ -153,12 +635,274 @@ class ChatFolderFeed(ChatFeed):
         def part_number(file: Path) -> int:
             return int(re.match(r'message_(\d+)\.json$', file.name)[1])
 
-        self._file_feeds = []
-        for file in sorted(files, key=part_number, reverse=True):
-            file_feed = ChatFileFeed(file)
-            self._file_feeds.append(file_feed)
+        files.sort(key=part_number, reverse=True)
+        self._files = files
+        self._processes = processes
+        self._read_ahead = read_ahead
+        self._part_cache = _PartCache()
+        self._bytes_read = 0
+        if lazy:
+            self._file_feeds = None
+        elif processes == 1:
+            self._file_feeds = [ChatFileFeed(file) for file in files]
+        else:
+            # Reading, repairing and decoding the files is CPU-bound, so
+            # threads would be held back by the GIL. Each file's json is
+            # rebuilt here from its marshalled form while the workers carry on
+            # with later files.
+            with ProcessPoolExecutor(processes) as executor:
+                marshalled_files = executor.map(_read_marshalled_file, files)
+                self._file_feeds = [
+                    ChatFileFeed._from_json(file, marshal.loads(marshalled))
+                    for file, marshalled in zip(files, marshalled_files)]
+
+    def message_json_iter(self) -> Iterator[dict]:
+        return itertools.chain.from_iterable(self._part_message_json_iters())
+
+    def message_json_reference_iter(self
+                                    ) -> Iterator[Tuple[dict, Tuple[int, int]]]:
+        return _reference_parts(self._part_message_json_iters())
+
+    def load_message_json(self, reference: Tuple[int, int]) -> dict:
+        part, index = reference
+        if self._file_feeds is not None:
+            return self._file_feeds[part].load_message_json(index)
+
+        def load_part(part: int) -> List[dict]:
+            file = self._files[part]
+            return _decode_repaired_file(file,
+                                         _read_repaired_file(file))['messages']
+        return self._part_cache.load_message_json(part, index, load_part)
+
+    def source_fingerprint(self) -> Optional[str]:
+        return _fingerprint_files(self._files)
+
+    def message_count(self) -> Optional[int]:
+        if self._file_feeds is None:
+            return None
+        return sum(file_feed.message_count()
+                   for file_feed in self._file_feeds)
+
+    def source_size(self) -> Optional[int]:
+        return sum(file.stat().st_size for file in self._files)
+
+    def bytes_read(self) -> Optional[int]:
+        return self._bytes_read
+
+    def _part_message_json_iters(self) -> Iterator[Iterator[dict]]:
+        """Return an iterator through iterators of each file's messages."""
+        sizes = (file.stat().st_size for file in self._files)
+        if self._file_feeds is None:
+            return _counted_parts(self, sizes,
+                                  self._lazy_part_message_json_iters())
+
+        return _counted_parts(self, sizes, (
+            file_feed.message_json_iter() for file_feed in self._file_feeds))
+
+    def _lazy_part_message_json_iters(self) -> Iterator[Iterator[dict]]:
+        executor: Optional[Executor] = None
+        look_ahead = 0
+        if self._processes != 1:
+            look_ahead = self._processes or os.cpu_count() or 1
+            executor = ProcessPoolExecutor(look_ahead)
+        elif self._read_ahead:
+            look_ahead = 1
+            executor = ThreadPoolExecutor(look_ahead)
+
+        # Worker processes send back each file's json marshalled, while the
+        # read-ahead thread only reads and repairs it, as decoding in a thread
+        # would just contend for the GIL with the caller.
+        in_processes = self._processes != 1
+        read_file = (_read_marshalled_file if in_processes
+                     else _read_repaired_file)
+
+        # Futures of `read_file` for the files after the current one.
+        pending: Deque[Future] = collections.deque()
+        try:
+            for i, file in enumerate(self._files):
+                if executor is None:
+                    read_bytes = _read_repaired_file(file)
+                else:
+                    next_i = i + len(pending)
+                    for next_file in self._files[next_i:i + look_ahead + 1]:
+                        pending.append(executor.submit(read_file, next_file))
+                    read_bytes = pending.popleft().result()
+
+                if in_processes:
+                    message_jsons = marshal.loads(read_bytes)['messages']
+                else:
+                    message_jsons = _decode_repaired_file(
+                        file, read_bytes)['messages']
+                del read_bytes
+                yield _pop_message_jsons(message_jsons)
+        finally:
+            if executor is not None:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown()
+
+
+class ChatZipFeed(ChatFeed):
+    """
+    Adapter to extract a chat's json data straight from the `.zip` archive (or
+    archives) downloaded with the 'Download Your Information' Facebook
+    feature, without unzipping them to disk.
+    """
+
+    _archives: List[Path]
+    _members: List[Tuple[Path, str]]
+    _member_sizes: List[int]
+    _part_cache: _PartCache
+    _bytes_read: int
+
+    def __init__(self, archives: Union[Path, Sequence[Path]],
+                 chat_folder: str) -> None:
+        """
+        Build feed from the `message_1.json`, `message_2.json`, ... members of
+        a chat folder within a Facebook archive.
+
+        Only the archives' member lists are read during construction. Each
+        member is decompressed when `message_json_iter` reaches it, and
+        released once its messages have been yielded.
+
+        Parameters
+        ----------
+        archives : pathlib.Path, or Sequence[pathlib.Path]
+            Path to the `.zip` archive, or paths to all of the `.zip` archives
+            of an export that Facebook has split into several.
+        chat_folder : str
+            Path of the chat's folder within the archive, like
+            `'messages/inbox/ourchat_95kldfjg4'`. Any leading folders of the
+            archive's layout may be omitted. The folder must contain some number
+            of files exactly of the names `message_1.json`, `message_2.json`,
+            ..., besides subfolders (of media).
+
+        Raises
+        ------
+        InvalidChatFeedException
+            - If an archive cannot be opened as a `.zip` file; if the chat
+            folder is not in any archive, or does not contain solely
+            'message_<NUM>.json' files; or if two archives contain the same
+            part. Errors in decompressing or parsing members are instead raised
+            from the iterator returned by `message_json_iter`.
+        """
+        if isinstance(archives, PurePath):
+            archives = [archives]
+        self._archives = list(archives)
+        chat_folder = chat_folder.strip('/')
+
+        members_by_part: Dict[int, Tuple[Path, str]] = {}
+        sizes_by_part: Dict[int, int] = {}
+        for archive in self._archives:
+            try:
+                with zipfile.ZipFile(archive) as zip_file:
+                    infos = zip_file.infolist()
+            except Exception as e:
+                raise InvalidChatFeedException(
+                    'Could not open archive: ' + archive.name) from e
+
+            for info in infos:
+                name = info.filename
+                member = PurePosixPath(name)
+                folder = member.parent.as_posix()
+                if name.endswith('/') or not (
+                        folder == chat_folder
+                        or folder.endswith('/' + chat_folder)):
+                    continue
+
+                match = re.match(r'message_(\d+)\.json$', member.name)
+                if match is None:
+                    raise InvalidChatFeedException(
+                        "Chat folder '" + chat_folder + "' contains the file '"
+                        + member.name + "', which does not fit expected"
+                        ' message_NUM.json format')
+                part_number = int(match[1])
+                if part_number in members_by_part:
+                    raise InvalidChatFeedException(
+                        "Chat folder '" + chat_folder + "' contains the file '"
+                        + member.name + "' more than once")
+                members_by_part[part_number] = (archive, name)
+                sizes_by_part[part_number] = info.file_size
+
+        if members_by_part == {}:
+            raise InvalidChatFeedException(
+                "Could not find chat folder '" + chat_folder + "' in archive")
+
+        part_numbers = sorted(members_by_part, reverse=True)
+        self._members = [members_by_part[part_number]
+                         for part_number in part_numbers]
+        self._member_sizes = [sizes_by_part[part_number]
+                              for part_number in part_numbers]
+        self._part_cache = _PartCache()
+        self._bytes_read = 0
 
     def message_json_iter(self) -> Iterator[dict]:
-        file_feed_iterators = [file_feed.message_json_iter()
-                               for file_feed in self._file_feeds]
-        return itertools.chain.from_iterable(file_feed_iterators)
+        return itertools.chain.from_iterable(self._part_message_json_iters())
+
+    def message_json_reference_iter(self
+                                    ) -> Iterator[Tuple[dict, Tuple[int, int]]]:
+        return _reference_parts(self._part_message_json_iters())
+
+    def load_message_json(self, reference: Tuple[int, int]) -> dict:
+        def load_part(part: int) -> List[dict]:
+            archive, name = self._members[part]
+            try:
+                with zipfile.ZipFile(archive) as zip_file:
+                    repaired_bytes = _repair_mojibake(zip_file.read(name))
+            except Exception as e:
+                raise InvalidChatFeedException(
+                    'Could not read json stream from file: '
+                    + PurePosixPath(name).name) from e
+            return _decode_repaired_file(PurePosixPath(name),
+                                         repaired_bytes)['messages']
+
+        part, index = reference
+        return self._part_cache.load_message_json(part, index, load_part)
+
+    def source_size(self) -> Optional[int]:
+        # The size of the decompressed members.
+        return sum(self._member_sizes)
+
+    def bytes_read(self) -> Optional[int]:
+        return self._bytes_read
+
+    def _part_message_json_iters(self) -> Iterator[Iterator[dict]]:
+        """Return an iterator through iterators of each member's messages."""
+        return _counted_parts(self, iter(self._member_sizes),
+                              self._uncounted_part_message_json_iters())
+
+    def _uncounted_part_message_json_iters(self) -> Iterator[Iterator[dict]]:
+        with contextlib.ExitStack() as stack:
+            zip_files: Dict[Path, zipfile.ZipFile] = {}
+            for archive, name in self._members:
+                member = PurePosixPath(name)
+                try:
+                    if archive not in zip_files:
+                        zip_files[archive] = stack.enter_context(
+                            zipfile.ZipFile(archive))
+                    repaired_bytes = _repair_mojibake(
+                        zip_files[archive].read(name))
+                except Exception as e:
+                    raise InvalidChatFeedException(
+                        'Could not read json stream from file: ' + member.name
+                    ) from e
+
+                message_jsons = _decode_repaired_file(
+                    member, repaired_bytes)['messages']
+                del repaired_bytes
+                yield _pop_message_jsons(message_jsons)
+
+    def source_fingerprint(self) -> Optional[str]:
+        # Archives hold a CRC of each member's contents, so they need not be
+        # decompressed to be fingerprinted.
+        fingerprint = hashlib.blake2b(digest_size=20)
+        with contextlib.ExitStack() as stack:
+            zip_files: Dict[Path, zipfile.ZipFile] = {}
+            for archive, name in self._members:
+                if archive not in zip_files:
+                    zip_files[archive] = stack.enter_context(
+                        zipfile.ZipFile(archive))
+                info = zip_files[archive].getinfo(name)
+                fingerprint.update('{}\0{}\0{}\0'.format(
+                    name, info.file_size, info.CRC).encode())
+        return fingerprint.hexdigest()
@@ -0,0 +1,214 @@
+"""Module for logic about columnar, NumPy-backed views of built chats."""
+
+__all__ = ['ChatColumns', 'build_columns']
+
+from typing import Dict, List, Optional, Tuple, Type, TYPE_CHECKING
+from types import ModuleType
+import array
+
+from ._chat import Chat
+from ._participant import Participant
+from .message import Message
+
+if TYPE_CHECKING:
+    import numpy
+
+
+def _import_numpy() -> ModuleType:
+    """Import NumPy, which only the columnar view of chats depends on."""
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError('demuxfb.build_columns requires NumPy '
+                          '(`pip install numpy`).') from e
+    return numpy
+
+
+class ChatColumns:
+    """
+    A columnar view of a `Chat`'s messages, with one NumPy array entry per
+    message (in the order of `Chat.messages`), so that counting, filtering and
+    time-bucketing over large chats can be vectorized.
+
+    Attributes
+    ----------
+    timestamps: numpy.ndarray
+        int64 timestamps (ms since the epoch) of the messages.
+    type_codes: numpy.ndarray
+        int16 codes of the messages' types, as indices into `message_types`.
+    message_types: Tuple[Type[demuxfb.message.Message], ...]
+        The types of the chat's messages, in order of first appearance.
+    senders: numpy.ndarray
+        int32 indices of the messages' senders into `participants`.
+    participants: Tuple[demuxfb.Participant, ...]
+        The senders of the chat's messages, in order of first appearance.
+    reaction_counts: numpy.ndarray
+        int32 numbers of reactions to the messages.
+    has_content: numpy.ndarray
+        bool flags of whether the messages have content (it is not `None`).
+    content_offsets: numpy.ndarray
+        int64 offsets into `contents`, one more than there are messages. The
+        content of message `i` is `contents[content_offsets[i]:
+        content_offsets[i + 1]]`.
+    contents: str
+        The contents of all messages, concatenated.
+    """
+    timestamps: 'numpy.ndarray'
+    type_codes: 'numpy.ndarray'
+    message_types: Tuple[Type[Message], ...]
+    senders: 'numpy.ndarray'
+    participants: Tuple[Participant, ...]
+    reaction_counts: 'numpy.ndarray'
+    has_content: 'numpy.ndarray'
+    content_offsets: 'numpy.ndarray'
+    contents: str
+
+    def __init__(self) -> None:
+        """
+        This method should not be called publicly. Use `demuxfb.build_columns`
+        instead to create `ChatColumns`.
+        """
+        pass
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def type_mask(self, message_type: Type[Message]) -> 'numpy.ndarray':
+        """
+        Flag the messages that are instances of a type.
+
+        Parameters
+        ----------
+        message_type: Type[demuxfb.message.Message]
+            The type to flag messages of, including those of its subclasses.
+
+        Returns
+        -------
+        numpy.ndarray
+            bool flags of whether the messages are instances of `message_type`.
+        """
+        numpy = _import_numpy()
+        matching_codes = [code for code, other_type
+                          in enumerate(self.message_types)
+                          if issubclass(other_type, message_type)]
+        return numpy.isin(self.type_codes, matching_codes)
+
+    def sender_index(self, participant: Participant) -> Optional[int]:
+        """
+        Get the index of a participant into `participants`.
+
+        Parameters
+        ----------
+        participant: demuxfb.Participant
+            The participant to find.
+
+        Returns
+        -------
+        int or None
+            The participant's index, or `None` if they sent no messages.
+        """
+        for i, other_participant in enumerate(self.participants):
+            if other_participant is participant:
+                return i
+        return None
+
+    def content(self, i: int) -> Optional[str]:
+        """
+        Get the content of a message.
+
+        Parameters
+        ----------
+        i: int
+            The index of the message.
+
+        Returns
+        -------
+        str or None
+            The content of the message, as with `Message.content`.
+        """
+        if not self.has_content[i]:
+            return None
+        return self.contents[self.content_offsets[i]:
+                             self.content_offsets[i + 1]]
+
+
+def build_columns(chat: Chat) -> ChatColumns:
+    """
+    Build a columnar view of a chat's messages.
+
+    Requires NumPy, which demuxfb does not otherwise depend on.
+
+    Parameters
+    ----------
+    chat: demuxfb.Chat
+        The chat to view.
+
+    Returns
+    -------
+    demuxfb.ChatColumns
+        The chat's messages, as columns. Later changes to `chat` are not
+        reflected in it.
+
+    Raises
+    ------
+    ImportError
+        If NumPy is not installed.
+    """
+    numpy = _import_numpy()
+
+    type_codes_by_type: Dict[Type[Message], int] = {}
+    sender_indices: Dict[Participant, int] = {}
+    participants: List[Participant] = []
+
+    # Gather columns in compact arrays first; lists of ints would take several
+    # times as much memory for large chats.
+    timestamps = array.array('q')
+    type_codes = array.array('h')
+    senders = array.array('i')
+    reaction_counts = array.array('i')
+    has_content = array.array('b')
+    content_offsets = array.array('q', [0])
+    contents: List[str] = []
+    offset = 0
+
+    for message in chat.messages:
+        timestamps.append(message.timestamp)
+
+        message_type = type(message)
+        type_code = type_codes_by_type.get(message_type)
+        if type_code is None:
+            type_code = type_codes_by_type[message_type] = \
+                len(type_codes_by_type)
+        type_codes.append(type_code)
+
+        sender_index = sender_indices.get(message.sender)
+        if sender_index is None:
+            sender_index = sender_indices[message.sender] = \
+                len(participants)
+            participants.append(message.sender)
+        senders.append(sender_index)
+
+        reaction_counts.append(len(message.reactions))
+
+        content = message.content
+        if content is None:
+            has_content.append(0)
+        else:
+            has_content.append(1)
+            contents.append(content)
+            offset += len(content)
+        content_offsets.append(offset)
+
+    columns = ChatColumns()
+    columns.timestamps = numpy.frombuffer(timestamps, dtype=numpy.int64)
+    columns.type_codes = numpy.frombuffer(type_codes, dtype=numpy.int16)
+    columns.message_types = tuple(type_codes_by_type)
+    columns.senders = numpy.frombuffer(senders, dtype=numpy.int32)
+    columns.participants = tuple(participants)
+    columns.reaction_counts = numpy.frombuffer(reaction_counts,
+                                               dtype=numpy.int32)
+    columns.has_content = numpy.frombuffer(has_content, dtype=numpy.bool_)
+    columns.content_offsets = numpy.frombuffer(content_offsets,
+                                               dtype=numpy.int64)
+    columns.contents = ''.join(contents)
+    return columns
@@ -0,0 +1,330 @@
+"""Module for logic about storing classified messages in a SQLite database."""
+
+__all__ = ['ChatDatabase']
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+from pathlib import Path
+import itertools
+import json
+import re
+import sqlite3
+
+from ._chat import Chat, _ChatFactory
+from ._chat_feed import ChatFeed
+from ._export import _element_hint, _export_value, _message_types, _own_fields
+from ._export import _strip_optional
+from ._profile import RuleProfile
+from ._progress_reporter import ProgressReporter
+from . import media as _media
+from . import message as _message
+
+
+# Number of messages inserted at a time by default.
+_default_batch_size = 10000
+
+_media_types = (_media.Photo, _media.Gif, _media.AudioFile, _media.Video,
+                _media.Sticker, _media.AttachmentFile)
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    owner_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES chats (id),
+    position INTEGER NOT NULL,
+    message_type TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_chat ON messages (chat_id, position);
+CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender);
+CREATE INDEX IF NOT EXISTS messages_type ON messages (message_type);
+CREATE TABLE IF NOT EXISTS reactions (
+    message_id INTEGER NOT NULL REFERENCES messages (id),
+    emoji TEXT NOT NULL,
+    sender TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reactions_message ON reactions (message_id);
+CREATE TABLE IF NOT EXISTS media (
+    message_id INTEGER NOT NULL REFERENCES messages (id),
+    kind TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    thumbnail_uri TEXT,
+    creation_timestamp INTEGER
+);
+CREATE INDEX IF NOT EXISTS media_message ON media (message_id);
+'''
+
+
+def _table_name(message_type: Type[_message.Message]) -> str:
+    """
+    Name the table of a message type's fields, as in `'type_poll_add_vote'`.
+    The prefix keeps these names apart from those of the fixed tables.
+    """
+    name = re.sub(r'Message$', '', message_type.__name__)
+    return 'type_' + re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+def _column_type(hint: Any) -> str:
+    """Get the SQLite type of a column of a field's exported values."""
+    hint = _strip_optional(hint)
+    if hint in (int, bool):
+        return 'INTEGER'
+    if hint is float:
+        return 'REAL'
+    return 'TEXT'
+
+
+def _is_media_field(hint: Any) -> bool:
+    return _element_hint(hint) in _media_types
+
+
+class _TypeTable:
+    """
+    The side table of the fields specific to a type of message (other than
+    media, which are stored in the `media` table).
+    """
+    name: str
+    fields: List[str]
+    media_fields: List[str]
+    create: str
+    insert: str
+
+    def __init__(self, message_type: Type[_message.Message]) -> None:
+        self.name = _table_name(message_type)
+        own_fields = _own_fields(message_type)
+        self.fields = [name for name, hint in own_fields
+                       if not _is_media_field(hint)]
+        self.media_fields = [name for name, hint in own_fields
+                             if _is_media_field(hint)]
+        self.create = 'CREATE TABLE IF NOT EXISTS {} ({})'.format(
+            self.name, ', '.join(
+                ['message_id INTEGER PRIMARY KEY REFERENCES messages (id)']
+                + ['{} {}'.format(name, _column_type(hint))
+                   for name, hint in own_fields
+                   if not _is_media_field(hint)]))
+        self.insert = 'INSERT INTO {} VALUES ({})'.format(
+            self.name, ', '.join('?' * (len(self.fields) + 1)))
+
+    def row(self, message_id: int, message: _message.Message) -> Tuple:
+        values: List[Any] = [message_id]
+        for name in self.fields:
+            value = _export_value(getattr(message, name, None))
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, ensure_ascii=False)
+            values.append(value)
+        return tuple(values)
+
+
+class ChatDatabase:
+    """
+    A SQLite database of the classified messages of any number of chats, for
+    queries across chats without holding them in memory.
+
+    Tables
+    ------
+    chats(id, name, owner_name)
+        One row per chat, named as it was added.
+    messages(id, chat_id, position, message_type, timestamp, sender, content)
+        One row per message, with its position in its chat, the name of its
+        type (as in `'TextMessage'`) and its sender's name. Indexed by
+        timestamp, sender and type.
+    reactions(message_id, emoji, sender)
+        One row per reaction to a message.
+    media(message_id, kind, uri, thumbnail_uri, creation_timestamp)
+        One row per media item of a message, its `kind` being the field of
+        `demuxfb.message.MediaMessage` it belongs to (as in `'photos'`).
+    type_<type>(message_id, ...)
+        For each type of message with fields of its own, a table of those
+        fields, named after the type (as in `type_poll_add_vote` for
+        `demuxfb.message.PollAddVoteMessage`). Participants are stored as
+        their names, enumerations as the names of their members, and lists as
+        json.
+    """
+    connection: sqlite3.Connection
+    _type_tables: Dict[Type[_message.Message], _TypeTable]
+
+    def __init__(self, path: Path) -> None:
+        """
+        Open database, creating it (or any of its tables) if it does not
+        exist.
+
+        Parameters
+        ----------
+        path : pathlib.Path
+            File of the database.
+        """
+        self.connection = sqlite3.connect(str(path))
+        self._type_tables = {message_type: _TypeTable(message_type)
+                             for message_type in _message_types()}
+        with self.connection:
+            self.connection.executescript(_schema)
+            for type_table in self._type_tables.values():
+                if type_table.fields:
+                    self.connection.execute(type_table.create)
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
+
+    def __enter__(self) -> 'ChatDatabase':
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def build_chat(self, feed: ChatFeed, owner_name: str, chat_name: str,
+                   progress_reporter: Optional[ProgressReporter] = None,
+                   batch_size: int = _default_batch_size,
+                   profile: bool = False) -> Optional[RuleProfile]:
+        """
+        Build a chat as with `demuxfb.build_chat`, inserting its messages into
+        the database as they are built rather than returning a `Chat`.
+
+        Parameters
+        ----------
+        feed : demuxfb.ChatFeed
+            As for `demuxfb.build_chat`.
+        owner_name : str
+            As for `demuxfb.build_chat`.
+        chat_name : str
+            Name to store the chat under, which replaces any chat already
+            stored under it.
+        progress_reporter : demuxfb.ProgressReporter, optional
+            As for `demuxfb.build_chat`.
+        batch_size : int, defaults to 10000
+            Number of messages to insert at a time.
+        profile : bool, defaults to False
+            As for `demuxfb.build_chat`, except that the profile is returned.
+
+        Returns
+        -------
+        demuxfb.RuleProfile or None
+            The profile of the rules if `profile` is true, otherwise None.
+
+        Raises
+        ------
+        NoMatchingRuleException
+            As for `demuxfb.build_chat`, in which case the database is left
+            unchanged.
+        """
+        chat_factory = _ChatFactory(feed, owner_name, message_json='drop',
+                                    profile=profile)
+        self._insert_chat(chat_name, owner_name,
+                          chat_factory.reported_messages(progress_reporter),
+                          batch_size)
+        return chat_factory.rule_profile
+
+    def add_chat(self, chat: Chat, chat_name: str,
+                 batch_size: int = _default_batch_size) -> None:
+        """
+        Insert the messages of a built chat into the database.
+
+        Parameters
+        ----------
+        chat : demuxfb.Chat
+            The chat.
+        chat_name : str
+            Name to store the chat under, which replaces any chat already
+            stored under it.
+        batch_size : int, defaults to 10000
+            Number of messages to insert at a time.
+        """
+        # pylint: disable=protected-access
+        self._insert_chat(chat_name, chat._checkpoint.owner_name,
+                          chat.messages, batch_size)
+
+    def delete_chat(self, chat_name: str) -> None:
+        """
+        Delete a chat, if any, from the database.
+
+        Parameters
+        ----------
+        chat_name : str
+            Name the chat is stored under.
+        """
+        with self.connection:
+            self._delete_chat(chat_name)
+
+    def _delete_chat(self, chat_name: str) -> None:
+        row = self.connection.execute(
+            'SELECT id FROM chats WHERE name = ?', (chat_name,)).fetchone()
+        if row is None:
+            return
+        chat_id = row[0]
+        message_ids = 'SELECT id FROM messages WHERE chat_id = ?'
+        tables = ['reactions', 'media'] + [
+            type_table.name for type_table in self._type_tables.values()
+            if type_table.fields]
+        for table in tables:
+            self.connection.execute(
+                'DELETE FROM {} WHERE message_id IN ({})'.format(
+                    table, message_ids), (chat_id,))
+        self.connection.execute('DELETE FROM messages WHERE chat_id = ?',
+                                (chat_id,))
+        self.connection.execute('DELETE FROM chats WHERE id = ?', (chat_id,))
+
+    def _insert_chat(self, chat_name: str, owner_name: str,
+                     messages: Iterable[_message.Message],
+                     batch_size: int) -> None:
+        """Insert a chat's messages in one transaction, in batches."""
+        connection = self.connection
+        with connection:
+            self._delete_chat(chat_name)
+            chat_id = connection.execute(
+                'INSERT INTO chats (name, owner_name) VALUES (?, ?)',
+                (chat_name, owner_name)).lastrowid
+            next_id = connection.execute(
+                'SELECT COALESCE(MAX(id), 0) + 1 FROM messages').fetchone()[0]
+
+            message_iter = iter(messages)
+            position = 0
+            while True:
+                batch = list(itertools.islice(message_iter, batch_size))
+                if not batch:
+                    break
+                self._insert_batch(chat_id, next_id, position, batch)
+                next_id += len(batch)
+                position += len(batch)
+
+    def _insert_batch(self, chat_id: int, first_id: int, first_position: int,
+                      messages: List[_message.Message]) -> None:
+        message_rows = []
+        reaction_rows = []
+        media_rows = []
+        type_rows: Dict[_TypeTable, List[Tuple]] = {}
+        for i, message in enumerate(messages):
+            message_id = first_id + i
+            message_rows.append((
+                message_id, chat_id, first_position + i,
+                type(message).__name__, message.timestamp,
+                message.sender.get_name(), message.content))
+            for reaction in message.reactions:
+                reaction_rows.append((message_id, reaction.emoji,
+                                      reaction.sender.get_name()))
+
+            type_table = self._type_tables[type(message)]
+            for kind in type_table.media_fields:
+                for item in getattr(message, kind, ()):
+                    media_rows.append((
+                        message_id, kind, item.uri,
+                        getattr(item, 'thumbnail_uri', None),
+                        getattr(item, 'creation_timestamp', None)))
+            if type_table.fields:
+                type_rows.setdefault(type_table, []).append(
+                    type_table.row(message_id, message))
+
+        connection = self.connection
+        connection.executemany(
+            'INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)', message_rows)
+        connection.executemany('INSERT INTO reactions VALUES (?, ?, ?)',
+                               reaction_rows)
+        connection.executemany('INSERT INTO media VALUES (?, ?, ?, ?, ?)',
+                               media_rows)
+        for type_table, rows in type_rows.items():
+            connection.executemany(type_table.insert, rows)
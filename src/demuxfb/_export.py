@@ -0,0 +1,272 @@
+"""
+Module for logic about exporting built chats to Parquet and Arrow files, with
+one row per message.
+"""
+
+__all__ = ['export_parquet', 'export_arrow']
+
+from typing import (Any, Dict, Iterable, Iterator, List, Tuple, Type, Union,
+                    TYPE_CHECKING, get_type_hints)
+from enum import Enum
+from pathlib import Path
+from types import ModuleType
+import itertools
+import typing
+
+from ._chat import Chat
+from ._participant import Participant
+from . import message as _message
+
+if TYPE_CHECKING:
+    import pyarrow
+
+
+# Fields every message has, exported as the leading columns of every row.
+_common_fields = ('timestamp', 'sender', 'content', 'reactions')
+
+# Number of messages written at a time by default.
+_default_batch_size = 65536
+
+
+def _import_pyarrow() -> Tuple[ModuleType, ModuleType]:
+    """Import PyArrow, which only exporting chats depends on."""
+    try:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('Exporting chats requires PyArrow '
+                          '(`pip install pyarrow`).') from e
+    return pyarrow, pyarrow.parquet
+
+
+def _message_types() -> List[Type[_message.Message]]:
+    """
+    Get all types of messages, including any defined outside of
+    `demuxfb.message`.
+    """
+    message_types = []
+    pending = [_message.Message]
+    while pending:
+        message_type = pending.pop(0)
+        message_types.append(message_type)
+        pending.extend(message_type.__subclasses__())
+    return message_types
+
+
+def _fields(slotted_type: type) -> List[Tuple[str, Any]]:
+    """
+    Get the public fields of a slotted type (a message, reaction or media type)
+    and their type hints, those of base classes first.
+    """
+    return [(name, hint) for name, hint in get_type_hints(slotted_type).items()
+            if not name.startswith('_')]
+
+
+def _own_fields(message_type: Type[_message.Message]
+                ) -> List[Tuple[str, Any]]:
+    """Get the fields of a message type that are not common to all messages."""
+    return [(name, hint) for name, hint in _fields(message_type)
+            if name not in _common_fields]
+
+
+def _strip_optional(hint: Any) -> Any:
+    """Turn a hint of `Optional[X]` into `X`, leaving others unchanged."""
+    if typing.get_origin(hint) is Union:
+        arguments = [argument for argument in typing.get_args(hint)
+                     if argument is not type(None)]
+        if len(arguments) == 1:
+            return arguments[0]
+    return hint
+
+
+def _element_hint(hint: Any) -> Any:
+    """
+    Get the element type hint of a hint of `List[X]` or `Tuple[X, ...]`, or
+    `None` if it is neither.
+    """
+    if typing.get_origin(hint) in (list, tuple):
+        return typing.get_args(hint)[0]
+    return None
+
+
+def _export_value(value: Any) -> Any:
+    """
+    Convert a field's value into plain data: participants become their names,
+    enumerations their member names, and slotted objects dictionaries.
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, Participant):
+        return value.get_name()
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, (list, tuple)):
+        return [_export_value(element) for element in value]
+    return {name: _export_value(getattr(value, name))
+            for name, _ in _fields(type(value))}
+
+
+def _arrow_type(pyarrow: ModuleType, hint: Any) -> 'pyarrow.DataType':
+    """Get the Arrow type of the exported values of a field."""
+    hint = _strip_optional(hint)
+    element_hint = _element_hint(hint)
+    if element_hint is not None:
+        return pyarrow.list_(_arrow_type(pyarrow, element_hint))
+    if hint is bool:
+        return pyarrow.bool_()
+    if hint is int:
+        return pyarrow.int64()
+    if hint is float:
+        return pyarrow.float64()
+    if hint is str or hint is Participant or (
+            isinstance(hint, type) and issubclass(hint, Enum)):
+        return pyarrow.string()
+    return pyarrow.struct([(name, _arrow_type(pyarrow, field_hint))
+                           for name, field_hint in _fields(hint)])
+
+
+class _Layout:
+    """
+    The columns of an exported chat: the message type's name, the common
+    fields of messages, then every field specific to some type of message.
+    Fields of different types that share a name and hint share a column, and
+    other clashes are named `'<MessageType>.<field>'`.
+    """
+    columns: List[Tuple[str, Any]]
+    _type_columns: Dict[Type[_message.Message], List[Tuple[int, str]]]
+
+    def __init__(self) -> None:
+        common_hints = dict(_fields(_message.Message))
+        self.columns = [('message_type', str)] + [
+            (name, common_hints[name]) for name in _common_fields]
+        column_indices: Dict[str, int] = {}
+        self._type_columns = {}
+        for message_type in _message_types():
+            type_columns = []
+            for name, hint in _own_fields(message_type):
+                column = name
+                i = column_indices.get(column)
+                if i is not None and self.columns[i][1] != hint:
+                    column = message_type.__name__ + '.' + name
+                    i = column_indices.get(column)
+                if i is None:
+                    i = column_indices[column] = len(self.columns)
+                    self.columns.append((column, hint))
+                type_columns.append((i, name))
+            self._type_columns[message_type] = type_columns
+
+    def rows(self, messages: Iterable[_message.Message]
+             ) -> Iterator[List[Any]]:
+        """Export messages as rows of plain data, with `None` for gaps."""
+        for message in messages:
+            row: List[Any] = [None] * len(self.columns)
+            row[0] = type(message).__name__
+            for i, name in enumerate(_common_fields, 1):
+                row[i] = _export_value(getattr(message, name))
+            for i, name in self._type_columns[type(message)]:
+                row[i] = _export_value(getattr(message, name, None))
+            yield row
+
+
+def _record_batches(messages: Iterable[_message.Message], batch_size: int
+                    ) -> Tuple['pyarrow.Schema',
+                               Iterator['pyarrow.RecordBatch']]:
+    """Export messages as Arrow record batches of up to `batch_size` rows."""
+    pyarrow, _ = _import_pyarrow()
+    layout = _Layout()
+    types = [pyarrow.timestamp('ms') if name == 'timestamp'
+             else _arrow_type(pyarrow, hint)
+             for name, hint in layout.columns]
+    schema = pyarrow.schema([pyarrow.field(name, arrow_type)
+                             for (name, _), arrow_type
+                             in zip(layout.columns, types)])
+
+    def batch_iter() -> Iterator['pyarrow.RecordBatch']:
+        rows = layout.rows(messages)
+        while True:
+            batch_rows = list(itertools.islice(rows, batch_size))
+            if not batch_rows:
+                return
+            columns = zip(*batch_rows)
+            yield pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=arrow_type)
+                 for column, arrow_type in zip(columns, types)],
+                schema=schema)
+
+    return schema, batch_iter()
+
+
+def _message_iterable(chat: Union[Chat, Iterable[_message.Message]]
+                      ) -> Iterable[_message.Message]:
+    if isinstance(chat, Chat):
+        return chat.messages
+    return chat
+
+
+def export_parquet(chat: Union[Chat, Iterable[_message.Message]], path: Path,
+                   batch_size: int = _default_batch_size) -> None:
+    """
+    Write a chat's messages to a Parquet file, one row per message.
+
+    Each row has the name of the message's type (`'message_type'`), its
+    `timestamp` (as an Arrow timestamp in ms), the name of its `sender`, its
+    `content` and its `reactions` (as a list of `{'emoji', 'sender'}`
+    structures), followed by a column for each field of each type of message
+    (like `new_nickname` or `call_type`), which is null for other types.
+    Participants are written as their names, enumerations as the names of
+    their members, and media as structures of their fields.
+
+    Messages are converted and written `batch_size` at a time (one Parquet row
+    group each), so the whole table is never held in memory.
+
+    Requires PyArrow, which demuxfb does not otherwise depend on.
+
+    Parameters
+    ----------
+    chat : demuxfb.Chat or Iterable[demuxfb.message.Message]
+        The chat to export, or the messages of one.
+    path : pathlib.Path
+        File to write to. It is overwritten if it exists.
+    batch_size : int, defaults to 65536
+        Number of messages to write at a time.
+
+    Raises
+    ------
+    ImportError
+        If PyArrow is not installed.
+    """
+    _, parquet = _import_pyarrow()
+    schema, batches = _record_batches(_message_iterable(chat), batch_size)
+    with parquet.ParquetWriter(str(path), schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+
+
+def export_arrow(chat: Union[Chat, Iterable[_message.Message]], path: Path,
+                 batch_size: int = _default_batch_size) -> None:
+    """
+    Write a chat's messages to an Arrow IPC (Feather version 2) file, one row
+    per message, with the same columns as `demuxfb.export_parquet`.
+
+    Requires PyArrow, which demuxfb does not otherwise depend on.
+
+    Parameters
+    ----------
+    chat : demuxfb.Chat or Iterable[demuxfb.message.Message]
+        The chat to export, or the messages of one.
+    path : pathlib.Path
+        File to write to. It is overwritten if it exists.
+    batch_size : int, defaults to 65536
+        Number of messages to write at a time (one record batch each).
+
+    Raises
+    ------
+    ImportError
+        If PyArrow is not installed.
+    """
+    pyarrow, _ = _import_pyarrow()
+    schema, batches = _record_batches(_message_iterable(chat), batch_size)
+    with pyarrow.ipc.new_file(str(path), schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
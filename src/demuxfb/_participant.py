@@ -13,6 +13,7 @@ class Participant:
 
     Note: object-equivalency does not hold across multiple chats.
     """
+    __slots__ = ('_name', '_is_me')
     _name: str
     _is_me: bool
 
@@ -0,0 +1,152 @@
+"""Module for logic about profiling the rules that classify messages."""
+
+__all__ = ['RuleProfile', 'RuleStats', 'SequenceStats']
+
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ._rules import _Rule
+    from ._tokens import _TokenSequence
+
+
+class SequenceStats:
+    """
+    Statistics of a token sequence that a rule matches message content
+    against.
+
+    Attributes
+    ----------
+    name: str
+        The name the rule declares the sequence by.
+    attempts: int
+        The number of times the rule matched content against the sequence.
+    hits: int
+        The number of those times the content matched.
+    seconds: float
+        The total wall time those matches took. This includes the matching of
+        the rule's other sequences wherever they were all matched in one go.
+    """
+    __slots__ = ('name', 'attempts', 'hits', 'seconds')
+    name: str
+    attempts: int
+    hits: int
+    seconds: float
+
+    def __init__(self, name: str) -> None:
+        """This method should not be called publicly."""
+        self.name = name
+        self.attempts = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+
+class RuleStats:
+    """
+    Statistics of a message-matching rule.
+
+    Attributes
+    ----------
+    name: str
+        The name of the rule's function in `_rules.py`, like
+        `'_match_poll_add_vote_message'`.
+    attempts: int
+        The number of messages the rule was tried on. Rules are not tried on
+        messages lacking the keys or literal fragments they require.
+    hits: int
+        The number of those messages the rule produced a message for.
+    seconds: float
+        The total wall time the attempts took, including the matching of
+        sequences.
+    sequences: List[demuxfb.SequenceStats]
+        Statistics of the rule's token sequences, in order of declaration.
+    """
+    __slots__ = ('name', 'attempts', 'hits', 'seconds', 'sequences')
+    name: str
+    attempts: int
+    hits: int
+    seconds: float
+    sequences: List[SequenceStats]
+
+    def __init__(self, name: str, sequence_names: List[str]) -> None:
+        """This method should not be called publicly."""
+        self.name = name
+        self.attempts = 0
+        self.hits = 0
+        self.seconds = 0.0
+        self.sequences = [SequenceStats(sequence_name)
+                          for sequence_name in sequence_names]
+
+
+class RuleProfile:
+    """
+    Statistics of the rules that classified the messages of a chat, gathered
+    when it is built with `profile=True` (see `demuxfb.build_chat`).
+
+    Attributes
+    ----------
+    rules: List[demuxfb.RuleStats]
+        Statistics of each rule, in order of precedence.
+    """
+    rules: List[RuleStats]
+    _rule_stats: Dict['_Rule', RuleStats]
+    _sequence_stats: Dict['_TokenSequence', SequenceStats]
+    _undeclared_stats: SequenceStats
+
+    def __init__(self, rules: List['_Rule']) -> None:
+        """This method should not be called publicly."""
+        self.rules = []
+        self._rule_stats = {}
+        self._sequence_stats = {}
+        for rule in rules:
+            sequences = vars(rule.sequences)
+            rule_stats = RuleStats(rule.function.__name__, list(sequences))
+            self.rules.append(rule_stats)
+            self._rule_stats[rule] = rule_stats
+            for sequence, sequence_stats in zip(sequences.values(),
+                                                rule_stats.sequences):
+                self._sequence_stats[sequence] = sequence_stats
+        self._undeclared_stats = SequenceStats('<undeclared>')
+
+    def _record_rule(self, rule: '_Rule', hit: bool, seconds: float) -> None:
+        rule_stats = self._rule_stats[rule]
+        rule_stats.attempts += 1
+        rule_stats.hits += hit
+        rule_stats.seconds += seconds
+
+    def _record_sequence(self, sequence: Optional['_TokenSequence'], hit: bool,
+                         seconds: float) -> None:
+        sequence_stats = self._sequence_stats.get(sequence,
+                                                  self._undeclared_stats)
+        sequence_stats.attempts += 1
+        sequence_stats.hits += hit
+        sequence_stats.seconds += seconds
+
+    def report(self) -> str:
+        """
+        Describe the statistics as a table of the rules that were attempted
+        (and their sequences), most time-consuming first.
+
+        Returns
+        -------
+        str
+            The table.
+        """
+        lines = ['{:<48} {:>10} {:>10} {:>10}'.format(
+            'rule', 'attempts', 'hits', 'seconds')]
+        for rule_stats in sorted(self.rules,
+                                 key=lambda rule_stats: -rule_stats.seconds):
+            if rule_stats.attempts == 0:
+                continue
+            lines.append('{:<48} {:>10} {:>10} {:>10.4f}'.format(
+                rule_stats.name, rule_stats.attempts, rule_stats.hits,
+                rule_stats.seconds))
+            for sequence_stats in rule_stats.sequences:
+                lines.append('  {:<46} {:>10} {:>10} {:>10.4f}'.format(
+                    sequence_stats.name, sequence_stats.attempts,
+                    sequence_stats.hits, sequence_stats.seconds))
+        if self._undeclared_stats.attempts:
+            lines.append('{:<48} {:>10} {:>10} {:>10.4f}'.format(
+                'sequences not declared by rules',
+                self._undeclared_stats.attempts, self._undeclared_stats.hits,
+                self._undeclared_stats.seconds))
+        return '\n'.join(lines)
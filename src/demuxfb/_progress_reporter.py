@@ -2,11 +2,16 @@
 
 
 from abc import ABC, abstractmethod
-from typing import Callable, Any
+from typing import Callable, Any, DefaultDict, Optional, Type, TYPE_CHECKING
+import collections
 import datetime
+import time
 
 from .message import Message
 
+if TYPE_CHECKING:
+    from ._chat_feed import ChatFeed
+
 
 class ProgressReporter(ABC):
     """
@@ -30,6 +35,34 @@ class ProgressReporter(ABC):
         """
         raise NotImplementedError
 
+    def set_feed(self, feed: 'ChatFeed') -> None:
+        """
+        Called before `start` with the feed the chat is being built from, for
+        reporters that track the progress of reading it. Does nothing by
+        default.
+
+        Parameters
+        ----------
+        feed: demuxfb.ChatFeed
+            The feed the chat is being built from.
+        """
+        pass
+
+    def set_resumed_count(self, count: int) -> None:
+        """
+        Called before `start` with the number of messages of the chat that
+        building resumes from (see the `resume_from` parameter of
+        `demuxfb.build_chat`), which the feed's first messages repeat and which
+        are not built again, so are not passed to `finish_message`. Does
+        nothing by default.
+
+        Parameters
+        ----------
+        count: int
+            The number of messages resumed from, 0 if not resuming.
+        """
+        pass
+
     @abstractmethod
     def start(self) -> None:
         """Called when Chat construction begins."""
@@ -86,3 +119,138 @@ class IntervalProgressReporter(ProgressReporter):
         d_time = end_time - self._start_time
         self._report_function('Processed {} messages\nTook: {} seconds'.format(
             self._message_count, d_time))
+
+
+class ThroughputProgressReporter(ProgressReporter):
+    """
+    ProgressReporter that logs, at a regular interval, the number of messages
+    processed, the rates of processing messages and of reading the feed, and
+    an estimate of the time remaining; and on finishing, the number of messages
+    of each type.
+
+    The clock is only read every so many messages, a number tuned as the build
+    goes to check the clock several times per interval, so that reporting
+    costs little even when messages are processed quickly.
+    """
+    type_counts: DefaultDict[Type[Message], int]
+    _report_interval: float
+    _report_function: Callable[[str], Any]
+    _feed: Optional['ChatFeed']
+    _resumed_count: int
+    _start_time: float
+    _last_check_time: float
+    _next_report_time: float
+    _check_every: int
+    _countdown: int
+
+    # Number of times to aim to read the clock per reporting interval.
+    _checks_per_interval = 10
+
+    def __init__(self, report_interval_seconds: float = 1.0,
+                 report_function: Callable[[str], Any] = print) -> None:
+        """
+        Create reporter.
+
+        Parameters
+        ----------
+        report_interval_seconds : float, defaults to 1.0
+            Interval (in seconds) to report at.
+        report_function : function, defaults to print
+            Function that takes in a str and logs its value via some
+            side-effect. This function will be used to make the reports.
+        """
+        self.type_counts = collections.defaultdict(int)
+        self._report_interval = report_interval_seconds
+        self._report_function = report_function
+        self._feed = None
+        self._resumed_count = 0
+
+    @property
+    def message_count(self) -> int:
+        """The number of messages processed so far."""
+        return sum(self.type_counts.values())
+
+    def set_feed(self, feed: 'ChatFeed') -> None:
+        self._feed = feed
+
+    def set_resumed_count(self, count: int) -> None:
+        self._resumed_count = count
+
+    def start(self) -> None:
+        self.type_counts.clear()
+        self._start_time = time.monotonic()
+        self._last_check_time = self._start_time
+        self._next_report_time = self._start_time + self._report_interval
+        self._check_every = 1
+        self._countdown = 1
+
+    def finish_message(self, message: Message) -> None:
+        self.type_counts[message.__class__] += 1
+        self._countdown -= 1
+        if self._countdown == 0:
+            self._check_clock()
+
+    def _check_clock(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_check_time
+        self._last_check_time = now
+
+        # Aim for the next check to come a fraction of an interval from now,
+        # at the rate messages were just processed at.
+        target = self._report_interval / self._checks_per_interval
+        if elapsed <= 0:
+            self._check_every *= 2
+        else:
+            self._check_every = max(1, min(
+                int(self._check_every * target / elapsed),
+                self._check_every * 2))
+        self._countdown = self._check_every
+
+        if now >= self._next_report_time:
+            self._next_report_time = now + self._report_interval
+            self._report_function(self._progress(now))
+
+    def _progress(self, now: float, estimate: bool = True) -> str:
+        """
+        Describe the progress made as of `now`, estimating the time remaining
+        if `estimate`.
+        """
+        message_count = self.message_count
+        elapsed = now - self._start_time
+        parts = ['Messages processed: {}'.format(message_count)]
+
+        # Only the messages after those resumed from are built.
+        total = None if self._feed is None else self._feed.message_count()
+        if total is not None:
+            total = max(0, total - self._resumed_count)
+        bytes_read = None if self._feed is None else self._feed.bytes_read()
+        source_size = None if self._feed is None else self._feed.source_size()
+        if total:
+            parts[0] += ' of {} ({:.0%})'.format(total, message_count / total)
+
+        if elapsed > 0:
+            parts.append('{:.0f} messages/s'.format(message_count / elapsed))
+            if bytes_read is not None:
+                parts.append('{:.1f} MB/s read'.format(
+                    bytes_read / elapsed / 1e6))
+
+        # Estimate from the fraction of messages processed, or else from the
+        # fraction of the feed read.
+        fraction = None
+        if total:
+            fraction = message_count / total
+        elif source_size and bytes_read:
+            fraction = bytes_read / source_size
+        if estimate and fraction:
+            parts.append('ETA {:.0f}s'.format(
+                max(0.0, elapsed * (1 - fraction) / fraction)))
+        return ', '.join(parts)
+
+    def finish(self) -> None:
+        now = time.monotonic()
+        lines = [self._progress(now, estimate=False),
+                 'Took: {:.3f} seconds'.format(now - self._start_time)]
+        for message_type, count in sorted(self.type_counts.items(),
+                                          key=lambda item: -item[1]):
+            lines.append('  {}: {}'.format(message_type.__name__, count))
+        self._report_function('\n'.join(lines))
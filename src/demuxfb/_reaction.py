@@ -7,6 +7,7 @@ from ._participant import Participant
 
 
 class Reaction:
+    __slots__ = ('emoji', 'sender')
     emoji: str
     sender: Participant
 
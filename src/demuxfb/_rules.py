@@ -1,8 +1,13 @@
 """Module to define message-generation rules."""
 
-from typing import Optional, Callable, List, TYPE_CHECKING
-
-from ._tokens import _Tok
+from types import SimpleNamespace
+from typing import (Optional, Callable, Dict, FrozenSet, List, Tuple,
+                    TYPE_CHECKING)
+import time
+
+from ._tokens import (_Tok, _Token, _TokenSequence, _TokenSequenceGroup,
+                      _sentence_endings)
+from ._profile import RuleProfile
 from . import message as msg
 from . import media
 
@@ -10,69 +15,405 @@ if TYPE_CHECKING:
     from ._chat import _ChatFactory
 
 
-_Rule = Callable[['_ChatFactory'], Optional[msg.Message]]
+_Sequences = SimpleNamespace
+_RuleFunction = Callable[['_ChatFactory', _Sequences], Optional[msg.Message]]
+
+# JSON keys whose presence marks a message as carrying media.
+_media_keys = ('photos', 'gifs', 'audio_files', 'videos', 'sticker', 'files')
+
+# Number of messages a `_Ruleset` counts the hits of its rules over before
+# adapting the order it tries them in.
+_warm_up_message_count = 1000
+
+
+class _Rule:
+    """
+    A message generation rule, together with the metadata `_Ruleset` needs to
+    decide whether the rule can apply to a given message without running it.
+
+    Attributes
+    ----------
+    function : Callable[[_ChatFactory, SimpleNamespace], Optional[Message]]
+        The rule itself.
+    sequences : SimpleNamespace
+        The named token sequences the rule matches against, passed as the
+        second argument to `function`.
+    keys : Tuple[str, ...]
+        JSON keys of which at least one must be present (and not null) for the
+        rule to be able to match. If empty, the rule is not gated on keys.
+    absent_keys : Tuple[str, ...]
+        JSON keys which must all be absent for the rule to be able to match.
+    fallback : bool
+        Whether the rule can produce a message without any of its `sequences`
+        matching.
+    sequence_group : _TokenSequenceGroup
+        The values of `sequences`, in order of declaration (taken to be their
+        order of precedence).
+    """
+    function: _RuleFunction
+    sequences: _Sequences
+    keys: Tuple[str, ...]
+    absent_keys: Tuple[str, ...]
+    fallback: bool
+    sequence_group: _TokenSequenceGroup
+
+    def __init__(self, function: _RuleFunction, sequences: _Sequences,
+                 keys: Tuple[str, ...], absent_keys: Tuple[str, ...],
+                 fallback: bool) -> None:
+        self.function = function
+        self.sequences = sequences
+        self.keys = keys
+        self.absent_keys = absent_keys
+        self.fallback = fallback
+        self.sequence_group = _TokenSequenceGroup(vars(sequences).values())
+
+    def __call__(self, chat_factory: '_ChatFactory') -> Optional[msg.Message]:
+        if self.sequence_group.sequences:
+            chat_factory.enter_rule(self.sequence_group)
+        return self.function(chat_factory, self.sequences)
+
+    def required_literals(self) -> Optional[List[str]]:
+        """
+        Return a list of literals, one of which must appear in the message
+        content for the rule to be able to match, or `None` if the rule cannot
+        be gated on the content.
+        """
+        if not self.requires_sequence_match():
+            return None
+
+        literals = [sequence.required_literal
+                    for sequence in self.sequence_group.sequences]
+        if '' in literals:
+            return None
+        return literals
+
+    def requires_sequence_match(self) -> bool:
+        """
+        Return true if the rule can only produce a message when one of its
+        `sequences` matches the message content.
+        """
+        return not self.fallback and bool(self.sequence_group.sequences)
+
+    def _present_keys(self) -> Tuple[str, ...]:
+        """
+        Return the JSON keys of which at least one must be present for the
+        rule to be able to match, counting the content of rules that require
+        a sequence match.
+        """
+        if not self.requires_sequence_match():
+            return self.keys
+        return self.keys or ('content',)
+
+    def excludes(self, other: '_Rule') -> bool:
+        """
+        Return true if no message can be matched by both this rule and
+        `other`: because one requires absent all the keys the other requires
+        one of, or because every sequence of one excludes every sequence of
+        the other (see `_TokenSequence.excludes`).
+        """
+        for rule, other_rule in ((self, other), (other, self)):
+            present_keys = rule._present_keys()
+            if present_keys and set(present_keys) <= set(
+                    other_rule.absent_keys):
+                return True
+
+        if not self.requires_sequence_match() or \
+                not other.requires_sequence_match():
+            return False
+        return all(sequence.excludes(other_sequence)
+                   for sequence in self.sequence_group.sequences
+                   for other_sequence in other.sequence_group.sequences)
+
+
+def _final_characters(rules: List[_Rule]) -> Optional[FrozenSet[str]]:
+    """
+    Return the characters that content matching any sequence of `rules` must
+    end with (but for the trailing newline that `$` permits), or `None` if
+    some sequence can match content ending in any character.
+    """
+    characters = set()
+    for rule in rules:
+        for sequence in rule.sequence_group.sequences:
+            if sequence.ends_with_token:
+                characters.update(ending.rstrip('\n')
+                                  for ending in _sentence_endings)
+            elif sequence.suffix:
+                characters.add(sequence.suffix[-1])
+            else:
+                return None
+    return frozenset(characters)
 
 
 class _Ruleset:
-    """An ordered collection of message generation rules."""
+    """
+    An ordered collection of message generation rules.
+
+    Note
+    ----
+    Rather than trying every rule in turn, a dispatch index is built from the
+    JSON keys and content literals that each rule requires, so that each
+    message is only offered to the rules that can possibly match it.
+
+    Most messages are plain text, whose content ends in none of the
+    characters that content matching any sequence must end with. Such a
+    message without keys that rules are gated on is offered straight to the
+    rules that require no sequence match (the text rule first), without
+    looking for literals in its content.
+
+    These candidate rules are tried in order of precedence, but for rules that
+    exclude each other (see `_Rule.excludes`): which of two such rules is
+    tried first cannot change the outcome, as failed attempts have no side
+    effects. So once the hits of each rule have been counted over the first
+    `_warm_up_message_count` messages, the most frequently hit rules are tried
+    first wherever the precedence of rules that do not exclude them allows.
+
+    This relies on every rule leaving no trace when it returns None: it must
+    not have set any `state` of the chat factory, requested any participant
+    from its `participant_manager` (which creates participants) or called
+    `make_common` (which requests the sender). A rule breaking this would
+    build different chats depending on the order its messages came in.
+    """
     _rules: List[_Rule]
-
-    def __init__(self, rules: List[_Rule]) -> None:
+    _unconditional_mask: int
+    _key_masks: Dict[str, int]
+    _absent_key_masks: Dict[str, int]
+    _literal_masks: List[Tuple[str, int]]
+    _gating_keys: FrozenSet[str]
+    _plain_final_characters: Optional[FrozenSet[str]]
+    _plain_mask: int
+    _candidates: Dict[int, Tuple[_Rule, ...]]
+    _profile: Optional[RuleProfile]
+    _hit_counts: Dict[_Rule, int]
+    _warm_up_remaining: int
+    _exclusions: Optional[Dict[_Rule, FrozenSet[_Rule]]]
+
+    def __init__(self, rules: List[_Rule],
+                 profile: Optional[RuleProfile] = None) -> None:
+        """
+        Index `rules`. If `profile` is given, `apply` records the attempts,
+        hits and time of each rule in it.
+        """
         self._rules = rules
+        self._profile = profile
+        if profile is not None:
+            self.apply = self._profiled_apply  # type: ignore
+        self._unconditional_mask = 0
+        self._key_masks = {}
+        self._absent_key_masks = {}
+        literal_masks: Dict[str, int] = {}
+        self._candidates = {}
+
+        for i, rule in enumerate(rules):
+            bit = 1 << i
+            literals = rule.required_literals()
+            if rule.keys:
+                for key in rule.keys:
+                    self._key_masks[key] = self._key_masks.get(key, 0) | bit
+            elif literals is None:
+                self._unconditional_mask |= bit
+            else:
+                for literal in literals:
+                    literal_masks[literal] = literal_masks.get(literal, 0) | bit
+            for key in rule.absent_keys:
+                self._absent_key_masks[key] = \
+                    self._absent_key_masks.get(key, 0) | bit
+
+        self._literal_masks = list(literal_masks.items())
+
+        self._gating_keys = frozenset(
+            key for key in list(self._key_masks) + list(self._absent_key_masks)
+            if key != 'content')
+        self._plain_final_characters = _final_characters(rules)
+        self._plain_mask = 0
+        for i, rule in enumerate(rules):
+            if not rule.keys and not rule.requires_sequence_match() and \
+                    'content' not in rule.absent_keys:
+                self._plain_mask |= 1 << i
+
+        self._hit_counts = {}
+        self._warm_up_remaining = _warm_up_message_count
+        self._exclusions = None
+        if self._warm_up_remaining > 0:
+            self._apply_after_warm_up = self.apply
+            self.apply = self._warm_up_apply  # type: ignore
+
+    def _is_plain(self, message_json: Dict) -> bool:
+        """
+        Return true if no rule requiring a sequence match or gated on keys
+        can match the message (see the class's note).
+        """
+        content = message_json.get('content')
+        if content is None or self._plain_final_characters is None:
+            return False
+        final_character = content[-2:-1] if content[-1:] == '\n' \
+            else content[-1:]
+        return final_character not in self._plain_final_characters and \
+            self._gating_keys.isdisjoint(message_json)
+
+    def _candidate_rules(self, message_json: Dict) -> Tuple[_Rule, ...]:
+        if self._is_plain(message_json):
+            mask = self._plain_mask
+        else:
+            mask = self._unconditional_mask
+            for key, key_mask in self._key_masks.items():
+                if message_json.get(key) is not None:
+                    mask |= key_mask
+
+            content = message_json.get('content')
+            if content is not None:
+                for literal_mask in [
+                        literal_mask for literal, literal_mask
+                        in self._literal_masks if literal in content]:
+                    mask |= literal_mask
+
+            for key, absent_key_mask in self._absent_key_masks.items():
+                if key in message_json:
+                    mask &= ~absent_key_mask
+
+        candidates = self._candidates.get(mask)
+        if candidates is None:
+            candidates = tuple(rule for i, rule in enumerate(self._rules)
+                               if mask & (1 << i))
+            if self._exclusions is not None:
+                candidates = self._adapted_order(candidates)
+            self._candidates[mask] = candidates
+        return candidates
+
+    def _adapted_order(self, candidates: Tuple[_Rule, ...]
+                       ) -> Tuple[_Rule, ...]:
+        """
+        Order candidate rules by their hits during the warm-up, keeping each
+        after any rule of higher precedence that it does not exclude.
+        """
+        assert self._exclusions is not None
+        pending = list(candidates)
+        ordered = []
+        while pending:
+            ready = [rule for i, rule in enumerate(pending)
+                     if all(earlier_rule in self._exclusions[rule]
+                            for earlier_rule in pending[:i])]
+            # Of equally hit rules, `max` picks that of highest precedence.
+            rule = max(ready, key=lambda rule: self._hit_counts.get(rule, 0))
+            ordered.append(rule)
+            pending.remove(rule)
+        return tuple(ordered)
+
+    def _adapt(self) -> None:
+        """End the warm-up, reordering candidate rules from then on."""
+        self._exclusions = {
+            rule: frozenset(other_rule for other_rule in self._rules
+                            if other_rule is not rule
+                            and rule.excludes(other_rule))
+            for rule in self._rules}
+        self._candidates = {}
+        self.apply = self._apply_after_warm_up  # type: ignore
 
     def apply(self, chat_factory: '_ChatFactory') -> msg.Message:
-        for rule in self._rules:
+        for rule in self._candidate_rules(chat_factory.message_json):
             maybe_message = rule(chat_factory)
             if maybe_message is not None:
                 return maybe_message
 
         return chat_factory.make_common(msg.UnrecognizedMessage)
 
+    def _profiled_apply(self, chat_factory: '_ChatFactory') -> msg.Message:
+        # pylint: disable=protected-access
+        for rule in self._candidate_rules(chat_factory.message_json):
+            start_time = time.perf_counter()
+            maybe_message = rule(chat_factory)
+            self._profile._record_rule(rule, maybe_message is not None,
+                                       time.perf_counter() - start_time)
+            if maybe_message is not None:
+                return maybe_message
+
+        return chat_factory.make_common(msg.UnrecognizedMessage)
+
+    def _warm_up_apply(self, chat_factory: '_ChatFactory') -> msg.Message:
+        # pylint: disable=protected-access
+        maybe_message = None
+        for rule in self._candidate_rules(chat_factory.message_json):
+            if self._profile is None:
+                maybe_message = rule(chat_factory)
+            else:
+                start_time = time.perf_counter()
+                maybe_message = rule(chat_factory)
+                self._profile._record_rule(rule, maybe_message is not None,
+                                           time.perf_counter() - start_time)
+            if maybe_message is not None:
+                self._hit_counts[rule] = self._hit_counts.get(rule, 0) + 1
+                break
+
+        self._warm_up_remaining -= 1
+        if self._warm_up_remaining == 0:
+            self._adapt()
+
+        if maybe_message is None:
+            return chat_factory.make_common(msg.UnrecognizedMessage)
+        return maybe_message
+
 
 _all_rules: List[_Rule] = []
 
 
-def _register_rule() -> Callable[[_Rule], None]:
+def _register_rule(keys: Tuple[str, ...] = (),
+                   absent_keys: Tuple[str, ...] = (), fallback: bool = False,
+                   **sequences: List[_Token]
+                   ) -> Callable[[_RuleFunction], None]:
     """
     Decorator to register a rule in the _all_rules list. The order rules are
     registered in will be their precedence.
+
+    Parameters
+    ----------
+    keys : Tuple[str, ...]
+        JSON keys of which at least one must be present for the rule to apply.
+    absent_keys : Tuple[str, ...]
+        JSON keys which must all be absent for the rule to apply.
+    fallback : bool
+        Set if the rule may return a message even when none of its `sequences`
+        match, so that it is never skipped on account of the content.
+    **sequences : List[_Token]
+        The token sequences that the rule matches against, by name. The rule
+        receives these, compiled to `_TokenSequence` objects, as attributes of
+        its second argument.
     """
-    def inner(rule: _Rule) -> None:
+    def inner(function: _RuleFunction) -> None:
         global _all_rules
-        _all_rules.append(rule)
+        compiled_sequences = SimpleNamespace(**{
+            name: _TokenSequence(tokens) for name, tokens in sequences.items()})
+        _all_rules.append(_Rule(function, compiled_sequences, keys,
+                                absent_keys, fallback))
     return inner
 
 
-@_register_rule()
-def _match_media_message(cf: '_ChatFactory'
+@_register_rule(keys=_media_keys)
+def _match_media_message(cf: '_ChatFactory', seq: _Sequences
                          ) -> Optional[msg.MediaMessage]:
-    if any([cf.message_json.get(key) is not None
-            for key in ['photos', 'gifs', 'audio_files', 'videos', 'sticker',
-                        'files']]):
+    if any([cf.message_json.get(key) is not None for key in _media_keys]):
         message = cf.make_common(msg.MediaMessage)
 
-        message.photos = [media.Photo(json)
-                          for json in cf.message_json.get('photos') or []]
-        message.gifs = [media.Gif(json)
-                        for json in cf.message_json.get('gifs') or []]
-        message.audio_files = [media.AudioFile(
-            json) for json in cf.message_json.get('audio_files') or []]
-        message.videos = [media.Video(json)
-                          for json in cf.message_json.get('videos') or []]
-        message.attachment_files = [media.AttachmentFile(
-            json) for json in cf.message_json.get('files') or []]
+        message.photos = tuple(media.Photo(json)
+                               for json in cf.message_json.get('photos') or [])
+        message.gifs = tuple(media.Gif(json)
+                             for json in cf.message_json.get('gifs') or [])
+        message.audio_files = tuple(media.AudioFile(
+            json) for json in cf.message_json.get('audio_files') or [])
+        message.videos = tuple(media.Video(json)
+                               for json in cf.message_json.get('videos') or [])
+        message.attachment_files = tuple(media.AttachmentFile(
+            json) for json in cf.message_json.get('files') or [])
 
         if cf.message_json.get('sticker') is None:
-            message.stickers = []
+            message.stickers = ()
         else:
-            message.stickers = [media.Sticker(cf.message_json['sticker'])]
+            message.stickers = (media.Sticker(cf.message_json['sticker']),)
 
         return message
     return None
 
 
-@_register_rule()
-def _match_empty_message(cf: '_ChatFactory'
+@_register_rule(absent_keys=('content',))
+def _match_empty_message(cf: '_ChatFactory', seq: _Sequences
                          ) -> Optional[msg.EmptyMessage]:
     if 'content' not in cf.message_json:
         message = cf.make_common(msg.EmptyMessage)
@@ -81,19 +422,21 @@ def _match_empty_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_call_start_message(cf: '_ChatFactory'
+@_register_rule(
+    video=[_Tok.SENDER_ALIAS, r' started a video chat\.'],
+    call=[_Tok.SENDER_ALIAS, r' started a call\.'])
+def _match_call_start_message(cf: '_ChatFactory', seq: _Sequences
                               ) -> Optional[msg.CallStartMessage]:
     if cf.state.call_is_active:
         return None
 
-    if cf.match([_Tok.SENDER_ALIAS, r' started a video chat\.']):
+    if cf.match(seq.video):
         cf.state.call_is_active = True
         message = cf.make_common(msg.CallStartMessage)
         message.call_type = msg.CallType.VIDEO
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, r' started a call\.']):
+    if cf.match(seq.call):
         cf.state.call_is_active = True
         message = cf.make_common(msg.CallStartMessage)
         message.call_type = msg.CallType.CALL
@@ -102,18 +445,20 @@ def _match_call_start_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_call_join_message(cf: '_ChatFactory'
+@_register_rule(
+    video=[_Tok.SENDER_ALIAS, r' joined the video chat\.'],
+    call=[_Tok.SENDER_ALIAS, r' joined the call\.'])
+def _match_call_join_message(cf: '_ChatFactory', seq: _Sequences
                              ) -> Optional[msg.CallJoinMessage]:
     if not cf.state.call_is_active:
         return None
 
-    if cf.match([_Tok.SENDER_ALIAS, r' joined the video chat\.']):
+    if cf.match(seq.video):
         message = cf.make_common(msg.CallJoinMessage)
         message.call_type = msg.CallType.VIDEO
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, r' joined the call\.']):
+    if cf.match(seq.call):
         message = cf.make_common(msg.CallJoinMessage)
         message.call_type = msg.CallType.CALL
         return message
@@ -121,13 +466,14 @@ def _match_call_join_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_call_share_video_message(cf: '_ChatFactory'
+@_register_rule(
+    sharing=[_Tok.SENDER_ALIAS, r' started sharing video\.'])
+def _match_call_share_video_message(cf: '_ChatFactory', seq: _Sequences
                                     ) -> Optional[msg.CallShareVideoMessage]:
     if not cf.state.call_is_active:
         return None
 
-    if cf.match([_Tok.SENDER_ALIAS, r' started sharing video\.']):
+    if cf.match(seq.sharing):
         message = cf.make_common(msg.CallJoinMessage)
         message = cf.make_common(msg.CallShareVideoMessage)
         return message
@@ -135,19 +481,21 @@ def _match_call_share_video_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_call_end_message(cf: '_ChatFactory'
+@_register_rule(
+    video=[r'The video chat ended\.'],
+    call=[r'The call ended\.'])
+def _match_call_end_message(cf: '_ChatFactory', seq: _Sequences
                             ) -> Optional[msg.CallEndMessage]:
     if not cf.state.call_is_active:
         return None
 
-    if cf.match([r'The video chat ended\.']):
+    if cf.match(seq.video):
         cf.state.call_is_active = False
         message = cf.make_common(msg.CallEndMessage)
         message.call_type = msg.CallType.VIDEO
         return message
 
-    if cf.match([r'The call ended\.']):
+    if cf.match(seq.call):
         cf.state.call_is_active = False
         message = cf.make_common(msg.CallEndMessage)
         message.call_type = msg.CallType.CALL
@@ -156,26 +504,34 @@ def _match_call_end_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_nickname_change_message(cf: '_ChatFactory'
+@_register_rule(
+    cleared_own=[_Tok.SENDER_ALIAS,
+                 r' cleared (?:his|her|their) own nickname\.'],
+    cleared_yours=[_Tok.SENDER_ALIAS, r' cleared your nickname\.'],
+    cleared_other=[_Tok.SENDER_ALIAS, ' cleared the nickname for ',
+                   _Tok.PARTICIPANT_NAME],
+    set_other=[_Tok.SENDER_ALIAS, ' set the nickname for ',
+               _Tok.PARTICIPANT_NAME, ' to ', _Tok.ANYTHING],
+    set_yours=[_Tok.SENDER_ALIAS, ' set your nickname to ', _Tok.ANYTHING],
+    set_own=[_Tok.SENDER_ALIAS, ' set (?:his|her|their) own nickname to ',
+             _Tok.ANYTHING])
+def _match_nickname_change_message(cf: '_ChatFactory', seq: _Sequences
                                    ) -> Optional[msg.NicknameChangeMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, r' cleared (?:his|her|their) own nickname\.'
-                 ]):
+    if cf.match(seq.cleared_own):
         message = cf.make_common(msg.NicknameChangeMessage)
         message.new_nickname = None
         message.setter = message.sender
         message.subject = message.sender
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, r' cleared your nickname\.']):
+    if cf.match(seq.cleared_yours):
         message = cf.make_common(msg.NicknameChangeMessage)
         message.new_nickname = None
         message.setter = message.sender
         message.subject = cf.participant_manager.request_me()
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' cleared the nickname for ',
-                 _Tok.PARTICIPANT_NAME]):
+    if cf.match(seq.cleared_other):
         message = cf.make_common(msg.NicknameChangeMessage)
         message.new_nickname = None
         message.setter = message.sender
@@ -183,8 +539,7 @@ def _match_nickname_change_message(cf: '_ChatFactory'
             cf.captures[_Tok.PARTICIPANT_NAME])
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' set the nickname for ',
-                 _Tok.PARTICIPANT_NAME, ' to ', _Tok.ANYTHING]):
+    if cf.match(seq.set_other):
         message = cf.make_common(msg.NicknameChangeMessage)
         message.new_nickname = cf.captures[_Tok.ANYTHING]
         message.setter = message.sender
@@ -192,15 +547,14 @@ def _match_nickname_change_message(cf: '_ChatFactory'
             cf.captures[_Tok.PARTICIPANT_NAME])
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' set your nickname to ', _Tok.ANYTHING]):
+    if cf.match(seq.set_yours):
         message = cf.make_common(msg.NicknameChangeMessage)
         message.new_nickname = cf.captures[_Tok.ANYTHING]
         message.setter = message.sender
         message.subject = cf.participant_manager.request_me()
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' set (?:his|her|their) own nickname to ',
-                 _Tok.ANYTHING]):
+    if cf.match(seq.set_own):
         message = cf.make_common(msg.NicknameChangeMessage)
         message.new_nickname = cf.captures[_Tok.ANYTHING]
         message.setter = message.sender
@@ -210,10 +564,21 @@ def _match_nickname_change_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
+@_register_rule(
+    name=[_Tok.SENDER_ALIAS, ' named the group ', _Tok.ANYTHING],
+    photo=[_Tok.SENDER_ALIAS, r' changed the group photo\.'],
+    theme=[_Tok.SENDER_ALIAS, r' changed the chat theme\.'],
+    emoji=[_Tok.SENDER_ALIAS, ' set the emoji to ', _Tok.EMOJI],
+    approval_on=[_Tok.SENDER_ALIAS,
+                 r' turned on member approval and will review requests to join'
+                 r' the group\.'],
+    approval_off=[_Tok.SENDER_ALIAS,
+                  r' turned off member approval\. Anyone with the link can join'
+                  r' the group\.'])
 def _match_chat_settings_change_message(
-        cf: '_ChatFactory') -> Optional[msg.ChatSettingsChangeMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, ' named the group ', _Tok.ANYTHING]):
+        cf: '_ChatFactory', seq: _Sequences
+        ) -> Optional[msg.ChatSettingsChangeMessage]:
+    if cf.match(seq.name):
         message = cf.make_common(msg.ChatSettingsChangeMessage)
         message.settings_type = msg.ChatSettingsType.CHANGE_NAME
         message.new_name = cf.captures[_Tok.ANYTHING]
@@ -221,7 +586,7 @@ def _match_chat_settings_change_message(
         message.new_approval_is_required_policy = None
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, r' changed the group photo\.']):
+    if cf.match(seq.photo):
         message = cf.make_common(msg.ChatSettingsChangeMessage)
         message.settings_type = msg.ChatSettingsType.CHANGE_PHOTO
         message.new_name = None
@@ -229,7 +594,7 @@ def _match_chat_settings_change_message(
         message.new_approval_is_required_policy = None
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, r' changed the chat theme\.']):
+    if cf.match(seq.theme):
         message = cf.make_common(msg.ChatSettingsChangeMessage)
         message.settings_type = msg.ChatSettingsType.CHANGE_THEME
         message.new_name = None
@@ -237,7 +602,7 @@ def _match_chat_settings_change_message(
         message.new_approval_is_required_policy = None
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' set the emoji to ', _Tok.EMOJI]):
+    if cf.match(seq.emoji):
         message = cf.make_common(msg.ChatSettingsChangeMessage)
         message.settings_type = msg.ChatSettingsType.CHANGE_EMOJI
         message.new_name = None
@@ -245,9 +610,7 @@ def _match_chat_settings_change_message(
         message.new_approval_is_required_policy = None
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS,
-                 r' turned on member approval and will review requests to join'
-                 r' the group\.']):
+    if cf.match(seq.approval_on):
         message = cf.make_common(msg.ChatSettingsChangeMessage)
         message.settings_type = msg.ChatSettingsType.CHANGE_MEMBERSHIP_POLICY
         message.new_name = None
@@ -255,9 +618,7 @@ def _match_chat_settings_change_message(
         message.new_approval_is_required_policy = True
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS,
-                 r' turned off member approval\. Anyone with the link can join'
-                 r' the group\.']):
+    if cf.match(seq.approval_off):
         message = cf.make_common(msg.ChatSettingsChangeMessage)
         message.settings_type = msg.ChatSettingsType.CHANGE_MEMBERSHIP_POLICY
         message.new_name = None
@@ -268,13 +629,14 @@ def _match_chat_settings_change_message(
     return None
 
 
-@_register_rule()
-def _match_plan_creation_message(cf: '_ChatFactory'
+@_register_rule(
+    started=[_Tok.SENDER_ALIAS, r' started a plan\.'])
+def _match_plan_creation_message(cf: '_ChatFactory', seq: _Sequences
                                  ) -> Optional[msg.PlanCreationMessage]:
     if cf.state.plan_is_active:
         return None
 
-    if cf.match([_Tok.SENDER_ALIAS, r' started a plan\.']):
+    if cf.match(seq.started):
         cf.state.plan_is_active = True
 
         message = cf.make_common(msg.PlanCreationMessage)
@@ -283,20 +645,22 @@ def _match_plan_creation_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_plan_update_message(cf: '_ChatFactory'
+@_register_rule(
+    title=[_Tok.SENDER_ALIAS, ' named the plan ', _Tok.ANYTHING],
+    date_time=[_Tok.SENDER_ALIAS, ' updated the plan to ',
+               _Tok.PLAN_DATE_TIME])
+def _match_plan_update_message(cf: '_ChatFactory', seq: _Sequences
                                ) -> Optional[msg.PlanUpdateMessage]:
     if not cf.state.plan_is_active:
         return None
 
-    if cf.match([_Tok.SENDER_ALIAS, ' named the plan ', _Tok.ANYTHING]):
+    if cf.match(seq.title):
         message = cf.make_common(msg.PlanUpdateMessage)
         message.new_plan_title = cf.captures[_Tok.ANYTHING]
         message.new_plan_date_time = None
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' updated the plan to ',
-                 _Tok.PLAN_DATE_TIME]):
+    if cf.match(seq.date_time):
         message = cf.make_common(msg.PlanUpdateMessage)
         message.new_plan_title = None
         message.new_plan_date_time = cf.captures[_Tok.PLAN_DATE_TIME]
@@ -305,22 +669,24 @@ def _match_plan_update_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_plan_deletion_message(cf: '_ChatFactory'
+@_register_rule(
+    titled=[_Tok.SENDER_ALIAS, ' deleted the plan ', _Tok.PLAN_TITLE, ' for ',
+            _Tok.PLAN_DATE_TIME],
+    untitled=[_Tok.SENDER_ALIAS, ' deleted the plan for ',
+              _Tok.PLAN_DATE_TIME])
+def _match_plan_deletion_message(cf: '_ChatFactory', seq: _Sequences
                                  ) -> Optional[msg.PlanDeletionMessage]:
     if not cf.state.plan_is_active:
         return None
 
-    if cf.match([_Tok.SENDER_ALIAS, ' deleted the plan ', _Tok.PLAN_TITLE,
-                 ' for ',  _Tok.PLAN_DATE_TIME]):
+    if cf.match(seq.titled):
         cf.state.plan_is_active = False
         message = cf.make_common(msg.PlanDeletionMessage)
         message.plan_title = cf.captures[_Tok.PLAN_TITLE]
         message.plan_date_time = cf.captures[_Tok.PLAN_DATE_TIME]
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' deleted the plan for ',
-                 _Tok.PLAN_DATE_TIME]):
+    if cf.match(seq.untitled):
         cf.state.plan_is_active = False
         message = cf.make_common(msg.PlanDeletionMessage)
         message.plan_title = None
@@ -330,41 +696,46 @@ def _match_plan_deletion_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_plan_respondency_message(cf: '_ChatFactory'
+@_register_rule(
+    responded=[_Tok.SENDER_ALIAS, ' responded '])
+def _match_plan_respondency_message(cf: '_ChatFactory', seq: _Sequences
                                     ) -> Optional[msg.PlanRespondencyMessage]:
     if not cf.state.plan_is_active:
         return None
 
-    if cf.match([_Tok.SENDER_ALIAS, ' responded ']):
+    if cf.match(seq.responded):
         message = cf.make_common(msg.PlanRespondencyMessage)
         return message
 
     return None
 
 
-@_register_rule()
-def _match_plan_reminder_message(cf: '_ChatFactory'
+@_register_rule(
+    untitled=['Reminder, 30 minutes until ', _Tok.PLAN_TIME, r'\.'],
+    titled=['Reminder, 30 minutes until ', _Tok.PLAN_TITLE, ' at ',
+            _Tok.PLAN_TIME],
+    concurrent_untitled=['Reminder at ', _Tok.PLAN_TIME, r'\.'],
+    concurrent_titled=['Reminder, ', _Tok.PLAN_TITLE, ' at ', _Tok.PLAN_TIME])
+def _match_plan_reminder_message(cf: '_ChatFactory', seq: _Sequences
                                  ) -> Optional[msg.PlanReminderMessage]:
     if not cf.state.plan_is_active:
         return None
 
-    if cf.match(['Reminder, 30 minutes until ', _Tok.PLAN_TIME, r'\.']):
+    if cf.match(seq.untitled):
         message = cf.make_common(msg.PlanReminderMessage)
         message.is_concurrent = False
         message.plan_title = None
         message.plan_hour = cf.captures[_Tok.PLAN_TIME]
         return message
 
-    if cf.match(['Reminder, 30 minutes until ', _Tok.PLAN_TITLE, ' at ',
-                 _Tok.PLAN_TIME]):
+    if cf.match(seq.titled):
         message = cf.make_common(msg.PlanReminderMessage)
         message.is_concurrent = False
         message.plan_title = cf.captures[_Tok.PLAN_TITLE]
         message.plan_hour = cf.captures[_Tok.PLAN_TIME]
         return message
 
-    if cf.match(['Reminder at ', _Tok.PLAN_TIME, r'\.']):
+    if cf.match(seq.concurrent_untitled):
         cf.state.plan_is_active = False
         message = cf.make_common(msg.PlanReminderMessage)
         message.is_concurrent = True
@@ -372,7 +743,7 @@ def _match_plan_reminder_message(cf: '_ChatFactory'
         message.plan_hour = cf.captures[_Tok.PLAN_TIME]
         return message
 
-    if cf.match(['Reminder, ', _Tok.PLAN_TITLE, ' at ', _Tok.PLAN_TIME]):
+    if cf.match(seq.concurrent_titled):
         cf.state.plan_is_active = False
         message = cf.make_common(msg.PlanReminderMessage)
         message.is_concurrent = True
@@ -383,10 +754,11 @@ def _match_plan_reminder_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_poll_creation_message(cf: '_ChatFactory'
+@_register_rule(
+    created=[_Tok.SENDER_ALIAS, ' created a poll: ', _Tok.ANYTHING])
+def _match_poll_creation_message(cf: '_ChatFactory', seq: _Sequences
                                  ) -> Optional[msg.PollCreationMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, ' created a poll: ', _Tok.ANYTHING]):
+    if cf.match(seq.created):
         message = cf.make_common(msg.PollCreationMessage)
         message.poll_name = cf.captures[_Tok.ANYTHING]
         return message
@@ -394,19 +766,22 @@ def _match_poll_creation_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_poll_add_vote_message(cf: '_ChatFactory'
+@_register_rule(
+    with_others=[_Tok.SENDER_ALIAS, ' voted for "', _Tok.POLL_OPTION,
+                 '" and ', _Tok.NUMBER, ' other options? in the poll: ',
+                 _Tok.POLL_NAME],
+    alone=[_Tok.SENDER_ALIAS, ' voted for "', _Tok.POLL_OPTION,
+           '" in the poll: ', _Tok.POLL_NAME])
+def _match_poll_add_vote_message(cf: '_ChatFactory', seq: _Sequences
                                  ) -> Optional[msg.PollAddVoteMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, ' voted for "', _Tok.POLL_OPTION, '" and ',
-                 _Tok.NUMBER, ' other options? in the poll: ', _Tok.POLL_NAME]):
+    if cf.match(seq.with_others):
         message = cf.make_common(msg.PollAddVoteMessage)
         message.poll_name = cf.captures[_Tok.POLL_NAME]
         message.vote_option = cf.captures[_Tok.POLL_OPTION]
         message.hidden_vote_count = int(cf.captures[_Tok.NUMBER])
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' voted for "', _Tok.POLL_OPTION,
-                 '" in the poll: ', _Tok.POLL_NAME]):
+    if cf.match(seq.alone):
         message = cf.make_common(msg.PollAddVoteMessage)
         message.poll_name = cf.captures[_Tok.POLL_NAME]
         message.vote_option = cf.captures[_Tok.POLL_OPTION]
@@ -416,22 +791,23 @@ def _match_poll_add_vote_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_poll_remove_vote_message(cf: '_ChatFactory'
-                                    ) -> Optional[msg.PollRemoveVoteMessage]:
-    if cf.match([_Tok.SENDER_ALIAS,
+@_register_rule(
+    with_others=[_Tok.SENDER_ALIAS,
                  ' removed (?:your |his |her |their )?vote for "',
                  _Tok.POLL_OPTION, '" and ', _Tok.NUMBER,
-                 ' other options? in the poll: ', _Tok.POLL_NAME]):
+                 ' other options? in the poll: ', _Tok.POLL_NAME],
+    alone=[_Tok.SENDER_ALIAS, ' removed (?:your |his |her |their )?vote for "',
+           _Tok.POLL_OPTION, '" in the poll: ', _Tok.POLL_NAME])
+def _match_poll_remove_vote_message(cf: '_ChatFactory', seq: _Sequences
+                                    ) -> Optional[msg.PollRemoveVoteMessage]:
+    if cf.match(seq.with_others):
         message = cf.make_common(msg.PollRemoveVoteMessage)
         message.poll_name = cf.captures[_Tok.POLL_NAME]
         message.vote_option = cf.captures[_Tok.POLL_OPTION]
         message.hidden_vote_count = int(cf.captures[_Tok.NUMBER])
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS,
-                 ' removed (?:your |his |her |their )?vote for "',
-                 _Tok.POLL_OPTION, '" in the poll: ', _Tok.POLL_NAME]):
+    if cf.match(seq.alone):
         message = cf.make_common(msg.PollRemoveVoteMessage)
         message.poll_name = cf.captures[_Tok.POLL_NAME]
         message.vote_option = cf.captures[_Tok.POLL_OPTION]
@@ -441,12 +817,12 @@ def _match_poll_remove_vote_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_poll_change_vote_message(cf: '_ChatFactory'
+@_register_rule(
+    changed=[_Tok.SENDER_ALIAS, ' changed (?:your |his |her |their )?vote to "',
+             _Tok.POLL_OPTION, ' in the poll: ', _Tok.POLL_NAME])
+def _match_poll_change_vote_message(cf: '_ChatFactory', seq: _Sequences
                                     ) -> Optional[msg.PollChangeVoteMessage]:
-    if cf.match([_Tok.SENDER_ALIAS,
-                 ' changed (?:your |his |her |their )?vote to "',
-                 _Tok.POLL_OPTION, ' in the poll: ', _Tok.POLL_NAME]):
+    if cf.match(seq.changed):
         message = cf.make_common(msg.PollChangeVoteMessage)
         message.poll_name = cf.captures[_Tok.POLL_NAME]
         message.vote_option = cf.captures[_Tok.POLL_OPTION]
@@ -455,21 +831,23 @@ def _match_poll_change_vote_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_poll_expired_message(cf: '_ChatFactory'
+@_register_rule(
+    expired=[r'This poll is no longer available\.'])
+def _match_poll_expired_message(cf: '_ChatFactory', seq: _Sequences
                                 ) -> Optional[msg.PollExpiredMessage]:
-    if cf.match([r'This poll is no longer available\.']):
+    if cf.match(seq.expired):
         message = cf.make_common(msg.PollExpiredMessage)
         return message
 
     return None
 
 
-@_register_rule()
-def _match_admin_add_message(cf: '_ChatFactory'
+@_register_rule(
+    added=[_Tok.SENDER_ALIAS, ' added ', _Tok.PARTICIPANT_NAME,
+           r' as a group admin\.'])
+def _match_admin_add_message(cf: '_ChatFactory', seq: _Sequences
                              ) -> Optional[msg.AdminAddMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, ' added ', _Tok.PARTICIPANT_NAME,
-                 r' as a group admin\.']):
+    if cf.match(seq.added):
         message = cf.make_common(msg.AdminAddMessage)
         message.instigator = message.sender
         message.subject = cf.participant_manager.request_participant(
@@ -479,11 +857,12 @@ def _match_admin_add_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_admin_remove_message(cf: '_ChatFactory'
+@_register_rule(
+    removed=[_Tok.SENDER_ALIAS, ' removed ', _Tok.PARTICIPANT_NAME,
+             r' as a group admin\.'])
+def _match_admin_remove_message(cf: '_ChatFactory', seq: _Sequences
                                 ) -> Optional[msg.AdminRemoveMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, ' removed ', _Tok.PARTICIPANT_NAME,
-                 r' as a group admin\.']):
+    if cf.match(seq.removed):
         message = cf.make_common(msg.AdminRemoveMessage)
         message.instigator = message.sender
         message.subject = cf.participant_manager.request_participant(
@@ -493,20 +872,22 @@ def _match_admin_remove_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
-def _match_app_new_score_message(cf: '_ChatFactory'
+@_register_rule(
+    scored=[_Tok.SENDER_ALIAS, '(?: just)? scored ', _Tok.APP_SCORE,
+            ' (?:point |points )?(?:in|playing) ', _Tok.APP_NAME],
+    personal_best=[_Tok.SENDER_ALIAS, ' set a new personal best of ',
+                   _Tok.APP_SCORE, ' (?:point |points )?(?:in|playing) ',
+                   _Tok.APP_NAME])
+def _match_app_new_score_message(cf: '_ChatFactory', seq: _Sequences
                                  ) -> Optional[msg.AppNewScoreMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, '(?: just)? scored ', _Tok.APP_SCORE,
-                 ' (?:point |points )?(?:in|playing) ', _Tok.APP_NAME]):
+    if cf.match(seq.scored):
         message = cf.make_common(msg.AppNewScoreMessage)
         message.app_name = cf.captures[_Tok.APP_NAME]
         message.score = cf.captures[_Tok.APP_SCORE]
         message.personal_best = False
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' set a new personal best of ',
-                 _Tok.APP_SCORE, ' (?:point |points )?(?:in|playing) ',
-                 _Tok.APP_NAME]):
+    if cf.match(seq.personal_best):
         message = cf.make_common(msg.AppNewScoreMessage)
         message.app_name = cf.captures[_Tok.APP_NAME]
         message.score = cf.captures[_Tok.APP_SCORE]
@@ -516,18 +897,21 @@ def _match_app_new_score_message(cf: '_ChatFactory'
     return None
 
 
-@_register_rule()
+@_register_rule(
+    moved_up=[_Tok.SENDER_ALIAS, ' moved up the leaderboard in ',
+              _Tok.APP_NAME],
+    first_place=[_Tok.SENDER_ALIAS, ' is now in first place in ',
+                 _Tok.APP_NAME])
 def _match_app_leaderboard_reshuffle_message(
-        cf: '_ChatFactory') -> Optional[msg.AppLeaderboardReshuffleMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, ' moved up the leaderboard in ',
-                 _Tok.APP_NAME]):
+        cf: '_ChatFactory', seq: _Sequences
+        ) -> Optional[msg.AppLeaderboardReshuffleMessage]:
+    if cf.match(seq.moved_up):
         message = cf.make_common(msg.AppLeaderboardReshuffleMessage)
         message.app_name = cf.captures[_Tok.APP_NAME]
         message.now_in_first_place = False
         return message
 
-    if cf.match([_Tok.SENDER_ALIAS, ' is now in first place in ', _Tok.APP_NAME
-                 ]):
+    if cf.match(seq.first_place):
         message = cf.make_common(msg.AppLeaderboardReshuffleMessage)
         message.app_name = cf.captures[_Tok.APP_NAME]
         message.now_in_first_place = True
@@ -536,10 +920,11 @@ def _match_app_leaderboard_reshuffle_message(
     return None
 
 
-@_register_rule()
-def _match_app_challenge_message(cf: '_ChatFactory'
+@_register_rule(
+    challenged=[_Tok.SENDER_ALIAS, ' challenged you in ', _Tok.APP_NAME])
+def _match_app_challenge_message(cf: '_ChatFactory', seq: _Sequences
                                  ) -> Optional[msg.AppChallengeMessage]:
-    if cf.match([_Tok.SENDER_ALIAS, ' challenged you in ', _Tok.APP_NAME]):
+    if cf.match(seq.challenged):
         message = cf.make_common(msg.AppChallengeMessage)
         message.app_name = cf.captures[_Tok.APP_NAME]
         return message
@@ -548,14 +933,14 @@ def _match_app_challenge_message(cf: '_ChatFactory'
 
 
 @_register_rule()
-def _match_text_message(cf: '_ChatFactory'
+def _match_text_message(cf: '_ChatFactory', seq: _Sequences
                         ) -> Optional[msg.TextMessage]:
     message = cf.make_common(msg.TextMessage)
     return message
 
 
 @_register_rule()
-def _match_subscribe_message(cf: '_ChatFactory'
+def _match_subscribe_message(cf: '_ChatFactory', seq: _Sequences
                              ) -> Optional[msg.SubscribeMessage]:
     message = cf.make_common(msg.SubscribeMessage)
     message.inviter = message.sender
@@ -565,10 +950,12 @@ def _match_subscribe_message(cf: '_ChatFactory'
     return message
 
 
-@_register_rule()
-def _match_unsubscribe_message(cf: '_ChatFactory'
+@_register_rule(
+    fallback=True,
+    left=[_Tok.PARTICIPANT_NAME, r' left the group\.'])
+def _match_unsubscribe_message(cf: '_ChatFactory', seq: _Sequences
                                ) -> Optional[msg.UnsubscribeMessage]:
-    if cf.match([_Tok.PARTICIPANT_NAME, r' left the group\.']):
+    if cf.match(seq.left):
         message = cf.make_common(msg.UnsubscribeMessage)
         message.removed_self = True
         message.removalist = message.sender
@@ -587,10 +974,11 @@ def _match_unsubscribe_message(cf: '_ChatFactory'
     return message
 
 
-@_register_rule()
-def _match_wave_message(cf: '_ChatFactory'
+@_register_rule(
+    waved=[_Tok.PARTICIPANT_FIRST_NAME, r' waved hello to the group\.'])
+def _match_wave_message(cf: '_ChatFactory', seq: _Sequences
                         ) -> Optional[msg.WaveMessage]:
-    if cf.match([_Tok.PARTICIPANT_FIRST_NAME, r' waved hello to the group\.']):
+    if cf.match(seq.waved):
         message = cf.make_common(msg.WaveMessage)
         return message
 
@@ -598,7 +986,7 @@ def _match_wave_message(cf: '_ChatFactory'
 
 
 @_register_rule()
-def _match_link_message(cf: '_ChatFactory'
+def _match_link_message(cf: '_ChatFactory', seq: _Sequences
                         ) -> Optional[msg.LinkMessage]:
     message = cf.make_common(msg.LinkMessage)
     if 'share' in cf.message_json:
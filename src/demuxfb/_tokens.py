@@ -2,8 +2,8 @@
 Module defining 'tokens' and their associated methods. Tokens are used to define
 the string matching rules for message generation.
 """
-from typing import Union, Sequence, Optional, Dict, List, Pattern, Type, Set, DefaultDict
-from collections import defaultdict
+from typing import (Union, Sequence, Optional, Dict, List, Pattern, Type, Set,
+                    Hashable, Tuple)
 from enum import Enum, auto
 import re
 
@@ -53,6 +53,347 @@ _Token = Union[_Tok, str]
 _Captures = Dict[Type[_Tok], Union[str, List[str]]]
 
 
+# A `{m,n}` quantifier (a `{` that does not start one is a literal character).
+_quantifier = re.compile(r'\{(?:\d+(?:,\d*)?|,\d+)\}')
+
+
+def _literal_runs(fragment: str) -> Optional[List[str]]:
+    """
+    Return the runs of plain characters that any string matched by the regex
+    `fragment` must contain, or `None` if the fragment has a top-level
+    alternation (in which case nothing is guaranteed).
+    """
+    runs = []
+    run = ''
+    i = 0
+    while i < len(fragment):
+        char = fragment[i]
+        if char in '([':
+            # Skip over the group or set; none of it is guaranteed to appear
+            # literally.
+            runs.append(run)
+            run = ''
+            depth = 0
+            while i < len(fragment):
+                if fragment[i] == '\\':
+                    i += 1
+                elif fragment[i] in '([':
+                    depth += 1
+                elif fragment[i] in ')]':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            i += 1
+            continue
+        if char == '|':
+            return None
+        quantifier = _quantifier.match(fragment, i) if char == '{' else None
+        if char in '?*' or quantifier is not None:
+            # The previous character was optional or repeated.
+            runs.append(run[:-1])
+            run = ''
+            if quantifier is not None:
+                i = quantifier.end()
+                continue
+        elif char == '+':
+            runs.append(run)
+            run = ''
+        elif char in '.^$':
+            runs.append(run)
+            run = ''
+        elif char == '\\':
+            i += 1
+            escaped = fragment[i]
+            if escaped.isalnum():
+                runs.append(run)
+                run = ''
+            else:
+                run += escaped
+        else:
+            run += char
+        i += 1
+    runs.append(run)
+    return runs
+
+
+def _required_literal(tokens: Sequence[_Token]) -> str:
+    """
+    Return the longest plain substring that any content matching `tokens` must
+    contain, or the empty string if there is none.
+    """
+    literal = ''
+    fragment = ''
+    for token in list(tokens) + [_Tok.ANYTHING]:
+        if isinstance(token, _Tok):
+            runs = _literal_runs(fragment)
+            if runs is None:
+                return ''
+            literal = max([literal] + runs, key=len)
+            fragment = ''
+        else:
+            fragment += token
+    return literal
+
+
+def _literal_affixes(tokens: Sequence[_Token]) -> Tuple[str, str]:
+    """
+    Return the plain prefix and suffix that any content matching `tokens` must
+    start and end with (the suffix possibly followed by the newline that `$`
+    permits), either of which may be empty.
+    """
+    prefix = ''
+    if isinstance(tokens[0], str):
+        runs = _literal_runs(tokens[0])
+        if runs is not None:
+            prefix = runs[0]
+
+    suffix = ''
+    if isinstance(tokens[-1], str):
+        runs = _literal_runs(tokens[-1])
+        if runs is not None and '\n' not in runs[-1]:
+            suffix = runs[-1]
+
+    return prefix, suffix
+
+
+# The endings that a string matching a sequence ending in a special token must
+# have (see `_TokenMatcher.match`), allowing for the trailing newline that `$`
+# permits.
+_sentence_endings = ('.', '!', '?', '.\n', '!\n', '?\n')
+
+
+def _sequence_pattern(tokens: Sequence[_Token], token_patterns: Dict[_Tok, str]
+                      ) -> str:
+    """
+    Return the regex pattern for `tokens` under `token_patterns`,
+    sanity-checking the string literals.
+
+    Where `tokens` ends in a special token, the pattern implements the handling
+    of Facebook-inserted dots described in `_TokenMatcher.match`, and is an
+    alternation of two copies of the sequence. The first is wrapped in a
+    capturing group, and matches when the dot is stripped; the second matches
+    the content in full.
+    """
+    body = ''
+    for token in tokens:
+        if isinstance(token, _Tok):
+            body += token_patterns[token]
+        else:
+            # Unescaped dots in literals are probably accidental typos --
+            # they should be escaped in the source.
+            if re.search(r'[^\\]\.', token) is not None:
+                raise Exception('Literal Token contains unescaped dot: '
+                                + str(token))
+            # Capturing groups in literals violate contracts (see
+            # `_TokenMatcher.match`).
+            if re.search(r'\([^?]', token) is not None:
+                raise Exception('Literal Token contains capturing group: '
+                                + str(token))
+            body += token
+
+    if not isinstance(tokens[-1], _Tok):
+        return '^' + body + '$'
+
+    # The lookbehinds reproduce the conditions for the dot to be stripped (it
+    # follows a character other than '.!?') and for the content to match at all
+    # (it ends in one of '.!?'), allowing for the trailing newline that `$`
+    # permits.
+    stripped = body + r'(?:\n?(?<=[^.!?])\.|(?<=[^.!?]\.)\n)\Z'
+    unstripped = body + r'(?:(?<=[.!?])\n?|(?<=[.!?]\n))\Z'
+    return '^(?:(' + stripped + ')|' + unstripped + ')'
+
+
+class _TokenSequence:
+    """
+    A sequence of tokens to match strings against, compiled ahead of time.
+
+    Attributes
+    ----------
+    tokens : Tuple[_Token, ...]
+        The tokens. `str`-typed elements must contain no capturing groups.
+    special_tokens : Tuple[_Tok, ...]
+        The non-literal tokens, in order, each matched by one regex group.
+    ends_with_token : bool
+        Whether the last token is a special token (see `_TokenMatcher.match`
+        for why this matters).
+    required_literal : str
+        The longest plain substring of any string the sequence can match.
+    prefix : str
+        The plain prefix of any string the sequence can match.
+    suffix : str
+        The plain suffix of any string the sequence can match, but for a
+        trailing newline.
+    pattern : Pattern
+        The compiled regex for the sequence under the initial token patterns.
+    """
+    tokens: Tuple[_Token, ...]
+    special_tokens: Tuple[_Tok, ...]
+    ends_with_token: bool
+    required_literal: str
+    prefix: str
+    suffix: str
+    pattern: Pattern
+    _distinct: bool
+
+    def __init__(self, tokens: Sequence[_Token]) -> None:
+        self.tokens = tuple(tokens)
+        self.special_tokens = tuple(token for token in tokens
+                                    if isinstance(token, _Tok))
+        self.ends_with_token = isinstance(tokens[-1], _Tok)
+        self.required_literal = _required_literal(tokens)
+        self.prefix, self.suffix = _literal_affixes(tokens)
+        self.pattern = self.compile(_initial_token_patterns)
+        self._distinct = len(set(self.special_tokens)) == len(
+            self.special_tokens)
+
+    def excludes(self, other: '_TokenSequence') -> bool:
+        """
+        Return true if no string can match both this sequence and `other`,
+        under any token patterns, as shown by their plain prefixes or
+        suffixes being incompatible.
+        """
+        return not (self.prefix.startswith(other.prefix)
+                    or other.prefix.startswith(self.prefix)) or \
+            not (self.suffix.endswith(other.suffix)
+                 or other.suffix.endswith(self.suffix))
+
+    def compile(self, token_patterns: Dict[_Tok, str]) -> Pattern:
+        """Compile the sequence's regex under `token_patterns`."""
+        return re.compile(_sequence_pattern(self.tokens, token_patterns))
+
+    def captures(self, groups: Sequence[Optional[str]]) -> _Captures:
+        """
+        Collect the groups matched by the sequence's pattern into a captures
+        object (see `_Captures`). Surplus trailing groups are ignored.
+        """
+        if self.ends_with_token:
+            # Pick out the groups of whichever alternative matched (see
+            # `_sequence_pattern`).
+            token_count = len(self.special_tokens)
+            if groups[0] is not None:
+                groups = groups[1:1 + token_count]
+            else:
+                groups = groups[1 + token_count:]
+
+        if self._distinct:
+            return dict(zip(self.special_tokens, groups))
+
+        captures = {}
+        for token, capture in zip(self.special_tokens, groups):
+            if token not in captures:
+                captures[token] = capture
+            elif isinstance(captures[token], str):
+                captures[token] = [captures[token], capture]
+            else:
+                captures[token].append(capture)
+        return captures
+
+
+class _CombinedPattern:
+    """
+    A regex that matches any of several token sequences, reporting which one
+    matched first (see `_TokenMatcher.match_any`).
+    """
+    _pattern: Pattern
+    _alternatives: Dict[str, Tuple[int, int, _TokenSequence]]
+
+    def __init__(self, alternatives: Sequence[Tuple[int, _TokenSequence]],
+                 token_patterns: Dict[_Tok, str]) -> None:
+        """
+        Parameters
+        ----------
+        alternatives : Sequence[Tuple[int, _TokenSequence]]
+            The index and each sequence, in order of precedence.
+        token_patterns : Dict[_Tok, str]
+            The token patterns to compile the sequences under.
+        """
+        self._pattern = re.compile('|'.join(
+            '(?P<_' + str(index) + '>'
+            + _sequence_pattern(sequence.tokens, token_patterns) + ')'
+            for index, sequence in alternatives))
+        # The group named after the sequence is followed by the groups of the
+        # sequence's own pattern.
+        self._alternatives = {}
+        for index, sequence in alternatives:
+            name = '_' + str(index)
+            self._alternatives[name] = (index, self._pattern.groupindex[name],
+                                        sequence)
+
+    def search(self, string: str) -> Optional[Tuple[int, _Captures]]:
+        """
+        Return the index of the first sequence matching `string`, together with
+        the captures from the match, or `None` if no sequence matches.
+        """
+        res = self._pattern.search(string)
+        if not res:
+            return None
+
+        # The outer group of the matching alternative is the last to close.
+        index, first_group, sequence = self._alternatives[res.lastgroup]
+        return index, sequence.captures(res.groups()[first_group:])
+
+
+class _TokenSequenceGroup:
+    """
+    An ordered group of token sequences to be matched in one go (see
+    `_TokenMatcher.match_any`), compiled ahead of time.
+
+    Attributes
+    ----------
+    sequences : Tuple[_TokenSequence, ...]
+        The sequences, in order of precedence.
+    positions : Dict[_TokenSequence, int]
+        The index of each sequence in `sequences`.
+    all_indices : Tuple[int, ...]
+        The indices of all of the sequences.
+    undotted_indices : Tuple[int, ...]
+        The indices of the sequences ending in a literal.
+    literals : Tuple[str, ...]
+        The required literal of each sequence (see `_TokenSequence`).
+    patterns : Dict[Tuple[int, ...], _CombinedPattern]
+        Combined patterns for the sequences at various tuples of indices,
+        under the initial token patterns, compiled as they are needed.
+    """
+    sequences: Tuple[_TokenSequence, ...]
+    positions: Dict[_TokenSequence, int]
+    all_indices: Tuple[int, ...]
+    undotted_indices: Tuple[int, ...]
+    literals: Tuple[str, ...]
+    patterns: Dict[Tuple[int, ...], _CombinedPattern]
+
+    def __init__(self, sequences: Sequence[_TokenSequence]) -> None:
+        self.sequences = tuple(sequences)
+        self.positions = {sequence: i for i, sequence
+                          in enumerate(self.sequences)}
+        self.all_indices = tuple(range(len(self.sequences)))
+        self.undotted_indices = tuple(i for i in self.all_indices
+                                      if not self.sequences[i].ends_with_token)
+        self.literals = tuple(sequence.required_literal
+                              for sequence in self.sequences)
+        self.patterns = {}
+
+    def candidate_indices(self, string: str) -> Tuple[int, ...]:
+        """
+        Return the indices of the sequences which can possibly match `string`,
+        judging by their required literals and endings.
+        """
+        literals = self.literals
+        indices = self.all_indices
+        if not string.endswith(_sentence_endings):
+            indices = self.undotted_indices
+        return tuple(i for i in indices if literals[i] in string)
+
+    def compile(self, indices: Tuple[int, ...], token_patterns: Dict[_Tok, str]
+                ) -> _CombinedPattern:
+        """
+        Compile the sequences at `indices` into one pattern under
+        `token_patterns`.
+        """
+        return _CombinedPattern([(i, self.sequences[i]) for i in indices],
+                                token_patterns)
+
+
 class _TokenMatcher:
     """
     _TokenMatcher objects track the state of token definitions, and are used to
@@ -61,57 +402,47 @@ class _TokenMatcher:
 
     Note
     ----
-    This class caches compiled patterns for a small speedup.
+    Token sequences are compiled once, under the initial token patterns. This
+    class only recompiles (and caches) the patterns of sequences whose tokens
+    have since been updated.
     """
     _token_patterns: Dict[_Tok, str]
-    _cached_sequence_patterns: Dict[int, Pattern]
-    _cache_sequence_dependency: DefaultDict[_Tok, Set[int]]
+    _updated_tokens: Set[_Tok]
+    _recompiled_patterns: Dict[Hashable, Union[Pattern, _CombinedPattern]]
 
     def __init__(self) -> None:
-        self._token_patterns = _initial_token_patterns
-        self._cached_sequence_patterns = {}
-        self._cache_sequence_dependency = defaultdict(set)
-
-    def _compile_pattern(self, tokens: Sequence[_Token],
-                         sequence_cache_id: Optional[int] = None) -> Pattern:
-        # Check the cache first.
-        if sequence_cache_id is not None:
-            cached_compiled_pattern = self._cached_sequence_patterns.get(
-                sequence_cache_id)
-            if cached_compiled_pattern is not None:
-                return cached_compiled_pattern
-
-        # Compile the pattern, sanity-check the string literals, and keep track
-        # of non-literals in an array `special_tokens`
-        special_tokens = []
-        pattern = '^'
-        for token in tokens:
-            if isinstance(token, _Tok):
-                special_tokens.append(token)
-                pattern += self._token_patterns[token]
-            else:
-                # Unescaped dots in literals are probably accidental typos --
-                # they should be escaped in the source.
-                if re.search(r'[^\\]\.', token) is not None:
-                    raise Exception('Literal Token contains unescaped dot: '
-                                    + str(token))
-                # Capturing groups in literals violate contracts (see
-                # `_TokenMatcher.match`).
-                if re.search(r'\([^?]', token) is not None:
-                    raise Exception('Literal Token contains capturing group: '
-                                    + str(token))
-                pattern += token
-        pattern += '$'
-        compiled_pattern = re.compile(pattern)
-
-        # Cache the regex.
-        if sequence_cache_id is not None:
-            self._cached_sequence_patterns[sequence_cache_id] = compiled_pattern
-            for special_token in special_tokens:
-                self._cache_sequence_dependency[special_token].add(
-                    sequence_cache_id)
-
-        return compiled_pattern
+        self._token_patterns = dict(_initial_token_patterns)
+        self._updated_tokens = set()
+        self._recompiled_patterns = {}
+
+    def _is_outdated(self, sequence: _TokenSequence) -> bool:
+        return not self._updated_tokens.isdisjoint(sequence.special_tokens)
+
+    def _sequence_pattern(self, sequence: _TokenSequence) -> Pattern:
+        if not self._updated_tokens or not self._is_outdated(sequence):
+            return sequence.pattern
+
+        pattern = self._recompiled_patterns.get(sequence)
+        if pattern is None:
+            pattern = sequence.compile(self._token_patterns)
+            self._recompiled_patterns[sequence] = pattern
+        return pattern
+
+    def _group_pattern(self, group: _TokenSequenceGroup,
+                       indices: Tuple[int, ...]) -> _CombinedPattern:
+        if not self._updated_tokens or not any(
+                self._is_outdated(group.sequences[i]) for i in indices):
+            pattern = group.patterns.get(indices)
+            if pattern is None:
+                pattern = group.compile(indices, _initial_token_patterns)
+                group.patterns[indices] = pattern
+            return pattern
+
+        pattern = self._recompiled_patterns.get((group, indices))
+        if pattern is None:
+            pattern = group.compile(indices, self._token_patterns)
+            self._recompiled_patterns[(group, indices)] = pattern
+        return pattern
 
     def update_token_pattern(self, token: _Tok, pattern: str) -> None:
         """
@@ -125,12 +456,10 @@ class _TokenMatcher:
             Regex pattern to set. It must contain exactly one capturing group.
         """
         self._token_patterns[token] = pattern
+        self._updated_tokens.add(token)
+        self._recompiled_patterns.clear()
 
-        for sequence_cache_id in self._cache_sequence_dependency.get(token
-                                                                     ) or []:
-            self._cached_sequence_patterns.pop(sequence_cache_id)
-
-    def match(self, against: Sequence[_Token], string: str, cache_id: int
+    def match(self, against: _TokenSequence, string: str
               ) -> Optional[_Captures]:
         """
         Match a string against a sequence of tokens.
@@ -145,16 +474,18 @@ class _TokenMatcher:
         So long as the second-last character is one of '?!.', then the capture
         will work losslessly even if the last character is a dot.
 
+        By the same reasoning, strings matching a sequence that ends in a
+        special token must end in one of '?!.'.
+
+        Both the stripped and unstripped readings are tried within one regex
+        search, the stripped reading taking precedence.
+
         Parameters
         ---------
-        tokens : Sequence[_Token]
-            Sequence of Tokens to match against. `str`-typed elements of this
-            sequence must contain no capturing groups.
+        against : _TokenSequence
+            Sequence of Tokens to match against.
         string : int
             The string to match.
-        cache_id : int
-            Unique identifier for the value of `tokens`, to be used for regex
-            compilation caching.
 
         Returns
         -------
@@ -162,42 +493,47 @@ class _TokenMatcher:
             Object representing the special token captures from the match, or
             `None` if the match was not successful.
         """
-        return self._match0(against, string, cache_id, False)
-
-    def _match0(self, against: Sequence[_Token], string: str, cache_id: int,
-                has_stripped_dot: bool) -> Optional[_Captures]:
-        """See `_TokenMatcher.match`."""
-
-        # Where the rule is such that Facebook may have inserted a '.', this
-        # block first orchestrates one recursive call with the dot stripped.
-        if isinstance(against[-1], _Tok) and not has_stripped_dot:
-            ends_with_any_punctuation = re.search(r'[.!?]$', string) is not None
-            if not ends_with_any_punctuation:
-                # Messages ending with a Tok must always end in punctuation.
-                return None
-
-            ends_with_single_dot = re.search(r'[^.!?]\.$', string) is not None
-            if ends_with_single_dot:
-                dotless_captures = self._match0(against, string[:-1],
-                                                cache_id, True)
-                if dotless_captures is not None:
-                    return dotless_captures
-
-        pattern = self._compile_pattern(against, sequence_cache_id=cache_id)
-        res = pattern.search(string)
+        # Cheaply reject strings that lack the sequence's literal part or the
+        # necessary ending.
+        if against.required_literal not in string or (
+                against.ends_with_token
+                and not string.endswith(_sentence_endings)):
+            return None
+
+        res = self._sequence_pattern(against).search(string)
         if not res:
             return None
 
-        captures = {}
-        groups = list(res.groups())
-
-        for token in against:
-            if isinstance(token, _Tok):
-                capture = groups.pop(0)
-                if token not in captures:
-                    captures[token] = capture
-                elif isinstance(captures[token], str):
-                    captures[token] = [captures[token], capture]
-                else:
-                    captures[token].append(capture)
-        return captures
+        return against.captures(res.groups())
+
+    def match_any(self, group: _TokenSequenceGroup, string: str
+                  ) -> Tuple[int, Optional[_Captures]]:
+        """
+        Match a string against several sequences of tokens at once.
+
+        This is equivalent to calling `match` on each sequence in turn until
+        one succeeds, but scans the string with one combined regex.
+
+        Parameters
+        ----------
+        group : _TokenSequenceGroup
+            The sequences to match against, in order of precedence.
+        string : str
+            The string to match.
+
+        Returns
+        -------
+        Tuple[int, Captures or None]
+            The index of the first sequence that matches, and the captures
+            from that match. If none match, the index is the number of
+            sequences and the captures are `None`.
+        """
+        # Only some sequences can match the string, which is cheap to check.
+        indices = group.candidate_indices(string)
+        if not indices:
+            return len(group.sequences), None
+
+        hit = self._group_pattern(group, indices).search(string)
+        if hit is None:
+            return len(group.sequences), None
+        return hit
@@ -2,8 +2,11 @@
 
 __all__ = ['Photo', 'Gif', 'Sticker', 'AudioFile', 'Video', 'AttachmentFile']
 
+from typing import Optional as _Optional
+
 
 class Photo:
+    __slots__ = ('uri', 'creation_timestamp')
     uri: str
     creation_timestamp: int
 
@@ -14,6 +17,7 @@ class Photo:
 
 
 class Gif:
+    __slots__ = ('uri',)
     uri: str
 
     def __init__(self, gif_json: dict) -> None:
@@ -22,6 +26,7 @@ class Gif:
 
 
 class Sticker:
+    __slots__ = ('uri',)
     uri: str
 
     def __init__(self, sticker_json: dict) -> None:
@@ -30,6 +35,7 @@ class Sticker:
 
 
 class AudioFile:
+    __slots__ = ('uri', 'creation_timestamp')
     uri: str
     creation_timestamp: int
 
@@ -41,17 +47,20 @@ class AudioFile:
 
 
 class Video:
+    __slots__ = ('uri', 'thumbnail_uri', 'creation_timestamp')
     uri: str
-    thumbnail_uri: str
+    thumbnail_uri: _Optional[str]
     creation_timestamp: int
 
     def __init__(self, video_json: dict) -> None:
         """This method should not be called publicly."""
         self.uri = video_json['uri']
+        self.thumbnail_uri = (video_json.get('thumbnail') or {}).get('uri')
         self.creation_timestamp = int(video_json['creation_timestamp']) * 1000
 
 
 class AttachmentFile:
+    __slots__ = ('uri', 'creation_timestamp')
     uri: str
     creation_timestamp: int
 
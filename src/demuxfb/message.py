@@ -1,20 +1,60 @@
 """Module to define types of message structures to generate."""
 
 from abc import ABC as _ABC
-from typing import Optional as _Optional, List as _List
+from typing import (Optional as _Optional, List as _List, Tuple as _Tuple,
+                    Union as _Union, Hashable as _Hashable,
+                    TYPE_CHECKING as _TYPE_CHECKING)
 from enum import Enum as _Enum, auto as _auto
 
 from ._reaction import Reaction as _Reaction
 from ._participant import Participant as _Participant
 from . import media as _media
 
+if _TYPE_CHECKING:
+    from ._chat_feed import ChatFeed as _ChatFeed
+
+
+class _MessageJsonReference:
+    """Where to load a message's json from again, for `Message.message_json`."""
+    __slots__ = ('feed', 'reference')
+    feed: '_ChatFeed'
+    reference: _Hashable
+
+    def __init__(self, feed: '_ChatFeed', reference: _Hashable) -> None:
+        self.feed = feed
+        self.reference = reference
+
 
 class Message(_ABC):
+    """
+    Base class of all messages. `reactions` is a tuple (formerly a list) of the
+    reactions to the message, in the order of its json.
+    """
+    # Messages are slotted to keep large chats compact, so subclasses must list
+    # their own fields in `__slots__`.
+    __slots__ = ('timestamp', 'content', 'sender', 'reactions', '_message_json')
     timestamp: int
     content: _Optional[str]
     sender: _Participant
-    reactions: _List[_Reaction]
-    message_json: dict
+    reactions: _Tuple[_Reaction, ...]
+    _message_json: _Union[dict, _MessageJsonReference, None]
+
+    @property
+    def message_json(self) -> _Optional[dict]:
+        """
+        The json the message was built from, or None if it was dropped (see the
+        `message_json` parameter of `demuxfb.build_chat`). If only a reference
+        to it was kept, it is loaded from the chat's feed on each access.
+        """
+        if isinstance(self._message_json, _MessageJsonReference):
+            return self._message_json.feed.load_message_json(
+                self._message_json.reference)
+        return self._message_json
+
+    @message_json.setter
+    def message_json(self, value: _Union[dict, _MessageJsonReference, None]
+                     ) -> None:
+        self._message_json = value
 
 
 class UnrecognizedMessage(Message):
@@ -22,20 +62,26 @@ class UnrecognizedMessage(Message):
     Instances of this class are generated when a JSON message does not match any
     existing rules.
     """
-    pass
+    __slots__ = ()
 
 
 class MediaMessage(Message):
-    photos: _List[_media.Photo]
-    gifs: _List[_media.Gif]
-    audio_files: _List[_media.AudioFile]
-    videos: _List[_media.Video]
-    stickers: _List[_media.Sticker]
-    attachment_files: _List[_media.AttachmentFile]
+    """
+    A message sharing media. Each of its media attributes is a tuple (formerly
+    a list), empty if the message shares none of that kind.
+    """
+    __slots__ = ('photos', 'gifs', 'audio_files', 'videos', 'stickers',
+                 'attachment_files')
+    photos: _Tuple[_media.Photo, ...]
+    gifs: _Tuple[_media.Gif, ...]
+    audio_files: _Tuple[_media.AudioFile, ...]
+    videos: _Tuple[_media.Video, ...]
+    stickers: _Tuple[_media.Sticker, ...]
+    attachment_files: _Tuple[_media.AttachmentFile, ...]
 
 
 class EmptyMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class CallType(_Enum):
@@ -46,32 +92,37 @@ class CallType(_Enum):
 
 
 class CallStartMessage(Message):
+    __slots__ = ('call_type',)
     call_type: CallType
 
 
 class CallJoinMessage(Message):
+    __slots__ = ('call_type',)
     call_type: CallType
 
 
 class CallShareVideoMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class CallEndMessage(Message):
+    __slots__ = ('call_type',)
     call_type: CallType
 
 
 class NicknameChangeMessage(Message):
+    __slots__ = ('new_nickname', 'setter', 'subject')
     new_nickname: _Optional[str]
     setter: _Participant
     subject: _Participant
 
 
 class TextMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class SubscribeMessage(Message):
+    __slots__ = ('inviter', 'invitees')
     inviter: _Participant
     # `invitees` may fail to contain the appropriate amount of unkown
     # participants.
@@ -79,44 +130,51 @@ class SubscribeMessage(Message):
 
 
 class UnsubscribeMessage(Message):
+    __slots__ = ('removed_self', 'removalist', 'removed')
     removed_self: bool
     removalist: _Participant
     removed: _Participant
 
 
 class WaveMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class AppChallengeMessage(Message):
+    __slots__ = ('app_name',)
     app_name: str
 
 
 class AppNewScoreMessage(Message):
+    __slots__ = ('app_name', 'score', 'personal_best')
     app_name: str
     score: str
     personal_best: bool
 
 
 class AppLeaderboardReshuffleMessage(Message):
+    __slots__ = ('app_name', 'now_in_first_place')
     app_name: str
     now_in_first_place: bool
 
 
 class LinkMessage(Message):
+    __slots__ = ('shared_link',)
     shared_link: _Optional[str]
 
 
 class PlanCreationMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class PlanUpdateMessage(Message):
+    __slots__ = ('new_plan_title', 'new_plan_date_time')
     new_plan_title: _Optional[str]
     new_plan_date_time: _Optional[str]
 
 
 class PlanDeletionMessage(Message):
+    __slots__ = ('plan_title', 'plan_date_time')
     # The name of the plan that has been deleted.
     plan_title: _Optional[str]
     # The date and time the plan would have occurred, had it not been deleted.
@@ -124,46 +182,53 @@ class PlanDeletionMessage(Message):
 
 
 class PlanRespondencyMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class PlanReminderMessage(Message):
+    __slots__ = ('is_concurrent', 'plan_title', 'plan_hour')
     is_concurrent: bool
     plan_title: _Optional[str]
     plan_hour: str
 
 
 class PollCreationMessage(Message):
+    __slots__ = ('poll_name',)
     poll_name: str
 
 
 class PollAddVoteMessage(Message):
+    __slots__ = ('poll_name', 'vote_option', 'hidden_vote_count')
     poll_name: str
     vote_option: str
     hidden_vote_count: int
 
 
 class PollRemoveVoteMessage(Message):
+    __slots__ = ('poll_name', 'vote_option', 'hidden_vote_count')
     poll_name: str
     vote_option: str
     hidden_vote_count: int
 
 
 class PollChangeVoteMessage(Message):
+    __slots__ = ('poll_name', 'vote_option')
     poll_name: str
     vote_option: str
 
 
 class PollExpiredMessage(Message):
-    pass
+    __slots__ = ()
 
 
 class AdminAddMessage(Message):
+    __slots__ = ('instigator', 'subject')
     instigator: _Participant
     subject: _Participant
 
 
 class AdminRemoveMessage(Message):
+    __slots__ = ('instigator', 'subject')
     instigator: _Participant
     subject: _Participant
 
@@ -177,6 +242,8 @@ class ChatSettingsType(_Enum):
 
 
 class ChatSettingsChangeMessage(Message):
+    __slots__ = ('settings_type', 'new_name', 'new_emoji',
+                 'new_approval_is_required_policy')
     settings_type: ChatSettingsType
     new_name: _Optional[str]
     new_emoji: _Optional[str]
@@ -1,7 +1,10 @@
 """Test the construction of ChatFeeds."""
 
+import json
 import pytest
 import sys
+import tracemalloc
+import zipfile
 from pathlib import Path
 
 sys.path.append('src/')
@@ -90,3 +93,255 @@ def test_folder_feed_contains_bad_name():
         demuxfb.ChatFolderFeed(file)
     assert str(einfo.value).endswith(
         'does not fit expected message_NUM.json format')
+
+
+def test_streaming_file_feed():
+    file = Path('test/data/chats/messages.json')
+    chat_feed = demuxfb.ChatFileFeed(file, streaming=True)
+
+    messages = list(chat_feed.message_json_iter())
+    assert messages == single_file_messages
+
+
+# Exercise refilling the read window midway through json values.
+def test_streaming_file_feed_small_chunks(monkeypatch):
+    monkeypatch.setattr(demuxfb._chat_feed, '_stream_chunk_size', 7)
+    file = Path('test/data/chats/messages.json')
+    chat_feed = demuxfb.ChatFileFeed(file, streaming=True)
+
+    messages = list(chat_feed.message_json_iter())
+    assert messages == single_file_messages
+
+
+def test_streaming_file_feed_yields_before_decoding_all(tmp_path):
+    # Facebook lists messages newest first, so the oldest is the last one.
+    message_jsons = [{'sender_name': 'Henry', 'timestamp_ms': i,
+                      'content': 'message {} '.format(i) * 20}
+                     for i in range(10000, 0, -1)]
+    file = tmp_path / 'message_1.json'
+    file.write_text(json.dumps({'participants': [], 'messages': message_jsons},
+                               indent=2))
+    chat_feed = demuxfb.ChatFileFeed(file, streaming=True)
+
+    tracemalloc.start()
+    try:
+        message_json_iter = chat_feed.message_json_iter()
+        first_message_json = next(message_json_iter)
+        first_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # The peak memory of decoding all of the file's messages at once.
+    tracemalloc.start()
+    try:
+        json.loads(file.read_text())
+        all_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert first_message_json == message_jsons[-1]
+    assert first_peak < all_peak / 10
+    assert [first_message_json] + list(message_json_iter) == \
+        message_jsons[::-1]
+
+
+def test_streaming_file_feed_invalid_path():
+    with pytest.raises(demuxfb.InvalidChatFeedException) as einfo:
+        file = Path('test/data/chats/hello')
+        demuxfb.ChatFileFeed(file, streaming=True)
+    assert str(einfo.value).startswith('Could not read json stream from file')
+
+
+def test_streaming_file_feed_not_json():
+    file = Path('test/data/chats/notjson.txt')
+    chat_feed = demuxfb.ChatFileFeed(file, streaming=True)
+    with pytest.raises(demuxfb.InvalidChatFeedException) as einfo:
+        list(chat_feed.message_json_iter())
+    assert str(einfo.value).startswith('Could not read json stream from file')
+
+
+mojibake_messages = [
+    {
+        'sender_name': 'Renée',
+        'timestamp_ms': 1566296938824,
+        'content': 'Château d’If 🍺',
+        'type': 'Generic'
+    },
+    {
+        'sender_name': 'Henry',
+        'timestamp_ms': 1566296943820,
+        'content': 'Typed \\u00e2 and "quoted" A',
+        'type': 'Generic'
+    }
+]
+
+
+def test_file_feed_mojibake():
+    file = Path('test/data/chats/mojibake.json')
+    chat_feed = demuxfb.ChatFileFeed(file)
+
+    messages = list(chat_feed.message_json_iter())
+    assert messages == mojibake_messages
+
+
+# Escapes of ASCII characters must be left for the json loader.
+def test_file_feed_mojibake_with_ascii_escape(tmp_path):
+    file = tmp_path / 'message_1.json'
+    file.write_text(Path('test/data/chats/mojibake.json').read_text().replace(
+        ' A"', ' \\u0041"'))
+    chat_feed = demuxfb.ChatFileFeed(file)
+
+    messages = list(chat_feed.message_json_iter())
+    assert messages == mojibake_messages
+
+
+# Splitting the stream at every position must not break escapes or multi-byte
+# characters apart.
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7])
+def test_streaming_file_feed_mojibake(monkeypatch, chunk_size):
+    monkeypatch.setattr(demuxfb._chat_feed, '_stream_chunk_size', chunk_size)
+    file = Path('test/data/chats/mojibake.json')
+    chat_feed = demuxfb.ChatFileFeed(file, streaming=True)
+
+    messages = list(chat_feed.message_json_iter())
+    assert messages == mojibake_messages
+
+
+def test_folder_feed_processes():
+    folder = Path('test/data/chats/hello')
+    chat_feed = demuxfb.ChatFolderFeed(folder, processes=2)
+
+    messages = list(chat_feed.message_json_iter())
+    sequential_messages = list(
+        demuxfb.ChatFolderFeed(folder).message_json_iter())
+    assert messages == sequential_messages
+
+
+def test_folder_feed_processes_not_json(tmp_path):
+    (tmp_path / 'message_1.json').write_text('This is not json')
+    with pytest.raises(demuxfb.InvalidChatFeedException) as einfo:
+        demuxfb.ChatFolderFeed(tmp_path, processes=2)
+    assert str(einfo.value).startswith('Could not read json stream from file')
+
+
+@pytest.mark.parametrize('processes', [0, -1])
+def test_folder_feed_invalid_processes(processes):
+    folder = Path('test/data/chats/hello')
+    with pytest.raises(ValueError) as einfo:
+        demuxfb.ChatFolderFeed(folder, processes=processes)
+    assert str(einfo.value).startswith('processes must be at least 1')
+
+
+@pytest.mark.parametrize('options', [
+    {'lazy': True},
+    {'lazy': True, 'read_ahead': True},
+    {'lazy': True, 'processes': 2}
+])
+def test_lazy_folder_feed(options):
+    folder = Path('test/data/chats/hello')
+    chat_feed = demuxfb.ChatFolderFeed(folder, **options)
+
+    messages = list(chat_feed.message_json_iter())
+    eager_messages = list(demuxfb.ChatFolderFeed(folder).message_json_iter())
+    assert messages == eager_messages
+    # The feed can be iterated through multiple times.
+    assert list(chat_feed.message_json_iter()) == eager_messages
+
+
+def test_lazy_folder_feed_not_json(tmp_path):
+    (tmp_path / 'message_1.json').write_text('This is not json')
+    chat_feed = demuxfb.ChatFolderFeed(tmp_path, lazy=True)
+    with pytest.raises(demuxfb.InvalidChatFeedException) as einfo:
+        list(chat_feed.message_json_iter())
+    assert str(einfo.value).startswith('Could not read json stream from file')
+
+
+def _zip_hello_folder(archive: Path, part_numbers) -> None:
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        for part_number in part_numbers:
+            name = 'message_{}.json'.format(part_number)
+            zip_file.write(Path('test/data/chats/hello') / name,
+                           'your_activity/messages/inbox/hello_x9/' + name)
+        zip_file.writestr('your_activity/messages/inbox/hello_x9/photos/a.png',
+                          b'')
+
+
+def test_zip_feed(tmp_path):
+    archive = tmp_path / 'facebook.zip'
+    _zip_hello_folder(archive, range(1, 24))
+    chat_feed = demuxfb.ChatZipFeed(archive, 'messages/inbox/hello_x9')
+
+    messages = list(chat_feed.message_json_iter())
+    folder_messages = list(demuxfb.ChatFolderFeed(
+        Path('test/data/chats/hello')).message_json_iter())
+    assert messages == folder_messages
+
+
+def test_zip_feed_split_archive(tmp_path):
+    archives = [tmp_path / 'facebook-1.zip', tmp_path / 'facebook-2.zip']
+    _zip_hello_folder(archives[0], range(1, 24, 2))
+    _zip_hello_folder(archives[1], range(2, 24, 2))
+    chat_feed = demuxfb.ChatZipFeed(archives, 'hello_x9')
+
+    messages = list(chat_feed.message_json_iter())
+    folder_messages = list(demuxfb.ChatFolderFeed(
+        Path('test/data/chats/hello')).message_json_iter())
+    assert messages == folder_messages
+
+
+def test_zip_feed_missing_chat(tmp_path):
+    archive = tmp_path / 'facebook.zip'
+    _zip_hello_folder(archive, [1])
+    with pytest.raises(demuxfb.InvalidChatFeedException) as einfo:
+        demuxfb.ChatZipFeed(archive, 'messages/inbox/goodbye_x9')
+    assert str(einfo.value).startswith('Could not find chat folder')
+
+
+@pytest.mark.parametrize('make_feed', [
+    lambda: demuxfb.ChatFolderFeed(Path('test/data/chats/hello')),
+    lambda: demuxfb.ChatFolderFeed(Path('test/data/chats/hello'), lazy=True),
+    lambda: demuxfb.ChatFileFeed(Path('test/data/chats/messages.json')),
+    lambda: demuxfb.ChatFileFeed(
+        Path('test/data/chats/messages.json'), streaming=True)
+])
+def test_load_message_json(make_feed):
+    chat_feed = make_feed()
+
+    references = list(chat_feed.message_json_reference_iter())
+    assert [message_json for message_json, _ in references] == \
+        list(chat_feed.message_json_iter())
+    # Load out of order, so that lazy feeds must reread their parts.
+    for message_json, reference in reversed(references):
+        assert chat_feed.load_message_json(reference) == message_json
+
+
+def test_zip_feed_load_message_json(tmp_path):
+    archives = [tmp_path / 'facebook-1.zip', tmp_path / 'facebook-2.zip']
+    _zip_hello_folder(archives[0], range(1, 24, 2))
+    _zip_hello_folder(archives[1], range(2, 24, 2))
+    chat_feed = demuxfb.ChatZipFeed(archives, 'hello_x9')
+
+    references = list(chat_feed.message_json_reference_iter())
+    for message_json, reference in reversed(references):
+        assert chat_feed.load_message_json(reference) == message_json
+
+
+def test_feed_progress(tmp_path):
+    folder = Path('test/data/chats/hello')
+    size = sum(file.stat().st_size for file in folder.iterdir())
+    archive = tmp_path / 'facebook.zip'
+    _zip_hello_folder(archive, range(1, 24))
+
+    eager_feed = demuxfb.ChatFolderFeed(folder)
+    message_count = len(list(eager_feed.message_json_iter()))
+    assert eager_feed.message_count() == message_count
+    for chat_feed in [eager_feed, demuxfb.ChatFolderFeed(folder, lazy=True),
+                      demuxfb.ChatZipFeed(archive, 'hello_x9')]:
+        assert chat_feed.source_size() == size
+        message_json_iter = chat_feed.message_json_iter()
+        next(message_json_iter)
+        assert 0 < chat_feed.bytes_read() < size
+        list(message_json_iter)
+        assert chat_feed.bytes_read() == size
+
+    assert demuxfb.ChatFolderFeed(folder, lazy=True).message_count() is None
@@ -3,8 +3,12 @@ Test that the rule-application process correctly orchestrates the construction
 of some simple test chats.
 """
 
+from pathlib import Path
+import itertools
 import sys
 
+import pytest
+
 from .helpers import SpoofChatFeed
 
 
@@ -46,3 +50,433 @@ def test_basic():
     assert message.new_nickname == 'M'
 
     assert chat.participants == {jason, milly, wendy}
+
+
+def test_reactions():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello Milly',
+                   reactions=[{'reaction': 'x', 'actor': 'Milly'},
+                              {'reaction': 'y', 'actor': 'Wendy'}])
+    chat_feed.push(sender_name='Milly', content='Hi')
+
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+    jason = chat.get_participant('Jason')
+    milly = chat.get_participant('Milly')
+    wendy = chat.get_participant('Wendy')
+
+    reactions = chat.messages[0].reactions
+    assert [reaction.emoji for reaction in reactions] == ['x', 'y']
+    assert reactions[0].sender is milly
+    assert reactions[1].sender is wendy
+    assert isinstance(reactions[1].sender, demuxfb.Participant)
+    assert chat.messages[1].reactions == ()
+
+    # People who only ever reacted are participants too.
+    assert chat.participants == {jason, milly, wendy}
+
+
+def test_resume():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Jason started a call.')
+    chat_feed.push(sender_name='Milly', content='Hi', timestamp_ms=5000)
+    chat_feed.push(sender_name='Jason', content='Hey', timestamp_ms=5000)
+    old_chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    # The newer archive has messages appended, including one sharing the last
+    # timestamp of the older one.
+    chat_feed.push(sender_name='Wendy', content='Yo', timestamp_ms=5000)
+    chat_feed.push(sender_name='Milly', content='Milly joined the call.')
+    chat_feed.push(sender_name='Milly', content='The call ended.')
+    chat = demuxfb.build_chat(chat_feed, 'Jason', resume_from=old_chat)
+
+    assert len(old_chat.messages) == 3
+    assert chat.messages[:3] == old_chat.messages
+    assert [message.content for message in chat.messages[3:]] == \
+        ['Yo', 'Milly joined the call.', 'The call ended.']
+    # The call started in the older archive is still active.
+    assert isinstance(chat.messages[4], demuxfb.message.CallJoinMessage)
+    assert isinstance(chat.messages[5], demuxfb.message.CallEndMessage)
+
+    milly = chat.get_participant('Milly')
+    assert milly is old_chat.get_participant('Milly')
+    assert chat.messages[4].sender is milly
+    assert chat.participants == {chat.get_participant('Jason'), milly,
+                                 chat.get_participant('Wendy')}
+    assert old_chat.get_participant('Wendy') is None
+
+    # Resuming again from the same chat gives the same result.
+    chat_again = demuxfb.build_chat(chat_feed, 'Jason', resume_from=old_chat)
+    assert len(chat_again.messages) == 6
+    assert isinstance(chat_again.messages[4], demuxfb.message.CallJoinMessage)
+
+
+def test_dispatch_index(monkeypatch):
+    contents = [
+        'Jason started a video chat.', 'Milly joined the video chat.',
+        'The video chat ended.', 'Jason started a plan.',
+        'Jason named the plan Picnic.', 'Milly responded Going to Picnic.',
+        'Reminder, 30 minutes until 10 PM.', 'Reminder at 10 PM.',
+        'Jason created a poll: Lunch?', 'This poll is no longer available.',
+        'Milly voted for "Pizza" in the poll: Lunch?',
+        'Jason set the emoji to \U0001F600.',
+        'Jason scored 40 points in Snake.',
+        'The call ended.', 'I started a call. Just kidding.', 'Hello', '',
+        'Milly waved hello to the group.']
+    chat_feed = SpoofChatFeed()
+    for content in contents:
+        chat_feed.push(sender_name='Jason', content=content)
+    chat_feed.push(sender_name='Jason', users=[])
+    chat_feed.push(sender_name='Jason', content='Look',
+                   photos=[{'uri': 'a', 'creation_timestamp': 0}])
+
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    # Trying every rule in turn must give the same classification.
+    monkeypatch.setattr(demuxfb._rules._Ruleset, '_candidate_rules',
+                        lambda self, message_json: self._rules)
+    linear_chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    assert [type(message) for message in chat.messages] == \
+        [type(message) for message in linear_chat.messages]
+    assert len({type(message) for message in chat.messages}) > 10
+
+
+def test_adaptive_rule_order(monkeypatch):
+    monkeypatch.setattr(demuxfb._rules, '_warm_up_message_count', 4)
+    contents = [
+        'Jason started a call. Jason started a plan.', 'Hello', '',
+        'Jason started a call. Jason started a plan.',
+        'Jason started a call.', 'Milly joined the call.',
+        'Jason started a call. Jason started a plan.',
+        'The call ended.', 'Jason started a plan.',
+        'Jason started a call. Jason started a plan.']
+    chat_feed = SpoofChatFeed()
+    for content in contents:
+        chat_feed.push(sender_name='Jason', content=content)
+    chat_feed.push(sender_name='Jason', users=[])
+
+    chat_factory = demuxfb._chat._ChatFactory(chat_feed, 'Jason')
+    messages = list(chat_factory.build_messages())
+
+    # The plan rule hit most during the warm-up, and excludes the call rule,
+    # so it is now tried first.
+    rules = chat_factory.ruleset._candidate_rules(
+        {'content': contents[0], 'sender_name': 'Jason'})
+    assert [rule.function.__name__ for rule in rules[:2]] == \
+        ['_match_plan_creation_message', '_match_call_start_message']
+
+    monkeypatch.setattr(demuxfb._rules._Ruleset, '_candidate_rules',
+                        lambda self, message_json: self._rules)
+    linear_chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    assert [type(message) for message in messages] == \
+        [type(message) for message in linear_chat.messages]
+
+
+def test_failed_rule_attempts_leave_no_trace():
+    contents = [
+        'Hello', '', 'Jason started a call.', 'Jason started a video chat.',
+        'Milly joined the call.', 'Milly started sharing video.',
+        'The call ended.', 'The video chat ended.',
+        'Jason cleared his own nickname.', 'Jason cleared your nickname.',
+        'Jason cleared the nickname for Milly',
+        'Jason set the nickname for Milly to M',
+        'Jason set your nickname to J', 'Jason named the group Pals',
+        'Jason changed the group photo.', 'Jason started a plan.',
+        'Jason named the plan Picnic', 'Jason deleted the plan Picnic for ',
+        'Milly responded Going to Picnic',
+        'Reminder, 30 minutes until 1:00 PM.', 'Jason created a poll: Food',
+        'Jason voted for "Pie" in the poll: Food',
+        'Jason removed his vote for "Pie" in the poll: Food',
+        'Jason changed his vote to "Cake" in the poll: Food',
+        'This poll is no longer available.',
+        'Jason added Milly as a group admin.',
+        'Jason removed Milly as a group admin.',
+        'Jason scored 10 points in Snake',
+        'Jason moved up the leaderboard in Snake',
+        'Jason challenged you in Snake', 'Milly left the group.',
+        'Milly waved hello to the group.',
+        'Jason started a call. Jason started a plan.',
+        'Sorry. This poll is no longer available.']
+    # Near misses, which contain a rule's literal without matching it.
+    for rule in demuxfb._rules._all_rules:
+        contents.extend(rule.required_literals() or [])
+    chat_feed = SpoofChatFeed()
+    for content in contents:
+        for sender_name in ['Jason', 'Milly', 'Facebook User']:
+            chat_feed.push(sender_name=sender_name, content=content,
+                           reactions=[{'reaction': 'x', 'actor': 'Wendy'}])
+    chat_feed.push(sender_name='Milly')
+    chat_feed.push(sender_name='Milly',
+                   photos=[{'uri': 'a.png', 'creation_timestamp': 1}])
+    state_names = [name for name in vars(demuxfb._chat._State)
+                   if not name.startswith('_')]
+
+    failed_rules = set()
+    for message_json in chat_feed.message_json_iter():
+        for state in itertools.product([False, True],
+                                       repeat=len(state_names)):
+            chat_factory = demuxfb._chat._ChatFactory(chat_feed, 'Jason')
+            chat_factory.participant_manager.request_participant('Milly')
+            for name, value in zip(state_names, state):
+                setattr(chat_factory.state, name, value)
+            chat_factory.message_json = message_json
+            requested_names = []
+            request_participant = \
+                chat_factory.participant_manager.request_participant
+            chat_factory.participant_manager.request_participant = \
+                lambda name: requested_names.append(name) or \
+                request_participant(name)
+
+            # Any of the rules the message is offered to may be tried, and
+            # fail, before the rule that hits it.
+            for rule in chat_factory.ruleset._candidate_rules(message_json):
+                participants = dict(
+                    chat_factory.participant_manager._participants)
+                requested_names.clear()
+                message = rule(chat_factory)
+                if message is None:
+                    failed_rules.add(rule)
+                    assert requested_names == []
+                    assert chat_factory.participant_manager._participants \
+                        == participants
+                    assert [getattr(chat_factory.state, name)
+                            for name in state_names] == list(state)
+                elif not rule.requires_sequence_match():
+                    break
+                else:
+                    for name, value in zip(state_names, state):
+                        setattr(chat_factory.state, name, value)
+
+    # Every rule that matches sequences has been seen to fail without a
+    # trace, but for those after the text rule, which are never tried as the
+    # text rule always hits.
+    rules = demuxfb._rules._all_rules
+    rules = rules[:[rule.function.__name__ for rule in rules].index(
+        '_match_text_message')]
+    assert {rule.function.__name__ for rule in failed_rules} >= {
+        rule.function.__name__ for rule in rules
+        if rule.requires_sequence_match()}
+
+def test_plain_text_fast_path(monkeypatch):
+    chat_feed = SpoofChatFeed()
+    for content in ['Hello', 'Hello.', 'I started a call. lol', '', 'Hi\n',
+                    'Jason started a call.', 'Milly joined the call',
+                    'Jason set your nickname to J', 'Milly responded ',
+                    'Jason started a plan.', 'Jason named the plan Picnic']:
+        chat_feed.push(sender_name='Jason', content=content)
+    chat_feed.push(sender_name='Jason', content='Look',
+                   photos=[{'uri': 'a', 'creation_timestamp': 0}])
+    chat_feed.push(sender_name='Jason', users=[])
+    feeds = [chat_feed,
+             demuxfb.ChatFolderFeed(Path('test/data/chats/hello')),
+             demuxfb.ChatFileFeed(Path('test/data/chats/messages.json'))]
+
+    chats = [demuxfb.build_chat(feed, 'Jason') for feed in feeds]
+    monkeypatch.setattr(demuxfb._rules._Ruleset, '_is_plain',
+                        lambda self, message_json: False)
+    slow_chats = [demuxfb.build_chat(feed, 'Jason') for feed in feeds]
+
+    for chat, slow_chat in zip(chats, slow_chats):
+        assert [type(message) for message in chat.messages] == \
+            [type(message) for message in slow_chat.messages]
+    assert isinstance(chats[0].messages[0], demuxfb.message.TextMessage)
+    assert isinstance(chats[0].messages[5], demuxfb.message.CallStartMessage)
+
+
+def test_compact_messages():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello')
+    chat_feed.push(sender_name='Milly', content='Hi',
+                   reactions=[{'reaction': 'x', 'actor': 'Jason'}])
+
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    message = chat.messages[0]
+    assert not hasattr(message, '__dict__')
+    assert message.reactions == ()
+    assert len(chat.messages[1].reactions) == 1
+    assert not hasattr(chat.messages[1].reactions[0], '__dict__')
+    assert not hasattr(message.sender, '__dict__')
+
+
+def test_message_json_policies():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello')
+    chat_feed.push(sender_name='Milly', content='Hi')
+    message_jsons = list(chat_feed.message_json_iter())
+
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+    assert [message.message_json for message in chat.messages] == \
+        message_jsons
+
+    chat = demuxfb.build_chat(chat_feed, 'Jason', message_json='drop')
+    assert [message.message_json for message in chat.messages] == \
+        [None, None]
+    assert chat.messages[1].content == 'Hi'
+
+    chat = demuxfb.build_chat(chat_feed, 'Jason', message_json='reference')
+    assert [message.message_json for message in chat.messages] == \
+        message_jsons
+
+    with pytest.raises(ValueError):
+        demuxfb.build_chat(chat_feed, 'Jason', message_json='forget')
+
+
+def test_get_messages():
+    chat_feed = SpoofChatFeed()
+    for i in range(30):
+        sender_name = ['Jason', 'Milly', 'Wendy'][i % 3]
+        if i % 4 == 0:
+            chat_feed.push(sender_name=sender_name,
+                           photos=[{'uri': 'a.png', 'creation_timestamp': 0}])
+        elif i % 5 == 0:
+            chat_feed.push(sender_name=sender_name,
+                           content=sender_name + ' named the group G.')
+        else:
+            chat_feed.push(sender_name=sender_name, content='Hi')
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+    jason = chat.get_participant('Jason')
+
+    def brute_force(message_type=None, sender=None, start=None, end=None):
+        return [message for message in chat.messages
+                if (message_type is None or isinstance(message, message_type))
+                and (sender is None or message.sender is sender)
+                and (start is None or message.timestamp >= start)
+                and (end is None or message.timestamp < end)]
+
+    for message_type in [None, demuxfb.message.TextMessage,
+                         demuxfb.message.MediaMessage, demuxfb.message.Message,
+                         demuxfb.message.PollAddVoteMessage]:
+        for sender in [None, jason, chat.get_participant('Milly')]:
+            for start, end in [(None, None), (5000, 20500), (20000, 5000)]:
+                messages = chat.get_messages(message_type, sender, start, end)
+                assert list(messages) == \
+                    brute_force(message_type, sender, start, end)
+
+    messages = chat.get_messages(sender=jason)
+    assert len(messages) == 10
+    assert messages[-1] is brute_force(sender=jason)[-1]
+    assert list(messages[2:5]) == brute_force(sender=jason)[2:5]
+    assert list(messages[::3]) == brute_force(sender=jason)[::3]
+    with pytest.raises(IndexError):
+        messages[10]  # pylint: disable=pointless-statement
+
+
+def test_get_messages_unsorted():
+    chat_feed = SpoofChatFeed()
+    for i in range(10):
+        chat_feed.push(sender_name=['Jason', 'Milly'][i % 2], content='Hi')
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+    jason = chat.get_participant('Jason')
+    chat.messages.reverse()
+
+    messages = chat.get_messages(start=2000, end=6000)
+    assert [message.timestamp for message in messages] == \
+        [5000, 4000, 3000, 2000]
+    messages = chat.get_messages(demuxfb.message.TextMessage, jason, 2000)
+    assert [message.timestamp for message in messages] == \
+        [8000, 6000, 4000, 2000]
+
+
+def test_iter_messages():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Jason started a call.')
+    chat_feed.push(sender_name='Milly', content='Hi')
+    chat_feed.push(sender_name='Milly', content='The call ended.')
+    chat_feed.push(sender_name='Jason', content='Bye')
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    messages = list(demuxfb.iter_messages(chat_feed, 'Jason'))
+    assert [type(message) for message in messages] == \
+        [type(message) for message in chat.messages]
+    assert messages[0].sender is messages[3].sender
+    assert messages[0].sender is not messages[1].sender
+
+    old_chat = demuxfb.build_chat(chat_feed, 'Jason')
+    chat_feed.push(sender_name='Milly', content='Milly started a call.')
+    messages = list(demuxfb.iter_messages(chat_feed, 'Jason',
+                                          resume_from=old_chat))
+    assert len(messages) == 1
+    assert messages[0].sender is old_chat.get_participant('Milly')
+
+
+def test_iter_messages_is_lazy():
+    class CountingChatFeed(SpoofChatFeed):
+        read_count = 0
+
+        def message_json_iter(self):
+            for message_json in super().message_json_iter():
+                self.read_count += 1
+                yield message_json
+
+    chat_feed = CountingChatFeed()
+    for _ in range(10):
+        chat_feed.push(content='Hi')
+
+    messages = demuxfb.iter_messages(chat_feed, 'Jason')
+    assert next(messages).content == 'Hi'
+    assert chat_feed.read_count == 1
+
+
+def test_throughput_progress_reporter():
+    chat_feed = SpoofChatFeed()
+    for _ in range(50):
+        chat_feed.push(sender_name='Jason', content='Hi')
+    chat_feed.push(sender_name='Jason', content='Jason started a call.')
+    reports = []
+    progress_reporter = demuxfb.ThroughputProgressReporter(0, reports.append)
+
+    demuxfb.build_chat(chat_feed, 'Jason', progress_reporter)
+
+    assert progress_reporter.message_count == 51
+    assert progress_reporter.type_counts[demuxfb.message.TextMessage] == 50
+    assert reports[0].startswith('Messages processed: 1')
+    assert reports[-1].startswith('Messages processed: 51')
+    assert reports[-1].endswith('  TextMessage: 50\n  CallStartMessage: 1')
+
+
+def test_throughput_progress_reporter_resume():
+    class CountedChatFeed(SpoofChatFeed):
+        def message_count(self):
+            return len(self._message_jsons)
+
+    chat_feed = CountedChatFeed()
+    for _ in range(30):
+        chat_feed.push(sender_name='Jason', content='Hi')
+    old_chat = demuxfb.build_chat(chat_feed, 'Jason')
+    for _ in range(10):
+        chat_feed.push(sender_name='Jason', content='Hey')
+    reports = []
+    progress_reporter = demuxfb.ThroughputProgressReporter(0, reports.append)
+
+    demuxfb.build_chat(chat_feed, 'Jason', progress_reporter,
+                       resume_from=old_chat)
+
+    # Progress is measured against the messages after those resumed from.
+    assert progress_reporter.message_count == 10
+    assert reports[0].startswith('Messages processed: 1 of 10 (10%)')
+    assert reports[-1].startswith('Messages processed: 10 of 10 (100%)')
+
+def test_rule_profile():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello Milly')
+    chat_feed.push(sender_name='Jason',
+                   content='You set the nickname for Milly to M.')
+    chat_feed.push(sender_name='Milly', content='Hi')
+
+    assert demuxfb.build_chat(chat_feed, 'Jason').rule_profile is None
+    chat = demuxfb.build_chat(chat_feed, 'Jason', profile=True)
+
+    assert [type(message) for message in chat.messages] == \
+        [demuxfb.message.TextMessage, demuxfb.message.NicknameChangeMessage,
+         demuxfb.message.TextMessage]
+    rules = {rule.name: rule for rule in chat.rule_profile.rules}
+    assert rules['_match_text_message'].attempts == 2
+    assert rules['_match_text_message'].hits == 2
+    nickname_rule = rules['_match_nickname_change_message']
+    assert nickname_rule.attempts == 1
+    assert nickname_rule.hits == 1
+    assert sum(sequence.hits for sequence in nickname_rule.sequences) == 1
+    assert sum(sequence.attempts for sequence in nickname_rule.sequences) >= 1
+    assert '_match_nickname_change_message' in chat.rule_profile.report()
@@ -68,6 +68,8 @@ def test_match_media_message():
     message = messages.pop(0)
     assert isinstance(message, demuxfb.message.MediaMessage)
     assert len(message.videos) == 1
+    assert message.videos[0].thumbnail_uri == \
+        'messages/inbox/convo//videos/thumbnails/blarg.jpg'
 
     message = messages.pop(0)
     assert isinstance(message, demuxfb.message.MediaMessage)
@@ -309,3 +311,4 @@ def test_plan_messages():
 
     message = messages.pop(0)
     assert isinstance(message, demuxfb.message.TextMessage)
+
@@ -0,0 +1,44 @@
+"""Test building every chat of a whole archive."""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+
+
+@pytest.fixture
+def archive_folder(tmp_path):
+    hello = Path('test/data/chats/hello')
+    shutil.copytree(hello, tmp_path / 'messages/inbox/hello_x9')
+    small = tmp_path / 'messages/archived_threads/small_y7'
+    small.mkdir(parents=True)
+    shutil.copy(hello / 'message_1.json', small)
+    (tmp_path / 'messages/inbox/hello_x9/photos').mkdir()
+    (tmp_path / 'messages/stickers_used').mkdir()
+    return tmp_path
+
+
+def test_find_chat_folders(archive_folder):
+    assert demuxfb.find_chat_folders(archive_folder) == [
+        archive_folder / 'messages/archived_threads/small_y7',
+        archive_folder / 'messages/inbox/hello_x9']
+    assert demuxfb.find_chat_folders(archive_folder, ['inbox']) == [
+        archive_folder / 'messages/inbox/hello_x9']
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_build_chats(archive_folder, processes):
+    chat_folders = demuxfb.find_chat_folders(archive_folder)
+    chats = dict(demuxfb.build_chats(chat_folders, 'Henry',
+                                     processes=processes))
+
+    assert set(chats) == set(chat_folders)
+    hello_chat = chats[archive_folder / 'messages/inbox/hello_x9']
+    assert len(hello_chat.messages) == 46
+    assert hello_chat.get_participant('Henry').is_me()
+    small_chat = chats[archive_folder / 'messages/archived_threads/small_y7']
+    assert len(small_chat.messages) == 2
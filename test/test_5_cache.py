@@ -0,0 +1,89 @@
+"""Test caching built chats on disk."""
+
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+
+
+def _fail_build_chat(*args, **kwargs):
+    raise AssertionError('Chat was rebuilt')
+
+
+def test_cache_hit(tmp_path, monkeypatch):
+    cache = demuxfb.ChatCache(tmp_path / 'cache')
+    feed = demuxfb.ChatFolderFeed(Path('test/data/chats/hello'), lazy=True)
+    chat = cache.build_chat(feed, 'Henry')
+
+    monkeypatch.setattr(demuxfb._cache, 'build_chat', _fail_build_chat)
+    cached_chat = cache.build_chat(feed, 'Henry')
+
+    assert [message.content for message in cached_chat.messages] == \
+        [message.content for message in chat.messages]
+    assert cached_chat.messages[0].sender is cached_chat.get_participant(
+        cached_chat.messages[0].sender.get_name())
+    assert cached_chat.get_participant('Henry').is_me()
+
+
+def test_cache_invalidation(tmp_path):
+    folder = tmp_path / 'hello'
+    shutil.copytree('test/data/chats/hello', folder)
+    cache = demuxfb.ChatCache(tmp_path / 'cache')
+    chat = cache.build_chat(demuxfb.ChatFolderFeed(folder, lazy=True), 'Henry')
+    assert len(chat.messages) == 46
+
+    # A different owner is a different chat.
+    chat = cache.build_chat(demuxfb.ChatFolderFeed(folder, lazy=True),
+                            'Daniel')
+    assert chat.get_participant('Daniel').is_me()
+
+    (folder / 'message_23.json').unlink()
+    chat = cache.build_chat(demuxfb.ChatFolderFeed(folder, lazy=True), 'Henry')
+    assert len(chat.messages) == 44
+    assert len(list((tmp_path / 'cache').glob('*.chat'))) == 3
+
+    cache.clear()
+    assert list((tmp_path / 'cache').glob('*.chat')) == []
+
+
+def test_cache_message_json_reference(tmp_path, monkeypatch):
+    cache = demuxfb.ChatCache(tmp_path / 'cache')
+    feed = demuxfb.ChatFolderFeed(Path('test/data/chats/hello'), lazy=True)
+    chat = cache.build_chat(feed, 'Henry')
+    cache.build_chat(feed, 'Henry', message_json='reference')
+    assert len(list((tmp_path / 'cache').glob('*.chat'))) == 2
+
+    monkeypatch.setattr(demuxfb._cache, 'build_chat', _fail_build_chat)
+    other_feed = demuxfb.ChatFolderFeed(Path('test/data/chats/hello'),
+                                        lazy=True)
+    cached_chat = cache.build_chat(other_feed, 'Henry',
+                                   message_json='reference')
+    assert cached_chat.messages[0]._message_json.feed is other_feed
+    assert [message.message_json for message in cached_chat.messages] == \
+        [message.message_json for message in chat.messages]
+
+
+def test_cache_profile(tmp_path):
+    cache = demuxfb.ChatCache(tmp_path / 'cache')
+    feed = demuxfb.ChatFolderFeed(Path('test/data/chats/hello'), lazy=True)
+    cache.build_chat(feed, 'Henry')
+
+    chat = cache.build_chat(feed, 'Henry', profile=True)
+    assert chat.rule_profile is not None
+    assert cache.build_chat(feed, 'Henry').rule_profile is None
+
+
+def test_cache_resume_from(tmp_path):
+    cache = demuxfb.ChatCache(tmp_path / 'cache')
+    folder = Path('test/data/chats/hello')
+    old_chat = demuxfb.build_chat(demuxfb.ChatFolderFeed(folder), 'Henry')
+    cache.build_chat(demuxfb.ChatFolderFeed(folder, lazy=True), 'Henry')
+
+    # Even with an entry in the cache, resuming shares participants with the
+    # chat resumed from.
+    chat = cache.build_chat(demuxfb.ChatFolderFeed(folder, lazy=True),
+                            'Henry', resume_from=old_chat)
+    assert chat.get_participant('Henry') is old_chat.get_participant('Henry')
+    assert len(chat.messages) == len(old_chat.messages)
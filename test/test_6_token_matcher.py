@@ -0,0 +1,208 @@
+"""
+Test that the faster matching paths of `_TokenMatcher` agree with matching
+each token sequence on its own.
+"""
+
+import re
+import sys
+
+import pytest
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+
+
+_contents = [
+    'Jason started a video chat.', 'Jason started a call.',
+    'Milly joined the call.', 'The video chat ended.', 'The call ended.',
+    'Jason cleared his own nickname.', 'Jason cleared your nickname.',
+    'Jason cleared the nickname for Milly.',
+    'Jason cleared the nickname for M.',
+    'Jason set the nickname for Milly to Don 2.0.',
+    'Jason set the nickname for Milly to Wow!.',
+    'Jason set your nickname to J.',
+    'Jason set your nickname to J', 'Jason set her own nickname to ...',
+    'Jason named the group Lunch?', 'Jason named the group Lunch..',
+    'Jason set the emoji to \U0001F600.', 'Jason started a plan.',
+    'Jason named the plan Picnic.', 'Jason updated the plan to Sat 5 PM.',
+    'Jason deleted the plan Picnic for Sat 5 PM.',
+    'Jason deleted the plan for Sat 5 PM.', 'Milly responded Going to Picnic.',
+    'Reminder, 30 minutes until 10 PM.', 'Reminder, 30 minutes until A at 1 AM',
+    'Reminder at 10 PM.', 'Reminder, Picnic at 10 PM.',
+    'Jason created a poll: Lunch?',
+    'Milly voted for "Pizza" and 2 other options in the poll: Lunch?',
+    'Milly voted for "Pizza" in the poll: Lunch?.',
+    'Milly removed her vote for "Pizza" in the poll: Lunch.',
+    'Milly changed your vote to "Pizza in the poll: Lunch.',
+    'This poll is no longer available.', 'Jason added Milly as a group admin.',
+    'Jason just scored 40 points in Snake.',
+    'Jason set a new personal best of 3 in Snake.',
+    'Jason moved up the leaderboard in Snake.',
+    'Jason is now in first place in Snake!', 'Jason challenged you in Snake.',
+    'Milly left the group.', 'Milly waved hello to the group.',
+    'Hello', '', '.', 'Jason started a call.\nThe call ended.',
+    'Jason set your nickname to J.\n', 'Jason set your nickname to J\n.',
+    'Jason set your nickname to J!\n', 'Jason set your nickname to J..',
+    'Jason set your nickname to .', 'Jason set your nickname to \n',
+    'Jason set your nickname to J!.', 'Jason set your nickname to J.\n\n',
+    'Reminder, 30 minutes until 10 PM.\n', 'Reminder, Picnic at 10 PM\n.',
+    'Jason named the group A.\nB.', 'Jason set the emoji to .\n',
+]
+
+
+def _legacy_match(tokens, string):
+    """The matching logic from before the dot was handled in the regex."""
+    # pylint: disable=protected-access
+    tok = demuxfb._tokens._Tok
+    token_patterns = demuxfb._tokens._initial_token_patterns
+
+    def match0(string, has_stripped_dot):
+        if isinstance(tokens[-1], tok) and not has_stripped_dot:
+            if re.search(r'[.!?]$', string) is None:
+                return None
+            if re.search(r'[^.!?]\.$', string) is not None:
+                dotless_captures = match0(string[:-1], True)
+                if dotless_captures is not None:
+                    return dotless_captures
+
+        pattern = '^' + ''.join(token_patterns[token]
+                                if isinstance(token, tok) else token
+                                for token in tokens) + '$'
+        res = re.search(pattern, string)
+        if not res:
+            return None
+        captures = {}
+        groups = list(res.groups())
+        for token in tokens:
+            if isinstance(token, tok):
+                capture = groups.pop(0)
+                if token not in captures:
+                    captures[token] = capture
+                elif isinstance(captures[token], str):
+                    captures[token] = [captures[token], capture]
+                else:
+                    captures[token].append(capture)
+        return captures
+
+    return match0(string, False)
+
+
+@pytest.mark.parametrize('content', _contents)
+def test_match(content):
+    # pylint: disable=protected-access
+    token_matcher = demuxfb._tokens._TokenMatcher()
+    for rule in demuxfb._rules._all_rules:
+        for sequence in rule.sequence_group.sequences:
+            assert token_matcher.match(sequence, content) == \
+                _legacy_match(sequence.tokens, content)
+
+
+@pytest.mark.parametrize('content', _contents)
+def test_match_any(content):
+    # pylint: disable=protected-access
+    token_matcher = demuxfb._tokens._TokenMatcher()
+    for rule in demuxfb._rules._all_rules:
+        group = rule.sequence_group
+        if not group.sequences:
+            continue
+
+        expected = (len(group.sequences), None)
+        for i, sequence in enumerate(group.sequences):
+            captures = token_matcher.match(sequence, content)
+            if captures is not None:
+                expected = (i, captures)
+                break
+
+        assert token_matcher.match_any(group, content) == expected
+
+
+def test_update_token_pattern():
+    # pylint: disable=protected-access
+    tokens = demuxfb._tokens
+    sequence = tokens._TokenSequence([tokens._Tok.SENDER_ALIAS,
+                                      ' scored ', tokens._Tok.NUMBER])
+    group = tokens._TokenSequenceGroup([sequence])
+
+    token_matcher = tokens._TokenMatcher()
+    assert token_matcher.match(sequence, 'Jo scored 5.') == {
+        tokens._Tok.SENDER_ALIAS: 'Jo', tokens._Tok.NUMBER: '5'}
+    token_matcher.update_token_pattern(tokens._Tok.SENDER_ALIAS, '(Al)')
+    assert token_matcher.match(sequence, 'Jo scored 5.') is None
+    assert token_matcher.match_any(group, 'Al scored 5.') == (0, {
+        tokens._Tok.SENDER_ALIAS: 'Al', tokens._Tok.NUMBER: '5'})
+
+    # Other matchers are unaffected.
+    assert tokens._TokenMatcher().match(sequence, 'Jo scored 5.') is not None
+
+
+@pytest.mark.parametrize('content', _contents)
+def test_rule_exclusions(content):
+    # pylint: disable=protected-access
+    token_matcher = demuxfb._tokens._TokenMatcher()
+    matching_rules = [
+        rule for rule in demuxfb._rules._all_rules
+        if any(token_matcher.match(sequence, content) is not None
+               for sequence in rule.sequence_group.sequences)]
+    for rule in matching_rules:
+        for other_rule in matching_rules:
+            assert not rule.excludes(other_rule)
+
+
+@pytest.mark.parametrize('fragment, literal', [
+    (r' started a call\.', ' started a call.'),
+    (r' waited \d{1,2} minutes for you', ' minutes for you'),
+    (r' waited \d{2} minutes for you', ' minutes for you'),
+    (r' waited \d{,2} minutes for you', ' minutes for you'),
+    (r' lost 10{3,}', ' lost 1'),
+    (r'a{b} and more', 'a{b} and more'),
+    (r' set (?:his|her) own nickname', ' own nickname'),
+    (r'Hello|Hi', '')
+])
+def test_required_literal(fragment, literal):
+    # pylint: disable=protected-access
+    tokens = demuxfb._tokens
+    sequence = tokens._TokenSequence([tokens._Tok.SENDER_ALIAS, fragment])
+    assert sequence.required_literal == literal
+
+
+def test_required_literal_quantifier_match():
+    # pylint: disable=protected-access
+    tokens = demuxfb._tokens
+    sequence = tokens._TokenSequence([tokens._Tok.SENDER_ALIAS,
+                                      r' waited \d{1,2} minutes\.'])
+    assert sequence.suffix == ' minutes.'
+    assert tokens._TokenMatcher().match(
+        sequence, 'Jo waited 12 minutes.') == {tokens._Tok.SENDER_ALIAS: 'Jo'}
+    assert tokens._TokenMatcher().match(
+        sequence, 'Jo waited 123 minutes.') is None
+
+
+def test_sequence_exclusions():
+    # pylint: disable=protected-access
+    tokens = demuxfb._tokens
+    call = tokens._TokenSequence([tokens._Tok.SENDER_ALIAS,
+                                  r' started a call\.'])
+    plan = tokens._TokenSequence([tokens._Tok.SENDER_ALIAS,
+                                  r' started a plan\.'])
+    ended = tokens._TokenSequence([r'The call ended\.'])
+    named = tokens._TokenSequence([tokens._Tok.SENDER_ALIAS, ' named the ',
+                                   tokens._Tok.ANYTHING])
+
+    assert call.excludes(plan) and plan.excludes(call)
+    assert call.excludes(ended)
+    assert not named.excludes(call)
+    assert not call.excludes(call)
+
+
+@pytest.mark.parametrize('content', _contents + [content + '\n'
+                                                 for content in _contents])
+def test_plain_messages(content):
+    # pylint: disable=protected-access
+    ruleset = demuxfb._rules._Ruleset(demuxfb._rules._all_rules)
+    if not ruleset._is_plain({'content': content}):
+        return
+    token_matcher = demuxfb._tokens._TokenMatcher()
+    for rule in demuxfb._rules._all_rules:
+        if rule.requires_sequence_match():
+            for sequence in rule.sequence_group.sequences:
+                assert token_matcher.match(sequence, content) is None
@@ -0,0 +1,55 @@
+"""Test the columnar view of built chats."""
+
+import sys
+
+import pytest
+
+from .helpers import SpoofChatFeed
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+
+numpy = pytest.importorskip('numpy')
+
+
+def test_columns():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello Milly')
+    chat_feed.push(sender_name='Milly', content='Hi',
+                   reactions=[{'reaction': 'x', 'actor': 'Jason'}])
+    chat_feed.push(sender_name='Jason',
+                   content='You set the nickname for Milly to M.')
+    chat_feed.push(sender_name='Milly', content='Héllo')
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    columns = demuxfb.build_columns(chat)
+
+    assert len(columns) == 4
+    assert list(columns.timestamps) == \
+        [message.timestamp for message in chat.messages]
+    assert [columns.message_types[code] for code in columns.type_codes] == \
+        [type(message) for message in chat.messages]
+    assert [columns.participants[i] for i in columns.senders] == \
+        [message.sender for message in chat.messages]
+    assert list(columns.reaction_counts) == [0, 1, 0, 0]
+    assert [columns.content(i) for i in range(len(columns))] == \
+        [message.content for message in chat.messages]
+
+    is_text = columns.type_mask(demuxfb.message.TextMessage)
+    assert list(is_text) == [True, True, False, True]
+    milly = columns.sender_index(chat.get_participant('Milly'))
+    assert numpy.count_nonzero(columns.senders[is_text] == milly) == 2
+
+
+def test_columns_without_content():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello')
+    chat_feed.push(sender_name='Jason',
+                   photos=[{'uri': 'a.png', 'creation_timestamp': 0}])
+    chat = demuxfb.build_chat(chat_feed, 'Jason')
+
+    columns = demuxfb.build_columns(chat)
+
+    assert list(columns.has_content) == [True, False]
+    assert columns.content(1) is None
+    assert columns.contents == 'Hello'
@@ -0,0 +1,80 @@
+"""Test the export of built chats to Parquet and Arrow files."""
+
+import sys
+
+import pytest
+
+from .helpers import SpoofChatFeed
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+from demuxfb import _export  # nopep8 pylint: disable=wrong-import-position
+
+
+def _build_chat() -> demuxfb.Chat:
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello Milly',
+                   reactions=[{'reaction': 'x', 'actor': 'Milly'}])
+    chat_feed.push(sender_name='Milly',
+                   photos=[{'uri': 'a.png', 'creation_timestamp': 1}])
+    chat_feed.push(sender_name='Jason',
+                   content='You set the nickname for Milly to M.')
+    return demuxfb.build_chat(chat_feed, 'Jason')
+
+
+def test_rows():
+    layout = _export._Layout()
+    columns = [name for name, _ in layout.columns]
+    assert columns[:5] == \
+        ['message_type', 'timestamp', 'sender', 'content', 'reactions']
+    assert len(set(columns)) == len(columns)
+
+    rows = [dict(zip(columns, row))
+            for row in layout.rows(_build_chat().messages)]
+
+    assert rows[0]['message_type'] == 'TextMessage'
+    assert rows[0]['content'] == 'Hello Milly'
+    assert rows[0]['reactions'] == [{'emoji': 'x', 'sender': 'Milly'}]
+    assert rows[0]['new_nickname'] is None
+    assert rows[1]['photos'] == [{'uri': 'a.png', 'creation_timestamp': 1000}]
+    assert rows[1]['content'] is None
+    assert rows[2]['message_type'] == 'NicknameChangeMessage'
+    assert rows[2]['timestamp'] == 2000
+    assert rows[2]['new_nickname'] == 'M'
+    assert rows[2]['setter'] == 'Jason'
+    assert rows[2]['subject'] == 'Milly'
+
+
+def test_rows_videos():
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(videos=[{'uri': 'a.mp4', 'creation_timestamp': 1,
+                            'thumbnail': {'uri': 'a.jpg'}},
+                           {'uri': 'b.mp4', 'creation_timestamp': 2}])
+    layout = _export._Layout()
+    columns = [name for name, _ in layout.columns]
+
+    rows = [dict(zip(columns, row)) for row in layout.rows(
+        demuxfb.build_chat(chat_feed, 'Jason').messages)]
+
+    assert rows[0]['videos'] == [
+        {'uri': 'a.mp4', 'thumbnail_uri': 'a.jpg', 'creation_timestamp': 1000},
+        {'uri': 'b.mp4', 'thumbnail_uri': None, 'creation_timestamp': 2000}]
+
+
+@pytest.mark.parametrize('export, read', [
+    ('export_parquet', 'parquet'),
+    ('export_arrow', 'feather')
+])
+def test_export(export, read, tmp_path):
+    pytest.importorskip('pyarrow')
+    reader = pytest.importorskip('pyarrow.' + read)
+    chat = _build_chat()
+    path = tmp_path / 'chat'
+
+    getattr(demuxfb, export)(chat, path, batch_size=2)
+
+    table = reader.read_table(str(path))
+    assert table.num_rows == 3
+    assert table.column('message_type').to_pylist() == \
+        ['TextMessage', 'MediaMessage', 'NicknameChangeMessage']
+    assert table.column('new_nickname').to_pylist() == [None, None, 'M']
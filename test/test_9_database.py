@@ -0,0 +1,100 @@
+"""Test the storage of classified messages in a SQLite database."""
+
+import sys
+
+from .helpers import SpoofChatFeed
+
+sys.path.append('src/')
+import demuxfb  # nopep8 pylint: disable=wrong-import-position
+
+
+def _make_chat_feed() -> SpoofChatFeed:
+    chat_feed = SpoofChatFeed()
+    chat_feed.push(sender_name='Jason', content='Hello Milly',
+                   reactions=[{'reaction': 'x', 'actor': 'Milly'}])
+    chat_feed.push(sender_name='Milly',
+                   photos=[{'uri': 'a.png', 'creation_timestamp': 1}],
+                   videos=[{'uri': 'b.mp4', 'creation_timestamp': 2}])
+    chat_feed.push(sender_name='Jason',
+                   content='You set the nickname for Milly to M.')
+    return chat_feed
+
+
+def test_build_chat(tmp_path):
+    with demuxfb.ChatDatabase(tmp_path / 'chats.db') as database:
+        database.build_chat(_make_chat_feed(), 'Jason', 'first', batch_size=2)
+        connection = database.connection
+
+        assert connection.execute(
+            'SELECT position, message_type, timestamp, sender, content '
+            'FROM messages ORDER BY position').fetchall() == [
+                (0, 'TextMessage', 0, 'Jason', 'Hello Milly'),
+                (1, 'MediaMessage', 1000, 'Milly', None),
+                (2, 'NicknameChangeMessage', 2000, 'Jason',
+                 'You set the nickname for Milly to M.')]
+        assert connection.execute(
+            'SELECT emoji, sender FROM reactions').fetchall() == \
+            [('x', 'Milly')]
+        assert connection.execute(
+            'SELECT kind, uri, thumbnail_uri, creation_timestamp FROM media '
+            'ORDER BY kind').fetchall() == [
+                ('photos', 'a.png', None, 1000),
+                ('videos', 'b.mp4', None, 2000)]
+        assert connection.execute(
+            'SELECT new_nickname, setter, subject FROM type_nickname_change '
+            'JOIN messages ON messages.id = message_id').fetchall() == \
+            [('M', 'Jason', 'Milly')]
+
+
+def test_build_chat_profile(tmp_path):
+    with demuxfb.ChatDatabase(tmp_path / 'chats.db') as database:
+        assert database.build_chat(_make_chat_feed(), 'Jason', 'first') \
+            is None
+        rule_profile = database.build_chat(_make_chat_feed(), 'Jason',
+                                           'second', profile=True)
+
+        rules = {rule.name: rule for rule in rule_profile.rules}
+        assert rules['_match_text_message'].hits == 1
+        assert rules['_match_nickname_change_message'].hits == 1
+        assert database.connection.execute(
+            'SELECT COUNT(*) FROM messages').fetchone() == (6,)
+
+def test_many_chats(tmp_path):
+    path = tmp_path / 'chats.db'
+    with demuxfb.ChatDatabase(path) as database:
+        database.build_chat(_make_chat_feed(), 'Jason', 'first')
+        chat = demuxfb.build_chat(_make_chat_feed(), 'Jason')
+        database.add_chat(chat, 'second')
+        # Adding a chat again replaces it.
+        database.add_chat(chat, 'second')
+
+    with demuxfb.ChatDatabase(path) as database:
+        connection = database.connection
+        assert connection.execute(
+            'SELECT name, COUNT(*) FROM chats JOIN messages '
+            'ON chats.id = chat_id GROUP BY name ORDER BY name').fetchall() \
+            == [('first', 3), ('second', 3)]
+        assert connection.execute(
+            'SELECT COUNT(*) FROM type_nickname_change').fetchone() == (2,)
+
+        database.delete_chat('first')
+        assert connection.execute(
+            'SELECT COUNT(*) FROM messages').fetchone() == (3,)
+        assert connection.execute(
+            'SELECT COUNT(*) FROM media').fetchone() == (2,)
+
+
+def test_type_table_names(tmp_path):
+    with demuxfb.ChatDatabase(tmp_path / 'chats.db') as database:
+        tables = {name for name, in database.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        type_tables = {type_table.name for type_table
+                       in database._type_tables.values()}
+
+    # Type tables (including MediaMessage's, which has no fields of its own
+    # to create it with) never take the names of the fixed tables.
+    assert type_tables.isdisjoint({'chats', 'messages', 'reactions', 'media'})
+    assert all(name.startswith('type_') for name in type_tables)
+    assert 'type_media' in type_tables
+    assert {'chats', 'messages', 'reactions', 'media',
+            'type_poll_add_vote'} <= tables